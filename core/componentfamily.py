@@ -0,0 +1,445 @@
+"""
+
+componentfamily.py: Contains the ComponentFamily class.
+
+A ComponentFamily stands in for many identical SystemComponent
+instances, ie. a fleet of 5000 virtual machines declared once as
+'vm[0-4999]'.  Member ids and targets are range patterns which are
+expanded on demand, only when a member's event is activated.  The event
+definitions are shared by all members.  The per-member state (component
+state, time of the last event, executed flags and random model windows)
+is held in compact arrays instead of one object per member.
+
+Each member behaves exactly as a SystemComponent with the same targets
+and events would.  All members are initialized together, so they share
+one life start time and one EventWindowIndex per state.  A daemon event
+runs one daemon per member in the event's state.
+
+"""
+
+from array import array
+from time import time
+
+from event import Event
+from event import RATE_MODELS
+from eventwindow import EventWindowIndex
+from eventwindow import is_in_effect
+from rangepattern import RangePattern
+from sessionconfig import SessionConfig
+from snapshot import decode_array
+from snapshot import decode_bytes
+from snapshot import encode_array
+from snapshot import get_event_faults
+from snapshot import match_events
+from targetselector import TargetSelector
+
+
+class ComponentFamily(object):
+
+    # Members have the same possible states as a SystemComponent.
+    OPERABLE = True
+    NONOPERABLE = False
+
+    __slots__ = ('_id', '_id_pattern', '_target_patterns', '_targets',
+                 '_count', '_states', '_events', '_life_start_time',
+                 '_last_event_time', '_windows', '_daemons', '_paused')
+
+    def __init__(self, family_id, targets, config, weights = None):
+        """ Create ComponentFamily object.
+            family_id: id pattern of the family (ie. 'vm[0-4999]')
+            targets: a list of target patterns; member i is subject to
+                   the i-th value of each pattern (patterns without a
+                   range are shared by all members)
+            config: a SessionConfig instance
+            weights: optional list of selection weights, one per target"""
+        self._id = family_id
+        self._id_pattern = RangePattern(family_id)
+        self._target_patterns = [RangePattern(t) for t in targets]
+        self._count = self._id_pattern.get_count()
+        # Events select indexes into the target patterns; the selector
+        # (and its alias table) is shared by all events and members.
+        self._targets = TargetSelector(range(len(targets)), weights)
+        # One byte per member: 1 if Operable.
+        self._states = bytearray([1]) * self._count
+        self._events = {self.OPERABLE:[], self.NONOPERABLE:[]}
+        self._life_start_time = time()
+        self._last_event_time = (array('d', [self._life_start_time]) *
+                                 self._count)
+
+        for operable in (self.OPERABLE, self.NONOPERABLE):
+            for e in config.get_events_for_component(self._id, operable):
+                for _ in range(e[1]):
+                    # Append # of events corresponding to 'instance' parameter
+                    self._events[operable].append(
+                        FamilyEvent(self, e[0], config)
+                    )
+
+        # Index of the events in effect for each state.  Daemon and
+        # triggered events are not evaluated at checkpoints.
+        self._windows = {}
+        for state, events in self._events.items():
+            self._windows[state] = EventWindowIndex(
+                [e for e in events if e.is_evaluated()])
+
+        # Index of the daemon events in effect for each state; None if the
+        # family has none.
+        self._daemons = None
+        if any(e.is_daemon_event() for events in self._events.values()
+               for e in events):
+            self._daemons = {}
+            for state, events in self._events.items():
+                self._daemons[state] = EventWindowIndex(
+                    [e for e in events if e.is_daemon_event()])
+        self._paused = False # no events are activated while paused
+
+
+    def get_id(self):
+        """ returns: id pattern of the family"""
+        return self._id
+
+
+    def get_family_id(self):
+        """ returns: id pattern of the family"""
+        return self._id
+
+
+    def set_paused(self, paused):
+        """ paused: true to stop activating the events of every member;
+                false to resume"""
+        self._paused = paused
+
+
+    def has_daemon_events(self):
+        """ returns: true if the family has daemon events"""
+        return self._daemons is not None
+
+
+    def get_daemon_events(self):
+        """ returns: list of tuples (key, MemberEvent instance) of the
+                daemon events which should run: for each member, those of
+                the member's state which are in effect, unless the family
+                is paused.  The key is unique to the event of the member."""
+        if self._daemons is None or self._paused: return []
+        elapsed_life = time() - self._life_start_time
+        in_window = {
+            self.OPERABLE:
+                self._daemons[self.OPERABLE].in_window(elapsed_life),
+            self.NONOPERABLE:
+                self._daemons[self.NONOPERABLE].in_window(elapsed_life)
+        }
+        states = self._states
+        return [((m, e), MemberEvent(e, self, m))
+                for m in xrange(self._count)
+                for e in in_window[states[m] == 1]]
+
+
+    def get_triggered_events(self):
+        """ returns: list of tuples (FamilyEvent instance, state) of the
+                family's triggered events"""
+        return [(e, state) for state, events in self._events.items()
+                for e in events if e.get_trigger() is not None]
+
+
+    def is_trigger_source(self, event_id):
+        """ event_id: id of an event
+            returns: true if the family has an event with the id which
+                may trigger other events (ie. not a daemon event)"""
+        return any(e.get_event_id() == event_id and not e.is_daemon_event()
+                   for events in self._events.values() for e in events)
+
+
+    def fire(self, event, state, member):
+        """ Activates a triggered event for the members which are in the
+                event's state, if the event is in effect and the family
+                is not paused.
+            event: a triggered FamilyEvent instance of the family
+            state: state of the event (OPERABLE or NONOPERABLE)
+            member: index of the member; None for every member (ie. the
+                source event is not the family's)
+            returns: list of MemberEvent instances which are active"""
+        if self._paused: return []
+        if not is_in_effect(event, time() - self._life_start_time):
+            return []
+        states = self._states
+        value = 1 if state else 0
+        members = ([member] if member is not None
+                   else xrange(self._count))
+        active_events = []
+        for m in members:
+            if states[m] != value: continue
+            self._last_event_time[m] = time()
+            # Transition the member state if necessary.
+            if event.is_state_transition_event(): states[m] = 1 - value
+            active_events.append(MemberEvent(event, self, m))
+        return active_events
+
+
+    def describe(self):
+        """ returns: dictionary describing the family's state"""
+        operable = self._states.count('\x01')
+        return {
+            'id': self._id,
+            'family': True,
+            'members': self._count,
+            'operable': operable,
+            'nonoperable': self._count - operable,
+            'paused': self._paused,
+            'targets': len(self._target_patterns)
+        }
+
+
+    def get_member_count(self):
+        """ returns: number of members in the family"""
+        return self._count
+
+
+    def get_member_id(self, member):
+        """ member: index of a member
+            returns: component id of the member"""
+        return self._id_pattern.expand(member)
+
+
+    def get_member_target(self, member, target):
+        """ member: index of a member
+            target: index of one of the family's target patterns
+            returns: the member's target"""
+        return self._target_patterns[target].expand(member)
+
+
+    def get_targets(self):
+        """ returns: list of the targets of every member; a pattern
+                without a range is a single target shared by all
+                members"""
+        targets = []
+        for p in self._target_patterns:
+            if p.get_count() is None:
+                targets.append(p.expand(0))
+            else:
+                targets.extend(p.expand(m) for m in xrange(self._count))
+        return targets
+
+
+    def get_target_selector(self):
+        """ returns: TargetSelector over target pattern indexes"""
+        return self._targets
+
+
+    def get_state(self):
+        """ returns: dictionary of the family's runtime state (see
+                snapshot.py)"""
+        return {
+            'id': self._id,
+            'events': get_event_faults(self._events),
+            'states': encode_array(self._states),
+            'life_start_time': self._life_start_time,
+            'last_event_time': encode_array(self._last_event_time),
+            'paused': self._paused,
+            'event_states': [[e.get_state() for e in self._events[s]]
+                             for s in (self.OPERABLE, self.NONOPERABLE)]
+        }
+
+
+    def set_state(self, state, offset):
+        """ Restores the runtime state saved by get_state().  A
+                ValueError exception will be thrown if the family's
+                members or events differ from the saved ones.
+            state: dictionary returned by get_state()
+            offset: seconds added to the saved times"""
+        match_events(self._id, state, get_event_faults(self._events))
+        states = decode_bytes(state['states'])
+        last_event_time = decode_array('d', state['last_event_time'])
+        if len(states) != self._count or len(last_event_time) != self._count:
+            raise ValueError("snapshot does not match component '%s'"
+                             % self._id)
+        self._states = states
+        self._life_start_time = state['life_start_time'] + offset
+        self._last_event_time = array(
+            'd', (t + offset for t in last_event_time))
+        self._paused = state['paused']
+        for s, saved in zip((self.OPERABLE, self.NONOPERABLE),
+                            state['event_states']):
+            for e, event_state in zip(self._events[s], saved):
+                e.set_state(event_state, offset)
+
+
+    def checkpoint(self):
+        """ Determines whether any events associated with each member's
+                state need to be activated.
+            returns: list of MemberEvent instances which are active"""
+        if self._paused: return []
+
+        elapsed_life = time() - self._life_start_time
+        in_window = {
+            self.OPERABLE:
+                self._windows[self.OPERABLE].in_window(elapsed_life),
+            self.NONOPERABLE:
+                self._windows[self.NONOPERABLE].in_window(elapsed_life)
+        }
+        states = self._states
+        last_event_time = self._last_event_time
+        active_events = []
+
+        for m in xrange(self._count):
+            state = states[m] == 1
+            # Build list of activated events from the events in effect.
+            active = [e for e in in_window[state]
+                      if e.is_member_active(m, last_event_time[m])]
+
+            for e in active:
+                e.set_member_executed(m)
+                last_event_time[m] = time()
+                # Transition the member state if necessary.
+                if e.is_state_transition_event():
+                    state = not state
+                    states[m] = 1 if state else 0
+                active_events.append(
+                    MemberEvent(e, self, m, e.get_activation_count()))
+
+        return active_events
+
+
+class FamilyEvent(Event):
+    """ An Event shared by all members of a ComponentFamily.  The event's
+        per-member state is kept in arrays and swapped into the Event
+        fields while the member is evaluated."""
+
+    __slots__ = ('_members_executed', '_members_random',
+                 '_members_countdown')
+
+    def __init__(self, family, event_id, config):
+        """ Create FamilyEvent object.
+            family: the ComponentFamily instance
+            event_id: the event id unique to the family
+            config: reference to a SessionConfig object"""
+        Event.__init__(self, family.get_family_id(),
+                       family.get_target_selector(), event_id, config)
+        count = family.get_member_count()
+
+        # Only allocate the state used by the event's models.
+        self._members_executed = (bytearray(count)
+                                  if self.is_singular_event() else None)
+        self._members_random = None
+        if self._prob_model == SessionConfig.EVENT_PMOD_RANDOM:
+            self._members_random = (
+                array('d', [0.0]) * count, # _random_time
+                array('d', [self._window_end]) * count, # _window_end
+                bytearray(count) # _random_time_set
+            )
+        self._members_countdown = None
+        if self._tick > 1 and self._prob_model in RATE_MODELS:
+            self._members_countdown = array('l', [self._tick]) * count
+
+
+    def is_member_active(self, member, last_event_time):
+        """ Determines if this event is now activated for a member.
+            member: index of the member
+            last_event_time: time when the member's previous event
+                occurred or the family initialization time.
+            returns: return true if the event is activated; false if not"""
+        if self._members_executed is not None:
+            self._executed = self._members_executed[member] == 1
+
+        c = self._members_countdown
+        if c is not None:
+            self._countdown = c[member]
+            active = self.is_active(last_event_time)
+            c[member] = self._countdown
+            return active
+
+        r = self._members_random
+        if r is None:
+            return self.is_active(last_event_time)
+
+        self._random_time = r[0][member]
+        self._window_end = r[1][member]
+        self._random_time_set = r[2][member] == 1
+        active = self.is_active(last_event_time)
+        r[0][member] = self._random_time
+        r[1][member] = self._window_end
+        r[2][member] = 1 if self._random_time_set else 0
+        return active
+
+
+    def get_state(self):
+        """ returns: dictionary of the per-member state of the event's
+                models"""
+        state = {'countdown': None, 'executed': None, 'random': None}
+        if self._members_countdown is not None:
+            state['countdown'] = encode_array(self._members_countdown)
+        if self._members_executed is not None:
+            state['executed'] = encode_array(self._members_executed)
+        if self._members_random is not None:
+            state['random'] = [encode_array(a) for a in self._members_random]
+        return state
+
+
+    def set_state(self, state, offset):
+        """ Restores the per-member state saved by get_state().
+            state: dictionary returned by get_state()
+            offset: seconds added to the saved times"""
+        if self._members_countdown is not None:
+            self._members_countdown = decode_array('l', state['countdown'])
+        if self._members_executed is not None:
+            self._members_executed = decode_bytes(state['executed'])
+        if self._members_random is not None:
+            random_time, window_end, random_time_set = state['random']
+            self._members_random = (
+                array('d', (t + offset for t in
+                            decode_array('d', random_time))),
+                array('d', (t + offset for t in
+                            decode_array('d', window_end))),
+                decode_bytes(random_time_set)
+            )
+
+
+    def set_member_executed(self, member):
+        """ marks the event as having been executed for a member"""
+        if self._members_executed is not None:
+            self._members_executed[member] = 1
+
+
+class MemberEvent(object):
+    """ The activation of a FamilyEvent for one member.  It provides the
+        Event interface used by the Scheduler, with the member's
+        component id and targets."""
+
+    __slots__ = ('_event', '_family', '_member', '_activations')
+
+    def __init__(self, event, family, member, activations = 1):
+        self._event = event
+        self._family = family
+        self._member = member
+        # The FamilyEvent's count is overwritten by the next member.
+        self._activations = activations
+
+
+    def __getattr__(self, name):
+        # Everything else is shared by all members.
+        return getattr(self._event, name)
+
+
+    def get_member(self):
+        """ returns: index of the member"""
+        return self._member
+
+
+    def get_activation_count(self):
+        """ returns: number of activations of the event for the member"""
+        return self._activations
+
+
+    def get_component_id(self):
+        """ returns: component id of the member"""
+        return self._family.get_member_id(self._member)
+
+
+    def select_component_target(self):
+        """ returns: target which will be activated"""
+        return self._family.get_member_target(
+            self._member, self._event.select_component_target())
+
+
+    def select_component_targets(self):
+        """ returns: list of targets which will be activated"""
+        return [self._family.get_member_target(self._member, t)
+                for t in self._event.select_component_targets()]
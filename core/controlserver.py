@@ -0,0 +1,247 @@
+"""
+
+controlserver.py: Contains the ControlServer class.
+
+A ControlServer listens on a Unix domain socket so that a running
+session can be inspected and driven without signals or a restart.
+Each request is a single line of text: a command followed by its
+arguments, separated by whitespace; the last argument is the rest of
+the line (ie. a JSON dictionary).  Each response is a single line of
+JSON: {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+Several requests may be sent on one connection.
+
+A SUT is referred to by its system name or by its index in the 'list'
+response.
+
+Commands:
+    list
+        SUTs with their fault module, pause state and checkpoint counts
+    components SUT
+        components with their state and the events which may next be
+        activated
+    pause SUT [COMPONENT]
+    resume SUT [COMPONENT]
+        pause or resume a Scheduler, or a single component
+    inject SUT FAULT TARGET [FIELDS]
+        run a fault function now in a worker thread, bypassing the
+        models; FIELDS is an optional JSON dictionary of the user
+        defined fields for the fault, ie.
+        {"udf1": "-KILL", "udd": {"user": "dtest"}}.  The reply is sent
+        at once, with an id to pass to 'injection'
+    injection SUT ID
+        state of an injection, with its outcome once it has finished
+    metrics [SUT]
+        fault outcome statistics, checkpoint counts, the target and
+        effective rates of the intensity profiles and the running daemons
+    member SUT CHANGE
+        add, remove or mark inactive a component; CHANGE is a JSON
+        membership change (see membership.py), ie.
+        {"op": "remove", "id": "vm7"}
+    help
+        this text
+
+"""
+
+import inspect
+import json
+import logging
+import os
+import SocketServer
+import threading
+
+from membership import submit_change
+from scheduler import find_scheduler
+
+# User defined fields which may be passed to an injected fault.
+INJECT_FIELDS = ('udf1', 'udf2', 'udf3', 'udd')
+
+# Seconds to wait for a membership change to be applied.
+MEMBERSHIP_TIMEOUT = 5
+
+
+class ControlServer(threading.Thread):
+
+    def __init__(self, path, schedulers):
+        """ Create ControlServer object.
+            path: file system path of the Unix domain socket
+            schedulers: list of Scheduler instances"""
+        threading.Thread.__init__(self, name = "control")
+        self.daemon = True
+        self._path = path
+        self._schedulers = schedulers
+
+        # Remove a stale socket left by a previous session.
+        if os.path.exists(self._path): os.remove(self._path)
+
+        self._server = _UnixServer(self._path, _ControlHandler)
+        self._server.control = self
+
+
+    def run(self):
+        """ Entry point for threading.Thread (control server thread)"""
+        logging.info("Control socket listening on %s" % self._path)
+        self._server.serve_forever()
+
+
+    def close(self):
+        """ Stops serving requests and removes the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        if os.path.exists(self._path): os.remove(self._path)
+
+
+    def dispatch(self, line):
+        """ line: request text
+            returns: response dictionary"""
+        words = line.split(None, 1)
+        if not words:
+            return {'ok': False, 'error': "empty request"}
+
+        command = getattr(self, 'cmd_' + words[0].lower(), None)
+        if command is None:
+            return {'ok': False, 'error': "unknown command '%s'" % words[0]}
+
+        params, _, _, defaults = inspect.getargspec(command)
+        maximum = len(params) - 1 # excluding self
+        args = (words[1].split(None, max(maximum - 1, 0))
+                if len(words) > 1 else [])
+        if not maximum - len(defaults or ()) <= len(args) <= maximum:
+            return {'ok': False, 'error': "invalid arguments for '%s'"
+                                          % words[0]}
+
+        try:
+            return {'ok': True, 'result': command(*args)}
+        except (AttributeError, KeyError, ValueError) as err:
+            return {'ok': False, 'error': str(err.args[0] if err.args
+                                              else err)}
+
+
+    def cmd_help(self):
+        return __doc__[__doc__.index('Commands:'):].strip()
+
+
+    def cmd_list(self):
+        suts = []
+        for i, s in enumerate(self._schedulers):
+            ticks, duration = s.get_tick_stats()
+            suts.append({
+                'index': i,
+                'name': s.get_sut().get_system_name(),
+                'fault_module': s.get_sut().get_fault_module_name(),
+                'paused': s.is_paused(),
+                'components': len(s.get_sut().get_components()),
+                'checkpoints': ticks,
+                'checkpoint_duration': duration
+            })
+        return suts
+
+
+    def cmd_components(self, sut):
+        return [c.describe()
+                for c in self._get_scheduler(sut).get_sut().get_components()]
+
+
+    def cmd_pause(self, sut, component_id = None):
+        return self._set_paused(sut, component_id, True)
+
+
+    def cmd_resume(self, sut, component_id = None):
+        return self._set_paused(sut, component_id, False)
+
+
+    def cmd_inject(self, sut, fault, target, fields = None):
+        fields = json.loads(fields) if fields is not None else {}
+        if not isinstance(fields, dict):
+            raise ValueError("FIELDS must be a JSON dictionary")
+        for name in fields:
+            if name not in INJECT_FIELDS:
+                raise ValueError("unknown field '%s'" % name)
+        if not isinstance(fields.get('udd', {}), dict):
+            raise ValueError("'udd' must be a JSON dictionary")
+        scheduler = self._get_scheduler(sut)
+        try:
+            scheduler.get_function(fault)
+        except AttributeError:
+            raise KeyError("unknown fault '%s'" % fault)
+        return {'sut': scheduler.get_sut().get_system_name(),
+                'id': scheduler.inject(fault, target, **fields),
+                'fault': fault, 'target': target}
+
+
+    def cmd_injection(self, sut, injection_id):
+        scheduler = self._get_scheduler(sut)
+        if not injection_id.isdigit():
+            raise ValueError("invalid injection id '%s'" % injection_id)
+        done, outcome = scheduler.get_injection(int(injection_id))
+        return {'sut': scheduler.get_sut().get_system_name(),
+                'id': int(injection_id), 'done': done,
+                'outcome': outcome._asdict() if outcome is not None
+                           else None}
+
+
+    def cmd_metrics(self, sut = None):
+        schedulers = (self._schedulers if sut is None
+                      else [self._get_scheduler(sut)])
+        metrics = []
+        for s in schedulers:
+            ticks, duration = s.get_tick_stats()
+            metrics.append({
+                'name': s.get_sut().get_system_name(),
+                'checkpoints': ticks,
+                'checkpoint_duration': duration,
+                'faults': s.get_fault_stats().snapshot(),
+                'intensity': [p.snapshot() for p in
+                              s.get_sut().get_intensity_profiles()],
+                'daemons': s.get_daemon_supervisor().snapshot()
+            })
+        return metrics
+
+
+    def cmd_member(self, sut, change):
+        scheduler = self._get_scheduler(sut)
+        change = submit_change(self._schedulers, change, 'member', sut)
+        if change.wait(MEMBERSHIP_TIMEOUT) and change.get_error():
+            raise ValueError(change.get_error())
+        return dict(change.describe(),
+                    sut = scheduler.get_sut().get_system_name())
+
+
+    def _get_scheduler(self, sut):
+        """ sut: system name or index of a SUT
+            returns: the SUT's Scheduler"""
+        return find_scheduler(self._schedulers, sut)
+
+
+    def _set_paused(self, sut, component_id, paused):
+        """ Pauses or resumes a Scheduler or one of its components.
+            returns: description of what was paused or resumed"""
+        scheduler = self._get_scheduler(sut)
+        if component_id is None:
+            if paused:
+                scheduler.pause()
+            else:
+                scheduler.resume()
+            return {'sut': scheduler.get_sut().get_system_name(),
+                    'paused': paused}
+
+        c = scheduler.get_sut().get_component(component_id)
+        if c is None:
+            raise KeyError("unknown component '%s'" % component_id)
+        c.set_paused(paused)
+        return {'sut': scheduler.get_sut().get_system_name(),
+                'component': component_id, 'paused': paused}
+
+
+class _UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+
+class _ControlHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if not line.strip(): continue
+            response = self.server.control.dispatch(line.strip())
+            self.wfile.write(json.dumps(response, default = str) + '\n')
+            self.wfile.flush()
@@ -0,0 +1,221 @@
+"""
+
+daemon.py: Contains the DaemonSupervisor class.
+
+Events with the 'daemon' activation model run long-lived fault functions
+(ie. a consumer of monitoring traffic or a continuous network
+degradation) rather than short calls.  A daemon event is not evaluated
+by a probability model: it runs while its component is in the event's
+state (and the event is in effect), and it is stopped when the component
+leaves that state or is paused, or when the Scheduler is paused or
+stopped.  Targets are selected when the daemon starts, and each target
+gets one thread which lives as long as the daemon.
+
+The fault function of a daemon is called with a 'stop_event' argument,
+a threading.Event which is set when the daemon must stop; the function
+should return promptly once it is set.  A function which returns or
+raises while its daemon should still run is restarted after a delay
+which doubles with each consecutive restart, up to RESTART_DELAY_MAX; a
+run of at least RESTART_RESET seconds resets the delay.
+
+"""
+
+import logging
+import threading
+import time
+
+# Delay (seconds) before the first restart of a daemon.
+RESTART_DELAY = 1
+
+# Maximum delay (seconds) between restarts of a daemon.
+RESTART_DELAY_MAX = 60
+
+# Run time (seconds) after which the restart delay is reset.
+RESTART_RESET = 60
+
+
+class DaemonSupervisor(object):
+
+    def __init__(self, run_daemon, dryrun = False):
+        """ Create DaemonSupervisor object.
+            run_daemon: callable (func, event, target, stop_event) which
+                runs a fault function until it returns and returns an
+                Outcome instance
+            dryrun: if True, daemons are logged but not run"""
+        self._run_daemon = run_daemon
+        self._dryrun = dryrun
+        self._daemons = {} # daemon key -> list of Daemon instances
+        self._stopping = [] # stopped Daemon instances not yet finished
+        self._lock = threading.Lock()
+
+
+    def reconcile(self, wanted):
+        """ Starts the daemons which should run and are not running, and
+                stops the running daemons which should not.
+            wanted: dictionary mapping a key unique to a daemon event of
+                a component to a tuple (func, event) of the fault
+                function and the Event instance"""
+        with self._lock:
+            for key in [k for k in self._daemons if k not in wanted]:
+                for d in self._daemons.pop(key):
+                    self._stop(d)
+            for key, (func, event) in wanted.iteritems():
+                if key not in self._daemons:
+                    self._daemons[key] = [
+                        self._start(func, event, t)
+                        for t in event.select_component_targets()]
+            self._stopping = [d for d in self._stopping if d.is_alive()]
+
+
+    def stop_all(self, timeout = None):
+        """ Stops every daemon and waits for their threads.
+            timeout: maximum seconds to wait; None to wait until all
+                daemons have stopped"""
+        with self._lock:
+            for daemons in self._daemons.values():
+                for d in daemons: self._stop(d)
+            self._daemons.clear()
+            stopping, self._stopping = self._stopping, []
+
+        deadline = time.time() + timeout if timeout is not None else None
+        for d in stopping:
+            d.join(max(deadline - time.time(), 0)
+                   if deadline is not None else None)
+            if d.is_alive():
+                logging.info("error: daemon %s (target:%s) did not stop"
+                             % (d.get_name(), d.get_target()))
+
+
+    def is_running(self):
+        """ returns: true if any daemon is running"""
+        return bool(self._daemons)
+
+
+    def snapshot(self):
+        """ returns: list of dictionaries, one per running daemon, with
+                its run time and number of restarts"""
+        with self._lock:
+            daemons = [d for ds in self._daemons.values() for d in ds]
+        return sorted((d.describe() for d in daemons),
+                      key = lambda d: (d['component_id'], d['fault'],
+                                       d['target']))
+
+
+    def report(self):
+        """ returns: list of printable lines describing the running
+                daemons"""
+        return ["%s (target:%s, id:%s) running:%s restarts:%d last:%s" % (
+                    d['fault'], d['target'], d['component_id'],
+                    '%.0fs' % d['running'] if d['running'] is not None
+                        else 'no', d['restarts'], d['last'])
+                for d in self.snapshot()]
+
+
+    def _start(self, func, event, target):
+        d = Daemon(func, event, target, self._run_daemon)
+        if self._dryrun:
+            logging.info("Dry run: daemon %s (target:%s) started"
+                         % (func.__name__, target))
+        else:
+            logging.info("Starting daemon %s (target:%s, id:%s)"
+                         % (func.__name__, target, event.get_component_id()))
+            d.start()
+        return d
+
+
+    def _stop(self, d):
+        if self._dryrun:
+            logging.info("Dry run: daemon %s (target:%s) stopped"
+                         % (d.get_name(), d.get_target()))
+            return
+        logging.info("Stopping daemon %s (target:%s, id:%s)"
+                     % (d.get_name(), d.get_target(), d.get_component_id()))
+        d.stop()
+        self._stopping.append(d)
+
+
+class Daemon(object):
+    """ A fault function run against one target by a supervising thread
+        which restarts it until the daemon is stopped."""
+
+    def __init__(self, func, event, target, run_daemon):
+        """ func: a callable function object from a fault injector module
+            event: the daemon's Event instance
+            target: target of the fault
+            run_daemon: see DaemonSupervisor"""
+        self._func = func
+        self._event = event
+        self._target = target
+        self._run_daemon = run_daemon
+        self._stop_event = threading.Event()
+        self._started = None # start time of the current run
+        self._restarts = 0
+        self._last = None # summary of the latest completed run
+        self._thread = threading.Thread(name = "daemon-%s" % func.__name__,
+                                        target = self._supervise)
+        # A fault function which ignores stop_event cannot hold up exit.
+        self._thread.daemon = True
+
+
+    def start(self):
+        self._thread.start()
+
+
+    def stop(self):
+        """ Asks the fault function to return; it is not restarted."""
+        self._stop_event.set()
+
+
+    def join(self, timeout = None):
+        self._thread.join(timeout)
+
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+
+    def get_name(self):
+        """ returns: name of the fault function"""
+        return self._func.__name__
+
+
+    def get_target(self):
+        return self._target
+
+
+    def get_component_id(self):
+        return self._event.get_component_id()
+
+
+    def describe(self):
+        """ returns: dictionary describing the daemon"""
+        started = self._started
+        return {
+            'fault': self._func.__name__,
+            'target': self._target,
+            'component_id': self._event.get_component_id(),
+            'running': time.time() - started if started is not None else None,
+            'restarts': self._restarts,
+            'last': self._last
+        }
+
+
+    def _supervise(self):
+        """ Entry point for the daemon's thread."""
+        delay = RESTART_DELAY
+        while not self._stop_event.isSet():
+            self._started = time.time()
+            outcome = self._run_daemon(self._func, self._event, self._target,
+                                       self._stop_event)
+            self._started = None
+            self._last = outcome.summary
+            if self._stop_event.isSet(): break
+
+            if outcome.duration >= RESTART_RESET: delay = RESTART_DELAY
+            self._restarts += 1
+            logging.info("Daemon %s (target:%s) %s after %.1fs; restarting "
+                         "in %ds" % (self._func.__name__, self._target,
+                                     'returned' if outcome.success
+                                     else 'failed', outcome.duration, delay))
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
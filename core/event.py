@@ -11,25 +11,45 @@ be configured for the Operable state.
 
 """
 
-from random import choice
 from random import randint
+from random import random
 from time import time
 
-from stochastic import exponential_hazard
-from stochastic import normal_hazard
-from stochastic import weibull_hazard
+from stochastic import exponential_probability
+from stochastic import normal_probability
+from stochastic import poisson_count
+from stochastic import weibull_probability
 from sessionconfig import SessionConfig
 
-class Event():
+# Probability models evaluated through a hazard function.
+HAZARD_MODELS = (SessionConfig.EVENT_PMOD_EXP, SessionConfig.EVENT_PMOD_NORM,
+                  SessionConfig.EVENT_PMOD_WEI)
+
+# Probability models with a rate, evaluated every tick and scaled by
+# intensity profiles.
+RATE_MODELS = HAZARD_MODELS + (SessionConfig.EVENT_PMOD_POISSON,)
+
+class Event(object):
+
+    # Events are numerous in large sessions; slots keep them compact.
+    __slots__ = ('_id', '_component_id', '_targets', '_executed',
+                 '_random_time', '_window_end', '_random_time_set',
+                 '_fault', '_state_trans', '_act_model', '_prob_model',
+                 '_mttf', '_threshold', '_effective_start', '_effective_end',
+                 '_standard_deviation', '_shape', '_random_range',
+                 '_random_w_type', '_udf1', '_udf2', '_udf3', '_udd',
+                 '_coalesce', '_fan_out', '_tick', '_countdown',
+                 '_intensity', '_rate', '_activations', '_trigger')
 
     def __init__(self, component_id, targets, event_id, config):
         """ Create Event object.
             component_id: id of the component which this Event instance
                           will be associated with
-            targets: a list of component identifiers which may be subject 
-                   to faults.  Frequently, this will be a single entity, 
-                   but it could be a list of identifiers such that one 
-                   is randomly selected during event activation
+            targets: TargetSelector for the component identifiers which
+                   may be subject to faults.  Frequently, this will be a
+                   single entity, but it could be a list of identifiers
+                   such that one (or several, see fan_out) is randomly
+                   selected during event activation
             event_id: the event id unique to the component
             config: reference to a SessionConfig object"""
         self._id = event_id
@@ -42,8 +62,8 @@ class Event():
         self._window_end = time() # time when next _random_time is computed 
         self._random_time_set = False # toggle to trigger new computation
 
-        # event_config is a NamedTuple defined in 
-        # SessionConfig.get_model_for_event().
+        # event_config is a ModelType NamedTuple defined in 
+        # sessionconfig.py.
         event_config = config.get_model_for_event(self._component_id, self._id)
         self._fault = event_config.fault
         self._state_trans = event_config.state_trans
@@ -63,6 +83,31 @@ class Event():
         self._udf2 = event_config.udf2
         self._udf3 = event_config.udf3
         self._udd = event_config.udd
+        # Policy applied by the Scheduler when the fault is still running
+        # against the selected target.
+        self._coalesce = event_config.coalesce
+        # Number of targets hit by each activation.
+        self._fan_out = event_config.fan_out
+        # Hazard models are evaluated every _tick seconds (checkpoints);
+        # _countdown is the number of checkpoints until the next one.
+        self._tick = event_config.tick
+        self._countdown = self._tick
+        # IntensityProfile scaling the hazard rate; None if not scaled.
+        self._intensity = (event_config.intensity
+                           if event_config.intensity is not None
+                           else config.get_intensity())
+        # The poisson model may activate the event several times at a
+        # checkpoint; _activations is the number of the latest one.
+        self._rate = event_config.rate
+        self._activations = 1
+        # (source component id, source event id, delay) of a triggered
+        # event; None for other events.
+        self._trigger = event_config.trigger
+
+
+    def get_event_id(self):
+        """ returns: event id unique to the component"""
+        return self._id
 
 
     def get_component_id(self):
@@ -70,9 +115,32 @@ class Event():
         return self._component_id
 
 
+    def get_source_id(self):
+        """ returns: tuple (component id, event id) naming the event as
+                the source of triggered events; the component id of a
+                family's event is the family's id pattern"""
+        return (self._component_id, self._id)
+
+
+    def get_member(self):
+        """ returns: index of the family member which activated the
+                event; None for the events of a SystemComponent"""
+        return None
+
+
     def select_component_target(self):
         """ returns: target which will be activated"""
-        return choice(self._targets)
+        return self._targets.select()
+
+
+    def select_component_targets(self):
+        """ returns: list of targets which will be activated; a single
+                target unless the event fans out to several targets"""
+        if self._fan_out == 1:
+            return [self._targets.select()]
+        if self._fan_out == SessionConfig.EVENT_FAN_ALL:
+            return list(self._targets.get_targets())
+        return self._targets.select_many(self._fan_out)
 
 
     def get_fault(self):
@@ -85,6 +153,11 @@ class Event():
         return self._act_model
 
 
+    def get_probability_model(self):
+        """ returns: probability model of event"""
+        return self._prob_model
+
+
     def get_user_def_field_1(self):
         """ returns: user defined type 1"""
         return self._udf1
@@ -105,6 +178,11 @@ class Event():
         return self._udd
 
 
+    def get_coalesce_policy(self):
+        """ returns: coalescing policy for overlapping activations"""
+        return self._coalesce
+
+
     def set_executed(self):
         """ marks the event as having been executed"""
         self._executed = True
@@ -123,10 +201,120 @@ class Event():
         return (self._act_model == SessionConfig.EVENT_AMOD_SINGLE)
 
 
-    def is_active(self, alive_time, last_event_time):
+    def is_evaluated(self):
+        """ returns: true if this event is evaluated at checkpoints (ie.
+                recurring and singular activation models); false for
+                daemon and triggered events"""
+        return (self._act_model == SessionConfig.EVENT_AMOD_RECUR or
+                self._act_model == SessionConfig.EVENT_AMOD_SINGLE)
+
+
+    def get_trigger(self):
+        """ returns: tuple (source component id, source event id, delay
+                in seconds) of a triggered event; None if the event is
+                not triggered"""
+        return self._trigger
+
+
+    def is_daemon_event(self):
+        """ returns: true if this event runs a daemon while the component
+                is in the event's state (ie. daemon activation model);
+                false if otherwise"""
+        return (self._act_model == SessionConfig.EVENT_AMOD_DAEMON)
+
+
+    def get_effective_window(self):
+        """ returns: tuple (effective start, effective end) in seconds
+                relative to the component initialization time; -1 if
+                not set"""
+        return (self._effective_start, self._effective_end)
+
+
+    def get_activation_count(self):
+        """ returns: number of activations of the event at the checkpoint
+                which activated it; more than one only for the poisson
+                model"""
+        return self._activations
+
+
+    def get_tick(self):
+        """ returns: seconds between evaluations of a hazard model"""
+        return self._tick
+
+
+    def get_state(self):
+        """ returns: list of the event's runtime state (see snapshot.py)"""
+        return [self._executed, self._random_time, self._window_end,
+                self._random_time_set, self._countdown]
+
+
+    def set_state(self, state, offset):
+        """ Restores the runtime state saved by get_state().
+            state: list returned by get_state()
+            offset: seconds added to the saved times"""
+        (self._executed, random_time, window_end, self._random_time_set,
+         self._countdown) = state
+        self._random_time = random_time + offset
+        self._window_end = window_end + offset
+
+
+    def _is_evaluation_due(self):
+        """ Counts down the checkpoints between evaluations of a hazard
+                model.  The probability of each evaluation covers the
+                _tick seconds since the previous one.
+            returns: true if the model is evaluated at this checkpoint"""
+        self._countdown -= 1
+        if self._countdown > 0: return False
+        self._countdown = self._tick
+        return True
+
+
+    def _is_hazard_active(self, elapsed_time):
+        """ Evaluates a rate model over the _tick seconds since its
+                previous evaluation, with the rate scaled by the event's
+                intensity profile.
+            elapsed_time: seconds since the previous event
+            returns: true if the event is activated"""
+        intensity = self._intensity
+        k = intensity.get_factor(self._tick) if intensity else 1.0
+        if self._prob_model == SessionConfig.EVENT_PMOD_POISSON:
+            n = poisson_count(self._rate, self._tick, k)
+            if n and self.is_singular_event(): n = 1
+            if intensity: intensity.record(self._rate * self._tick * k, n)
+            self._activations = n
+            return n > 0
+        if self._prob_model == SessionConfig.EVENT_PMOD_EXP:
+            p = exponential_probability(self._mttf, self._tick, k)
+        elif self._prob_model == SessionConfig.EVENT_PMOD_NORM:
+            p = normal_probability(self._mttf, self._standard_deviation,
+                                   elapsed_time, self._tick, k)
+        else:
+            p = weibull_probability(self._shape, self._mttf, elapsed_time,
+                                    self._tick, k)
+        active = random() < p
+        if intensity: intensity.record(p, active)
+        return active
+
+
+    def get_next_due(self, last_event_time):
+        """ last_event_time: time when the previous event occurred
+                or the component initialization time.
+            returns: earliest time (seconds since the epoch) at which the
+                event may next be activated; None if it will not be
+                activated again.  Only the random and deterministic 
+                models are exact; hazard models may activate later."""
+        if self._executed and self.is_singular_event(): return None
+        if (self._prob_model == SessionConfig.EVENT_PMOD_RANDOM and 
+                self._random_time_set):
+            return self._random_time
+        return last_event_time + self._threshold
+
+
+    def is_active(self, last_event_time):
         """ Determines if this event is now activated based upon the
-                model and the current time.
-            alive_time: initialization time of the component.
+                model and the current time.  The effective window of
+                sequenced events is not tested here; SystemComponent only
+                evaluates events which are in effect (see EventWindowIndex).
             last_event_time: time when the previous event occurred
                 or the component initialization time.
             returns: return true if the event is activated; false if not"""
@@ -134,36 +322,19 @@ class Event():
         # executed once
         if self._executed and self.is_singular_event(): return False
 
-        # Get the elapsed time from when the component was initialized.
-        elapsed_life = time() - alive_time
         # Get the elapsed time from either when the last event occurred
         # or when the component started up.
         elapsed_time = time() - last_event_time
 
-        effective = True # supports sequenced events with effective times
         active = False # is the event now active based upon model
 
-        if self._effective_start > -1:
-            # Is the event in effect now? 
-            if not (elapsed_life >= self._effective_start and 
-                 (self._effective_end == -1 or 
-                     elapsed_life <= self._effective_end)):
-                effective = False
-
-        if effective and elapsed_time >= self._threshold:
+        if elapsed_time >= self._threshold:
             # Is the event active now?
             if self._prob_model == SessionConfig.EVENT_PMOD_DETER:
                 active = True
-            elif self._prob_model == SessionConfig.EVENT_PMOD_EXP:
-                active = exponential_hazard(self._mttf)
-            elif self._prob_model == SessionConfig.EVENT_PMOD_NORM:
-                active = normal_hazard(self._mttf,
-                                    self._standard_deviation,
-                                    elapsed_time)
-            elif self._prob_model == SessionConfig.EVENT_PMOD_WEI:
-                active = weibull_hazard(self._shape,
-                                     self._mttf,
-                                     elapsed_time)
+            elif self._prob_model in RATE_MODELS:
+                if self._is_evaluation_due():
+                    active = self._is_hazard_active(elapsed_time)
             elif self._prob_model == SessionConfig.EVENT_PMOD_RANDOM:
                 # This model precalculates when the event is to occur
                 # and uses _random_time_set to toggle the set/unset state.
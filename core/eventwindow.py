@@ -0,0 +1,130 @@
+"""
+
+eventwindow.py: Contains the EventWindowIndex class.
+
+Sequenced events are only in effect between their effective start and
+effective end times, which are relative to the time the component was
+initialized.  Rather than testing the window of every event on every
+checkpoint, a SystemComponent keeps an EventWindowIndex per state.  The
+index holds the events which are in effect.  Events enter the index at
+their effective start and leave it after their effective end, so a
+checkpoint only evaluates events which are in effect.  Events without
+an effective start are always in effect.
+
+"""
+
+import heapq
+
+
+def is_in_effect(event, elapsed_life):
+    """ Tests the window of a single event; used for events which are
+            not evaluated at checkpoints (ie. triggered events).
+        event: an Event instance
+        elapsed_life: seconds since the component was initialized
+        returns: true if the event is in effect"""
+    start, end = event.get_effective_window()
+    return ((start == -1 or elapsed_life >= start) and
+            (end == -1 or elapsed_life <= end))
+
+
+class EventWindowIndex(object):
+
+    # There are two indexes per component; keep them compact.  Containers
+    # which are only needed for sequenced or retired events are created
+    # on first use.
+    __slots__ = ('_all', '_pending', '_expiring', '_current', '_events',
+                 '_retired', '_positions')
+
+    def __init__(self, events):
+        """ Create EventWindowIndex object.
+            events: list of Event instances; the order of the list is
+                the order in which events in effect are returned"""
+        self._all = events
+        self._pending = None # heap of (effective start, order, event)
+        self._expiring = None # heap of (effective end, order, event)
+        self._current = None # order -> event, for events in effect; None
+                             # while every event is in effect
+        self._events = events # events in effect, in order
+        self._retired = None # orders of events which never take effect
+        self._positions = None # event -> order, for retire()
+
+        for i, e in enumerate(events):
+            start = e.get_effective_window()[0]
+            if start != -1:
+                if self._pending is None:
+                    self._materialize()
+                    self._pending = []
+                del self._current[i]
+                self._pending.append((start, i, e))
+
+        if self._pending is not None:
+            heapq.heapify(self._pending)
+            self._update()
+
+
+    def in_window(self, elapsed_life):
+        """ Advances the index to the component's elapsed life.
+            elapsed_life: seconds since the component was initialized
+            returns: list of events in effect"""
+        changed = False
+
+        # Events whose window has started.
+        while self._pending and self._pending[0][0] <= elapsed_life:
+            start, i, e = heapq.heappop(self._pending)
+            end = e.get_effective_window()[1]
+            if ((self._retired and i in self._retired) or 
+                    (end != -1 and elapsed_life > end)):
+                continue # retired, or the window passed between checkpoints
+            self._current[i] = e
+            if end != -1:
+                if self._expiring is None: self._expiring = []
+                heapq.heappush(self._expiring, (end, i, e))
+            changed = True
+
+        # Events whose window has ended.
+        while self._expiring and self._expiring[0][0] < elapsed_life:
+            end, i, e = heapq.heappop(self._expiring)
+            if self._current.pop(i, None) is not None: changed = True
+
+        if changed: self._update()
+
+        return self._events
+
+
+    def peek(self, elapsed_life):
+        """ Returns the events in effect without advancing the index, so
+                that it may be called by another thread than the one
+                which calls in_window() (ie. to describe a component).
+            elapsed_life: seconds since the component was initialized
+            returns: list of events in effect"""
+        retired = self._retired or ()
+        return [e for i, e in enumerate(self._all)
+                if i not in retired and is_in_effect(e, elapsed_life)]
+
+
+    def retire(self, event):
+        """ Permanently removes an event from the index (ie. a singular
+                event which has been executed).
+            event: an Event instance"""
+        if self._positions is None:
+            self._positions = dict((e, i) for i, e in enumerate(self._all))
+        i = self._positions.get(event)
+        if i is None: return
+        self._materialize()
+        if self._retired is None: self._retired = set()
+        self._retired.add(i)
+        if self._current.pop(i, None) is not None:
+            # The order of the other events is unchanged.
+            self._events = [e for e in self._events if e is not event]
+
+
+    def _materialize(self):
+        """ Creates the map of events in effect if every event is in
+            effect."""
+        if self._current is None:
+            self._current = dict(enumerate(self._all))
+
+
+    def _update(self):
+        """ Rebuilds the ordered list of events in effect."""
+        self._events = [self._current[i] for i in sorted(self._current)]
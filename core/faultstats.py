@@ -0,0 +1,139 @@
+"""
+
+faultstats.py: Contains the FaultStats class.
+
+Each Scheduler records the outcome of every fault function execution
+in a FaultStats instance.  An outcome captures whether the fault
+function returned or raised an exception, a short summary of the
+return value (or exception) and the execution duration.  Outcomes are
+aggregated per (fault, target, component) into execution counts, error
+rates and latency percentiles.  The aggregate can be reported while the
+session is running and is reported when the Scheduler stops.
+
+"""
+
+from collections import namedtuple
+import random
+import threading
+
+# Outcome of a single fault function execution.
+Outcome = namedtuple(
+    'Outcome', 'fault target component_id success summary duration'
+)
+
+# Maximum number of durations retained per key for percentile estimates.
+# Beyond this, durations are reservoir sampled.
+SAMPLE_SIZE = 1024
+
+# Maximum length of a return value or exception summary.
+SUMMARY_LEN = 80
+
+# Percentiles included in reports.
+PERCENTILES = (50, 90, 99)
+
+
+def summarize(value):
+    """ value: return value or exception from a fault function
+        returns: a short printable summary of the value"""
+    s = repr(value)
+    return s if len(s) <= SUMMARY_LEN else s[:SUMMARY_LEN - 3] + '...'
+
+
+class _FaultAggregate(object):
+
+    __slots__ = ('count', 'errors', 'total', 'max', 'samples', 'last')
+
+    def __init__(self):
+        self.count = 0 # number of executions
+        self.errors = 0 # number of executions which raised an exception
+        self.total = 0.0 # sum of durations
+        self.max = 0.0 # longest duration
+        self.samples = [] # bounded sample of durations
+        self.last = None # most recent Outcome
+
+
+class FaultStats(object):
+
+    def __init__(self):
+        """ Create FaultStats object."""
+        self._aggregates = {} # (fault, target, component id) -> aggregate
+        self._lock = threading.Lock()
+        # Not the shared generator, whose state the models' draws depend
+        # on (and which is saved with the session's state).
+        self._random = random.Random()
+
+
+    def record(self, outcome):
+        """ Adds the outcome of a fault function execution.
+            outcome: an Outcome instance"""
+        key = (outcome.fault, outcome.target, outcome.component_id)
+
+        with self._lock:
+            agg = self._aggregates.get(key)
+            if agg is None:
+                agg = self._aggregates[key] = _FaultAggregate()
+            agg.count += 1
+            if not outcome.success: agg.errors += 1
+            agg.total += outcome.duration
+            if outcome.duration > agg.max: agg.max = outcome.duration
+            if len(agg.samples) < SAMPLE_SIZE:
+                agg.samples.append(outcome.duration)
+            else:
+                # Reservoir sampling keeps a uniform sample of durations.
+                i = self._random.randint(0, agg.count - 1)
+                if i < SAMPLE_SIZE: agg.samples[i] = outcome.duration
+            agg.last = outcome
+
+
+    def snapshot(self):
+        """ returns: list of dictionaries, one per (fault, target, component),
+                with execution counts, error rate and latency statistics
+                (in seconds)"""
+        with self._lock:
+            items = [(k, a.count, a.errors, a.total, a.max, list(a.samples),
+                      a.last) for k, a in self._aggregates.items()]
+
+        stats = []
+        for key, count, errors, total, max_, samples, last in sorted(items):
+            samples.sort()
+            entry = {
+                'fault': key[0],
+                'target': key[1],
+                'component_id': key[2],
+                'count': count,
+                'errors': errors,
+                'error_rate': float(errors) / count,
+                'mean': total / count,
+                'max': max_,
+                'last': last.summary
+            }
+            for p in PERCENTILES:
+                entry['p%d' % p] = _percentile(samples, p)
+            stats.append(entry)
+
+        return stats
+
+
+    def report(self):
+        """ returns: list of printable lines summarizing all outcomes"""
+        lines = []
+        for s in self.snapshot():
+            lines.append(
+                "%s (target:%s, id:%s) runs:%d errors:%d (%.1f%%) "
+                "mean:%.3fs %s max:%.3fs last:%s" % (
+                    s['fault'], s['target'], s['component_id'], s['count'],
+                    s['errors'], 100 * s['error_rate'], s['mean'],
+                    ' '.join('p%d:%.3fs' % (p, s['p%d' % p])
+                             for p in PERCENTILES),
+                    s['max'], s['last'])
+            )
+        return lines
+
+
+def _percentile(samples, p):
+    """ samples: sorted list of values
+        p: percentile (0-100)
+        returns: nearest-rank percentile of the samples"""
+    if not samples: return 0.0
+    rank = int(round(p / 100.0 * len(samples) + 0.5)) - 1
+    return samples[min(max(rank, 0), len(samples) - 1)]
@@ -0,0 +1,388 @@
+"""
+
+intensity.py: Contains the intensity profiles of a session.
+
+An intensity profile scales the hazard rates of events over the time
+of a session, ie. to ramp fault activity up until the system under test
+breaks.  The hazard rate h(t) of an event with a profile becomes
+k(s) * h(t), where t is the elapsed time of the event's model and s the
+time since the session's first checkpoint.  A profile is configured for
+the whole session or for a single event (which overrides the session's):
+
+    "intensity": 2
+        constant factor
+    "intensity": {"profile": "ramp", "from": 1, "to": 50,
+                  "duration": 3600, "start": 0}
+        linear from 'from' (default 1) at 'start' seconds (default 0)
+        to 'to' at 'start' + 'duration' seconds, then held
+    "intensity": {"profile": "step", "steps": [[0, 1], [600, 5]]}
+        'steps' lists [time, factor] pairs in increasing time order; the
+        factor is 1 until the first step
+    "intensity": {"profile": "sine", "base": 10, "amplitude": 9,
+                  "period": 600}
+        base + amplitude * sin(2 pi s / period); the amplitude may not
+        exceed the base (default 1)
+
+A model evaluated every tick seconds uses the mean factor over the tick
+(see stochastic.py), so the scaled hazard is exact for any tick whether
+the profile is smooth or steps.  Only the probability models with a rate
+are scaled: the hazard models (exponential, normal and weibull) and the
+poisson model, whose rate of activations is multiplied by the factor.
+
+Each profile counts the expected number of activations of its events
+(the sum of the probabilities evaluated, or of the poisson means) and
+the actual number.  The
+target rate is the expected number per checkpoint, the rate the models
+call for with one checkpoint per second; the effective rate is the
+actual number per second of wall time, so it falls short of the target
+when checkpoints fall behind.
+
+"""
+
+from bisect import bisect_right
+import math
+from time import time
+
+# JSON config file key names.
+INTENSITY_PROFILE = 'profile'
+INTENSITY_FACTOR = 'factor' # constant profile
+INTENSITY_FROM = 'from' # ramp profile
+INTENSITY_TO = 'to' # ramp profile
+INTENSITY_DURATION = 'duration' # ramp profile
+INTENSITY_START = 'start' # ramp profile
+INTENSITY_STEPS = 'steps' # step profile
+INTENSITY_BASE = 'base' # sine profile
+INTENSITY_AMPLITUDE = 'amplitude' # sine profile
+INTENSITY_PERIOD = 'period' # sine profile
+
+# All possible profiles.
+PROFILE_CONSTANT = 'constant'
+PROFILE_RAMP = 'ramp'
+PROFILE_STEP = 'step'
+PROFILE_SINE = 'sine'
+
+
+def create_profile(spec):
+    """ Validates an intensity specification.  A ValueError exception will
+            be thrown for an invalid specification.
+        spec: factor or profile dictionary as read from the JSON file
+        returns: an IntensityProfile instance"""
+    if _is_number(spec):
+        return ConstantProfile(spec)
+    if not isinstance(spec, dict):
+        raise ValueError("must be a number or a dictionary")
+
+    profile = spec.get(INTENSITY_PROFILE)
+    if profile == PROFILE_CONSTANT:
+        return ConstantProfile(_get(spec, INTENSITY_FACTOR))
+    if profile == PROFILE_RAMP:
+        return RampProfile(_get(spec, INTENSITY_FROM, 1),
+                           _get(spec, INTENSITY_TO),
+                           _get(spec, INTENSITY_DURATION),
+                           _get(spec, INTENSITY_START, 0))
+    if profile == PROFILE_STEP:
+        return StepProfile(_get(spec, INTENSITY_STEPS))
+    if profile == PROFILE_SINE:
+        return SineProfile(_get(spec, INTENSITY_BASE, 1),
+                           _get(spec, INTENSITY_AMPLITUDE),
+                           _get(spec, INTENSITY_PERIOD))
+    raise ValueError("invalid %s '%s'" % (INTENSITY_PROFILE, profile))
+
+
+def format_rates(rates):
+    """ rates: dictionary of IntensityProfile rates (see
+            IntensityProfile.snapshot)
+        returns: one line summary of the rates"""
+    return ("%s now x%.2f: target %.3f/s effective %.3f/s (expected %.1f"
+            " activated %d, %d checkpoints in %.0fs)"
+            % (rates['profile'], rates['factor'], rates['target_rate'],
+               rates['effective_rate'], rates['expected'],
+               rates['activated'], rates['checkpoints'], rates['seconds']))
+
+
+class IntensityProfile(object):
+    """ Base class of the profiles.  Subclasses provide, for s seconds
+        since the session's first checkpoint (s >= 0):
+
+        get_value(s): the factor k(s)
+        get_integral(s): the integral K(s) of the factor over [0, s]
+        describe(): a short description of the profile"""
+
+    def __init__(self):
+        self._start = None # time of the first checkpoint
+        self._elapsed = 0.0 # session time of the current checkpoint
+        self._means = {} # tick -> mean factor at the current checkpoint
+        self._total = _Counts()
+        self._window = _Counts() # since the last call of take_window()
+
+
+    def get_mean(self, end, dt):
+        """ end: seconds since the session's first checkpoint
+            dt: length of the interval in seconds
+            returns: mean factor over the interval (end - dt, end]"""
+        start = max(end - dt, 0.0)
+        if end <= start: return self.get_value(end)
+        return (self.get_integral(end) - self.get_integral(start)) / (
+            end - start)
+
+
+    def update(self):
+        """ Advances the profile to a new checkpoint; called by the
+                SystemUnderTest before its components are evaluated."""
+        now = time()
+        if self._start is None:
+            self._start = self._total.since = self._window.since = now
+        self._elapsed = now - self._start
+        self._means.clear()
+        self._total.checkpoints += 1
+        self._window.checkpoints += 1
+
+
+    def get_factor(self, tick):
+        """ tick: seconds between evaluations of the calling model
+            returns: mean factor over the tick ending at the current
+                checkpoint"""
+        mean = self._means.get(tick)
+        if mean is None:
+            mean = self._means[tick] = self.get_mean(self._elapsed, tick)
+        return mean
+
+
+    def record(self, expected, activations):
+        """ Counts an evaluation of a scaled model.
+            expected: expected number of activations (the probability of
+                the evaluation for a hazard model)
+            activations: number of activations"""
+        t = self._total
+        t.expected += expected
+        w = self._window
+        w.expected += expected
+        if activations:
+            t.activated += activations
+            w.activated += activations
+
+
+    def snapshot(self):
+        """ returns: dictionary with the current factor and the target
+                and effective rates since the first checkpoint"""
+        return self._summarize(self._total)
+
+
+    def take_window(self):
+        """ returns: dictionary like snapshot(), since the previous call;
+                the counts are restarted"""
+        window = self._window
+        self._window = _Counts()
+        return self._summarize(window)
+
+
+    def get_state(self):
+        """ returns: dictionary of the profile's runtime state (see
+                snapshot.py)"""
+        return {
+            'profile': self.describe(),
+            'start': self._start,
+            'total': self._total.get_state(),
+            'window': self._window.get_state()
+        }
+
+
+    def set_state(self, state, offset):
+        """ Restores the runtime state saved by get_state().
+            state: dictionary returned by get_state()
+            offset: seconds added to the saved times"""
+        if state['start'] is not None:
+            self._start = state['start'] + offset
+        self._total.set_state(state['total'], offset)
+        self._window.set_state(state['window'], offset)
+
+
+    def _summarize(self, counts):
+        """ counts: a _Counts instance
+            returns: dictionary of the rates of the counts"""
+        wall = max(time() - counts.since, 1e-9)
+        return {
+            'profile': self.describe(),
+            'factor': self.get_value(self._elapsed),
+            'checkpoints': counts.checkpoints,
+            'seconds': wall,
+            'expected': counts.expected,
+            'activated': counts.activated,
+            'target_rate': (counts.expected / counts.checkpoints
+                            if counts.checkpoints else 0.0),
+            'effective_rate': counts.activated / wall
+        }
+
+
+class ConstantProfile(IntensityProfile):
+
+    def __init__(self, factor):
+        """ factor: factor applied at all times"""
+        IntensityProfile.__init__(self)
+        self._factor = _check(factor, INTENSITY_FACTOR)
+
+
+    def get_value(self, s):
+        return self._factor
+
+
+    def get_integral(self, s):
+        return self._factor * s
+
+
+    def get_mean(self, end, dt):
+        return self._factor
+
+
+    def describe(self):
+        return "constant x%g" % self._factor
+
+
+class RampProfile(IntensityProfile):
+
+    def __init__(self, from_, to, duration, start):
+        """ from_: factor until start
+            to: factor from start + duration
+            duration: length of the ramp in seconds
+            start: beginning of the ramp in seconds"""
+        IntensityProfile.__init__(self)
+        self._from = _check(from_, INTENSITY_FROM)
+        self._to = _check(to, INTENSITY_TO)
+        self._duration = _check(duration, INTENSITY_DURATION, False)
+        self._ramp_start = _check(start, INTENSITY_START)
+        self._slope = (self._to - self._from) / float(self._duration)
+
+
+    def get_value(self, s):
+        r = min(max(s - self._ramp_start, 0.0), self._duration)
+        return self._from + self._slope * r
+
+
+    def get_integral(self, s):
+        if s <= self._ramp_start: return self._from * s
+        r = min(s - self._ramp_start, self._duration)
+        return (self._from * (self._ramp_start + r) +
+                0.5 * self._slope * r * r +
+                self._to * max(s - self._ramp_start - self._duration, 0.0))
+
+
+    def describe(self):
+        return "ramp x%g-x%g over %gs from %gs" % (
+            self._from, self._to, self._duration, self._ramp_start)
+
+
+class StepProfile(IntensityProfile):
+
+    def __init__(self, steps):
+        """ steps: list of [time, factor] pairs in increasing time
+                order"""
+        IntensityProfile.__init__(self)
+        if not isinstance(steps, list) or not steps:
+            raise ValueError("'%s' must be mapped to a List of "
+                             "[time, factor] pairs" % INTENSITY_STEPS)
+        self._times = [0.0]
+        self._factors = [1.0]
+        for step in steps:
+            if not isinstance(step, list) or len(step) != 2:
+                raise ValueError("invalid %s value '%s'"
+                                 % (INTENSITY_STEPS, step))
+            s = _check(step[0], INTENSITY_STEPS)
+            if s < self._times[-1]:
+                raise ValueError("%s must be in increasing time order"
+                                 % INTENSITY_STEPS)
+            if s == self._times[-1]:
+                self._factors[-1] = _check(step[1], INTENSITY_STEPS)
+                continue
+            self._times.append(s)
+            self._factors.append(_check(step[1], INTENSITY_STEPS))
+        # Integral of the factor up to each step.
+        self._integrals = [0.0]
+        for i in range(1, len(self._times)):
+            self._integrals.append(self._integrals[-1] + self._factors[i - 1]
+                                   * (self._times[i] - self._times[i - 1]))
+
+
+    def get_value(self, s):
+        return self._factors[max(bisect_right(self._times, s) - 1, 0)]
+
+
+    def get_integral(self, s):
+        i = max(bisect_right(self._times, s) - 1, 0)
+        return self._integrals[i] + self._factors[i] * (s - self._times[i])
+
+
+    def describe(self):
+        return "step %s" % ' '.join("x%g@%gs" % (f, t) for t, f in
+                                    zip(self._times, self._factors))
+
+
+class SineProfile(IntensityProfile):
+
+    def __init__(self, base, amplitude, period):
+        """ base: mean factor
+            amplitude: amplitude of the factor; no larger than base
+            period: period in seconds"""
+        IntensityProfile.__init__(self)
+        self._base = _check(base, INTENSITY_BASE)
+        self._amplitude = _check(amplitude, INTENSITY_AMPLITUDE)
+        self._period = _check(period, INTENSITY_PERIOD, False)
+        if self._amplitude > self._base:
+            raise ValueError("%s may not exceed %s"
+                             % (INTENSITY_AMPLITUDE, INTENSITY_BASE))
+        self._omega = 2 * math.pi / self._period
+
+
+    def get_value(self, s):
+        return self._base + self._amplitude * math.sin(self._omega * s)
+
+
+    def get_integral(self, s):
+        return (self._base * s + self._amplitude / self._omega *
+                (1.0 - math.cos(self._omega * s)))
+
+
+    def describe(self):
+        return "sine x%g+-%g over %gs" % (self._base, self._amplitude,
+                                          self._period)
+
+
+class _Counts(object):
+
+    __slots__ = ('since', 'checkpoints', 'expected', 'activated')
+
+    def __init__(self):
+        self.since = time()
+        self.checkpoints = 0
+        self.expected = 0.0 # expected number of activations
+        self.activated = 0
+
+
+    def get_state(self):
+        return [self.since, self.checkpoints, self.expected, self.activated]
+
+
+    def set_state(self, state, offset):
+        since, self.checkpoints, self.expected, self.activated = state
+        self.since = since + offset
+
+
+def _is_number(value):
+    return type(value) in (int, float)
+
+
+def _check(value, name, zero = True):
+    """ value: a profile parameter
+        name: name of the parameter
+        zero: true if the value may be 0
+        returns: the value as a float"""
+    if not _is_number(value) or value < 0 or (value == 0 and not zero):
+        raise ValueError("invalid %s value '%s'" % (name, value))
+    return float(value)
+
+
+def _get(spec, name, default = None):
+    """ returns: a parameter of a profile dictionary"""
+    value = spec.get(name, default)
+    if value is None:
+        raise ValueError("missing '%s' value" % name)
+    return value
@@ -0,0 +1,273 @@
+"""
+
+membership.py: Contains the MembershipChange and MembershipStream
+classes.
+
+Autoscaling systems add and remove nodes while a session runs.  The
+components of a SUT may be changed without restarting the session by a
+stream of membership changes, one JSON dictionary per line (NDJSON),
+read from a file or FIFO (dtest-controller.py --membership) or sent to
+the control socket ('member' command):
+
+    {"op": "add", "component": {...}}
+        adds a component; the dictionary has the format of an entry of
+        the configuration file's 'components' list.  A component with
+        "active": false is added inactive.
+    {"op": "remove", "id": "vm7"}
+        removes a component (a family is removed as a whole)
+    {"op": "inactive", "id": "vm7"}
+    {"op": "active", "id": "vm7"}
+        stops or resumes activating a component's events, as 'pause'
+        and 'resume' of the control socket do
+
+A change names its SUT with "sut" (system name or index); it may be
+left out when the controller runs a single SUT.
+
+A component to be added is built and validated by the thread which
+reads the change, so building a large family does not delay the
+checkpoints.  The Scheduler applies the changes between checkpoints.
+The life of an added component starts when it is built.  Its triggered
+events may be triggered by the events of the components present when it
+is added.  Events triggered by the events of a removed component are no
+longer activated, and its daemons are stopped.  The setup hook of the
+fault module is called with the targets of added components.
+
+A file is followed as it grows (as tail -f); a FIFO is reopened each
+time its writer closes it.  Invalid changes are logged and skipped.  A
+resumed session rebuilds the changes saved in its snapshot, so changes
+which are read again from a file are rejected as duplicates.
+
+"""
+
+import json
+import logging
+import os
+import stat
+import threading
+
+from scheduler import find_scheduler
+from sessionconfig import COMPONENT_ACTIVE
+from sessionconfig import COMPONENT_ID
+
+# Keys of a membership change.
+CHANGE_OP = 'op'
+CHANGE_SUT = 'sut'
+CHANGE_ID = 'id'
+CHANGE_COMPONENT = 'component'
+
+# Operations of a membership change.
+OP_ADD = 'add'
+OP_REMOVE = 'remove'
+OP_INACTIVE = 'inactive'
+OP_ACTIVE = 'active'
+
+# Seconds between reads of a file which has no new changes.
+POLL_INTERVAL = 0.5
+
+# Seconds before a file which cannot be opened is tried again.
+RETRY_INTERVAL = 5
+
+
+def submit_change(schedulers, line, source, sut = None):
+    """ Parses a membership change and submits it to the Scheduler of its
+            SUT.  A ValueError exception will be thrown if the change is
+            invalid and a KeyError exception if there is no such SUT.
+        schedulers: list of Scheduler instances
+        line: JSON text of the change
+        source: name of the change's source for error messages
+        sut: system name or index of the SUT; None for the change's own
+        returns: the submitted MembershipChange instance"""
+    try:
+        record = json.loads(line)
+    except ValueError as err:
+        raise ValueError("Invalid JSON: %s" % err, source)
+    change = MembershipChange(record, source)
+    scheduler = find_scheduler(schedulers,
+                               sut if sut is not None else change.get_sut())
+    scheduler.submit_membership(change)
+    return change
+
+
+class MembershipChange(object):
+    """ A change of the components of a SUT, submitted by any thread and
+        applied by the SUT's Scheduler between checkpoints."""
+
+    def __init__(self, record, source):
+        """ Create MembershipChange object.  A ValueError exception will
+                be thrown if the change is invalid.
+            record: dictionary decoded from the change's JSON text
+            source: name of the change's source for error messages"""
+        if not isinstance(record, dict):
+            raise ValueError("Membership change must be a dictionary",
+                             source)
+        self._op = record.get(CHANGE_OP)
+        self._sut = record.get(CHANGE_SUT)
+        self._source = source
+        self._spec = None # component dictionary to add
+        self._active = True
+        self._component = None # component built by prepare()
+        self._profiles = None
+        self._done = threading.Event()
+        self._error = None
+
+        if self._op == OP_ADD:
+            spec = record.get(CHANGE_COMPONENT)
+            if not isinstance(spec, dict):
+                raise ValueError("'%s' change requires a '%s' dictionary"
+                                 % (OP_ADD, CHANGE_COMPONENT), source)
+            self._active = spec.get(COMPONENT_ACTIVE, True)
+            if type(self._active) is not bool:
+                raise ValueError("Invalid '%s' data type"
+                                 % COMPONENT_ACTIVE, source)
+            # Inactive components are added paused, which a snapshot
+            # records with the component's state.
+            self._spec = dict(spec)
+            self._spec[COMPONENT_ACTIVE] = True
+            self._id = spec.get(COMPONENT_ID)
+        elif self._op in (OP_REMOVE, OP_INACTIVE, OP_ACTIVE):
+            self._id = record.get(CHANGE_ID)
+            if not isinstance(self._id, basestring):
+                raise ValueError("'%s' change requires an '%s' string"
+                                 % (self._op, CHANGE_ID), source)
+        else:
+            raise ValueError("Invalid '%s' value '%s'"
+                             % (CHANGE_OP, self._op), source)
+
+
+    def __str__(self):
+        return "%s component '%s'" % (self._op, self._id)
+
+
+    def get_sut(self):
+        """ returns: system name or index of the change's SUT; None if
+                not given"""
+        return self._sut
+
+
+    def prepare(self, sut):
+        """ Builds the component to be added; called by the submitting
+                thread.  A ValueError exception will be thrown if the
+                component is invalid.
+            sut: the SystemUnderTest instance"""
+        if self._op == OP_ADD:
+            self._component, self._profiles = sut.create_component(
+                self._spec, self._source)
+
+
+    def apply(self, sut):
+        """ Applies the change; called by the Scheduler between
+                checkpoints.  A KeyError or ValueError exception will be
+                thrown if it cannot be applied.
+            sut: the SystemUnderTest instance
+            returns: list of the targets of an added component; empty
+                for other changes"""
+        if self._op == OP_ADD:
+            targets = sut.add_component(self._spec, self._component,
+                                        self._profiles)
+            if not self._active: self._component.set_paused(True)
+            return targets
+        if self._op == OP_REMOVE:
+            sut.remove_component(self._id)
+            return []
+        c = sut.get_component(self._id)
+        if c is None:
+            raise KeyError("unknown component '%s'" % self._id)
+        c.set_paused(self._op == OP_INACTIVE)
+        return []
+
+
+    def finish(self, error = None):
+        """ Marks the change as applied, or failed.
+            error: description of the failure; None if applied"""
+        self._error = error
+        self._done.set()
+
+
+    def wait(self, timeout):
+        """ Waits until the Scheduler has applied the change.
+            timeout: maximum seconds to wait
+            returns: true if the change was applied or failed; false if
+                it is still pending"""
+        self._done.wait(timeout)
+        return self._done.isSet()
+
+
+    def get_error(self):
+        """ returns: description of the failure; None if the change was
+                applied"""
+        return self._error
+
+
+    def describe(self):
+        """ returns: dictionary describing the change"""
+        return {'op': self._op, 'id': self._id,
+                'applied': self._done.isSet() and self._error is None}
+
+
+class MembershipStream(threading.Thread):
+    """ Reads membership changes from a file or FIFO and submits them to
+        the Schedulers."""
+
+    def __init__(self, path, schedulers):
+        """ Create MembershipStream object.
+            path: file system path of the file or FIFO
+            schedulers: list of Scheduler instances"""
+        threading.Thread.__init__(self, name = "membership")
+        # Opening a FIFO blocks until a writer opens it.
+        self.daemon = True
+        self._path = path
+        self._schedulers = schedulers
+        self._stop = threading.Event()
+
+
+    def run(self):
+        """ Entry point for threading.Thread (membership stream thread)"""
+        logging.info("Reading membership changes from %s" % self._path)
+        while not self._stop.isSet():
+            try:
+                with open(self._path) as f:
+                    self._follow(f, stat.S_ISFIFO(os.fstat(f.fileno()).st_mode))
+            except (IOError, OSError) as err:
+                logging.info("error: %s- %s" % (self._path, err.strerror))
+                self._stop.wait(RETRY_INTERVAL)
+
+
+    def close(self):
+        """ Stops reading changes."""
+        self._stop.set()
+
+
+    def _follow(self, f, fifo):
+        """ Submits the changes read from an open file.  Returns when the
+                writer of a FIFO closes it, or when the stream is
+                closed.
+            f: the open file
+            fifo: true if the file is a FIFO"""
+        partial = '' # line not yet terminated by its writer
+        while not self._stop.isSet():
+            position = f.tell() if not fifo else None
+            line = f.readline()
+            if not line:
+                if fifo:
+                    # The writer is done with its last line.
+                    self._submit(partial)
+                    return
+                # Clear the end of file condition before reading again.
+                f.seek(position)
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            if not line.endswith('\n'):
+                partial += line
+                continue
+            self._submit(partial + line)
+            partial = ''
+
+
+    def _submit(self, line):
+        """ Submits a change; errors are logged.
+            line: JSON text of the change"""
+        if not line.strip(): return
+        try:
+            submit_change(self._schedulers, line, self._path)
+        except (KeyError, ValueError) as err:
+            logging.info("error: %s- %s" % (self._path, err.args[0]))
@@ -0,0 +1,217 @@
+"""
+
+profiler.py: Contains the Profiler class.
+
+A Profiler measures the time a Scheduler spends in each phase of its
+session:
+
+    config load         reading and validating the SessionConfig
+    sut build           constructing the SystemUnderTest components
+    checkpoint          SystemUnderTest.checkpoint(), once per tick
+    is_active:<model>   Event.is_active, once per evaluated event, by
+                        probability model (part of checkpoint)
+    dispatch            handing the events activated by a checkpoint to
+                        worker threads (or reporting a dry run)
+    worker              fault function executions
+
+Timing a phase costs two calls to time() and an update of its totals.
+Event.is_active is only wrapped once a Profiler has been created, so a
+session which is not profiled runs the original method.
+
+A Profiler may also run its Scheduler thread under cProfile or sample
+the thread's stack at a fixed interval, and write the result to a file
+named after the Profiler when the thread exits:
+
+    cprofile    <name>.prof, for pstats, snakeviz or gprof2dot
+    sample      <name>.folded, collapsed stacks with sample counts, for
+                flamegraph.pl or speedscope
+
+"""
+
+import cProfile
+from collections import Counter
+import os
+import re
+import sys
+import threading
+from time import sleep
+from time import time
+
+from event import Event
+
+# Modes of the per thread profile dump.
+DUMP_CPROFILE = 'cprofile'
+DUMP_SAMPLE = 'sample'
+
+# Seconds between stack samples.
+SAMPLE_INTERVAL = 0.01
+
+# The Profiler of the Scheduler thread running in each thread, if any.
+_local = threading.local()
+
+# Event.is_active before it was wrapped; None until then.
+_is_active = None
+
+
+class Profiler(object):
+
+    def __init__(self, name, dump = None, directory = '.'):
+        """ Create Profiler object.
+            name: name of the profile dump file, without extension
+            dump: None, DUMP_CPROFILE or DUMP_SAMPLE
+            directory: directory for the profile dump"""
+        self._name = re.sub(r'[^\w.-]+', '_', name)
+        self._dump = dump
+        self._directory = directory
+        self._start = time()
+        # Maps phase name to [# of calls, total seconds, max seconds].
+        self._phases = {}
+        self._lock = threading.Lock()
+        # Like _phases, by probability model.  Only updated by the
+        # profiled thread, without the lock.
+        self._events = {}
+        _wrap_is_active()
+
+
+    def add(self, phase, seconds):
+        """ Records a call of a phase.  Safe to call from any thread.
+            phase: name of the phase
+            seconds: duration of the call"""
+        with self._lock:
+            _accumulate(self._phases, phase, seconds)
+
+
+    def add_event(self, p_model, seconds):
+        """ Records an Event.is_active call by the profiled thread.
+            p_model: probability model of the event
+            seconds: duration of the call"""
+        _accumulate(self._events, p_model, seconds)
+
+
+    def run(self, func):
+        """ Calls func in the current thread, with the thread profiled
+                and its profile dumped as configured.
+            func: callable object without arguments
+            returns: the return value of func"""
+        _local.profiler = self
+        try:
+            if self._dump == DUMP_CPROFILE:
+                profile = cProfile.Profile()
+                try:
+                    return profile.runcall(func)
+                finally:
+                    profile.dump_stats(self.get_dump_path('.prof'))
+            if self._dump == DUMP_SAMPLE:
+                sampler = _Sampler(threading.current_thread().ident)
+                sampler.start()
+                try:
+                    return func()
+                finally:
+                    sampler.stop()
+                    sampler.write(self.get_dump_path('.folded'))
+            return func()
+        finally:
+            _local.profiler = None
+
+
+    def get_dump_path(self, extension):
+        """ extension: file name extension of the dump
+            returns: dump file name"""
+        return os.path.join(self._directory, self._name + extension)
+
+
+    def report(self):
+        """ returns: list of lines summarizing the time spent in each
+                phase, most expensive first"""
+        wall = max(time() - self._start, 1e-9)
+        user, system = os.times()[:2]
+        lines = ["%.1fs wall, process cpu %.1fs user %.1fs system"
+                 % (wall, user, system)]
+
+        with self._lock:
+            phases = dict(self._phases)
+        for p_model, totals in self._events.items():
+            phases['is_active:%s' % p_model] = totals
+
+        for name, (calls, total, max_) in sorted(
+                phases.items(), key = lambda p: -p[1][1]):
+            lines.append("%-24s calls:%d total:%.3fs (%.2f%% of wall) "
+                         "mean:%.1fus max:%.3fs"
+                         % (name, calls, total, 100.0 * total / wall,
+                            1e6 * total / calls, max_))
+        return lines
+
+
+class _Sampler(threading.Thread):
+    """ Counts the stacks of a thread, sampled every SAMPLE_INTERVAL
+        seconds."""
+
+    def __init__(self, ident):
+        """ ident: identifier of the sampled thread"""
+        threading.Thread.__init__(self, name = "sampler-%d" % ident)
+        self.daemon = True
+        self._ident = ident
+        self._done = False
+        self._stacks = Counter()
+
+
+    def run(self):
+        """ Entry point for threading.Thread"""
+        while not self._done:
+            sleep(SAMPLE_INTERVAL)
+            frame = sys._current_frames().get(self._ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s:%d)" % (code.co_name,
+                                             os.path.basename(
+                                                 code.co_filename),
+                                             code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self._stacks[';'.join(reversed(stack))] += 1
+
+
+    def stop(self):
+        """ Stops sampling; returns once the thread has exited"""
+        self._done = True
+        self.join()
+
+
+    def write(self, path):
+        """ Writes the stacks in the collapsed format, one line per
+                distinct stack, followed by its number of samples.
+            path: file name"""
+        with open(path, 'w') as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write("%s %d\n" % (stack, count))
+
+
+def _accumulate(phases, name, seconds):
+    """ Adds a call to the totals of a phase."""
+    totals = phases.get(name)
+    if totals is None:
+        phases[name] = [1, seconds, seconds]
+        return
+    totals[0] += 1
+    totals[1] += seconds
+    if seconds > totals[2]: totals[2] = seconds
+
+
+def _wrap_is_active():
+    """ Replaces Event.is_active (once) with a version which records its
+            duration in the Profiler of the calling thread."""
+    global _is_active
+    if _is_active is not None: return
+    _is_active = Event.is_active
+
+    def is_active(self, last_event_time):
+        profiler = getattr(_local, 'profiler', None)
+        if profiler is None: return _is_active(self, last_event_time)
+        start = time()
+        active = _is_active(self, last_event_time)
+        profiler.add_event(self.get_probability_model(), time() - start)
+        return active
+
+    is_active.__doc__ = _is_active.__doc__
+    Event.is_active = is_active
@@ -0,0 +1,57 @@
+"""
+
+rangepattern.py: Contains the RangePattern class.
+
+A RangePattern is a text pattern with at most one numeric range, ie.
+'vm[0-4999]' or 'rack1-host[00-15].example.com'.  The range is
+inclusive.  When the first number of the range has leading zeros,
+every expansion is zero padded to the same width.  Expansions are
+computed on demand so that a large range is never materialized.
+
+"""
+
+import re
+
+_RANGE = re.compile(r'^(.*?)\[(\d+)-(\d+)\](.*)$')
+
+
+class RangePattern(object):
+
+    __slots__ = ('_prefix', '_suffix', '_start', '_count', '_width')
+
+    def __init__(self, pattern):
+        """ Create RangePattern object.
+            pattern: text with an optional '[first-last]' range"""
+        m = _RANGE.match(pattern)
+        if m is None:
+            # Constant pattern; every expansion is the pattern itself.
+            self._prefix = pattern
+            self._suffix = ''
+            self._start = None
+            self._count = None
+            self._width = 0
+            return
+
+        first, last = m.group(2), m.group(3)
+        self._prefix = m.group(1)
+        self._suffix = m.group(4)
+        self._start = int(first)
+        self._count = int(last) - self._start + 1
+        self._width = len(first) if len(first) > 1 and first[0] == '0' else 0
+
+        if self._count <= 0:
+            raise ValueError("Invalid range '[%s-%s]'" % (first, last))
+
+
+    def get_count(self):
+        """ returns: number of values in the range; None for a constant
+                pattern"""
+        return self._count
+
+
+    def expand(self, i):
+        """ i: index within the range (0 is the first value)
+            returns: the pattern text for the index"""
+        if self._start is None: return self._prefix
+        return '%s%0*d%s' % (self._prefix, self._width, self._start + i,
+                             self._suffix)
@@ -3,28 +3,86 @@
 scheduler.py: This module contains the Scheduler class.  
 
 A Scheduler instance is a thread of execution for activating
-events associated with a single system under test (SUT).
+events associated with a single system under test (SUT).  It also
+starts and stops the SUT's daemons (see daemon.py) as components change
+state, and may save the session's state to a snapshot file from which
+it can be resumed (see snapshot.py).  Changes of the SUT's components
+submitted while the session runs (see membership.py) are applied
+between checkpoints.
+
+A fault module may define two optional hooks.  setup(targets, config) is
+called when the module is loaded, with the list of all targets of the
+SUT and the session's 'fault_config' dictionary.  It returns None or a
+dictionary mapping targets to context objects (ie. warm connections or
+clients), which are passed as the 'context' argument to the fault
+functions which have one.  setup is called again with the new targets
+of the components added while the session runs.  teardown() is called
+when the Scheduler stops, once the workers and daemons have finished.
+Neither hook is called for a dry run.
 
 """
 
+from collections import Counter
+from collections import OrderedDict
 import imp
+import inspect
 import logging
+import Queue
+import random
+import sys
 import threading
 import time
 
+from daemon import DaemonSupervisor
+from faultstats import FaultStats
+from faultstats import Outcome
+from faultstats import summarize
+from intensity import format_rates
+from sessionconfig import SessionConfig
 from systemundertest import SystemUnderTest
 
 # Subdirectory name for all event modules.
 FAULT_PKG = 'event'
 
+# Component id recorded for faults injected through the control socket.
+INJECTED_COMPONENT_ID = 'control'
+
+# Number of injections whose outcome is kept for get_injection().
+INJECTION_HISTORY = 1000
+
+# Optional hooks of a fault module.
+SETUP_HOOK = 'setup'
+TEARDOWN_HOOK = 'teardown'
+
+# Seconds between reports of the intensity profiles' rates.
+INTENSITY_REPORT_INTERVAL = 60
+
+# Checkpoints between reconciliations of the running daemons with the
+# components' states, so that effective windows and paused components
+# are applied (state transitions are applied at once).
+DAEMON_RECONCILE_INTERVAL = 10
+
+# Maximum time (seconds) to wait for the daemons to stop at shutdown.
+DAEMON_STOP_TIMEOUT = 10
+
 class Scheduler(threading.Thread):
 
-    def __init__(self, sut_config_filename, dryrun = False):
+    def __init__(self, sut_config_filename, dryrun = False, trace = None,
+                 profiler = None, snapshot = None, resume = False):
         """ Create Scheduler object.
             sut_config_filename: filename for the JSON configuration
                 file associated with the system under test
-            dryrun: if True, the event logic will not execute"""
-        self._sut = SystemUnderTest(sut_config_filename)
+            dryrun: if True, the event logic will not execute
+            trace: optional TraceWriter which records the Scheduler's
+                activity
+            profiler: optional Profiler which records the time spent in
+                each phase of the session
+            snapshot: optional SnapshotFile to which the session's state
+                is saved periodically and when the Scheduler stops
+            resume: if True, the session continues from the state saved
+                in the snapshot file"""
+        self._profiler = profiler
+        self._sut = SystemUnderTest(sut_config_filename, profiler)
 
         threading.Thread.__init__(
             self, name = "%s" % self._sut.get_system_name()
@@ -34,6 +92,28 @@ class Scheduler(threading.Thread):
         self._fault_module_name = self._sut.get_fault_module_name()
         self._stop = threading.Event()
         self._function_cache = {} # cache of callable objects (faults)
+        self._argument_cache = {} # fault name -> set of argument names
+        self._contexts = {} # target -> context from the setup hook
+        # In-flight index used to coalesce overlapping activations.  Maps
+        # (fault name, target) to [# of running workers, (Event instance,
+        # # of activations) of the queued rerun or None].
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._stats = FaultStats() # outcomes of fault function executions
+        self._daemons = DaemonSupervisor(self.run_daemon, dryrun)
+        self._membership = Queue.Queue() # MembershipChange instances not
+                                         # yet applied
+        self._injections = OrderedDict() # injection id -> Outcome; None
+                                         # while running
+        self._injectors = [] # worker threads of the injections
+        self._injection_count = 0
+        self._injection_lock = threading.Lock()
+        self._paused = threading.Event() # set while checkpoints are skipped
+        self._ticks = 0 # number of checkpoints
+        self._tick_duration = 0.0 # duration of the latest checkpoint
+        self._trace = trace
+        self._trace_pid = (trace.add_process(self._sut.get_system_name())
+                           if trace else None)
         try:
             # Load the fault injector module
             self._fault_module = self.get_fault_module()
@@ -43,27 +123,86 @@ class Scheduler(threading.Thread):
                 % (self._fault_module_name, err)
             ) 
 
+        self._snapshot = snapshot
+        if resume: self.restore_snapshot()
+        # After the restore, which may add components.
+        if not dryrun: self.setup_fault_module()
+
 
     def run(self):
         """ Entry point for threading.Thread (primary Scheduler thread)"""
+        if not self._profiler:
+            self.checkpoints()
+            return
+
+        self._profiler.run(self.checkpoints)
+        for line in self._profiler.report():
+            logging.info("Profile: %s" % line)
+
+
+    def checkpoints(self):
+        """ Runs a checkpoint every second until the Scheduler is
+            stopped, then stops the daemons and waits for the running
+            worker threads."""
         jobs = [] # holds currently running worker threads
+        daemons = self._sut.has_daemon_events()
+        reconcile = daemons # true if the daemons must be reconciled
         logging.info('Running')
+        next_checkpoint = time.time()
+        next_report = next_checkpoint + INTENSITY_REPORT_INTERVAL
+        if self._snapshot:
+            next_snapshot = next_checkpoint + self._snapshot.get_interval()
 
         while True:
             # Build list of worker threads that are still alive.
             jobs = [job for job in jobs if job.is_alive()]
 
+            if not self._membership.empty() and self.apply_membership():
+                daemons = self._sut.has_daemon_events()
+                reconcile = True
+
             if self._stop.isSet():
                 # Wait for all running worker threads to finish if
                 # we received a shutdown signal.
                 logging.info('Stopping ...')
+                if daemons: self._daemons.stop_all(DAEMON_STOP_TIMEOUT)
                 for job in jobs:
                     job.join() 
+                with self._injection_lock:
+                    injectors = list(self._injectors)
+                for job in injectors:
+                    job.join()
+                if not self._dryrun: self.teardown_fault_module()
+                if self._snapshot: self.save_snapshot()
+                for line in self._stats.report():
+                    logging.info("Fault stats: %s" % line)
+                for p in self._sut.get_intensity_profiles():
+                    logging.info("Intensity: %s" % format_rates(p.snapshot()))
                 return
 
+            if self._paused.isSet():
+                if self._daemons.is_running():
+                    self._daemons.reconcile({})
+                    reconcile = True
+                time.sleep(1)
+                next_checkpoint = time.time()
+                continue
+
             # Execute a checkpoint on the system under test and iterate
             # through all active events.
-            for e in self._sut.checkpoint():
+            start = time.time()
+            active_events = self._sut.checkpoint()
+            self._tick_duration = time.time() - start
+            self._ticks += 1
+            if self._trace:
+                self._trace.span(self._trace_pid, 'checkpoint', start,
+                                 self._tick_duration,
+                                 {'activated': len(active_events)})
+            if self._profiler:
+                self._profiler.add('checkpoint', self._tick_duration)
+                start = time.time()
+
+            for e in active_events:
                 # Get the fault injector callable object for the active event.
                 fault = None
                 try:
@@ -75,21 +214,63 @@ class Scheduler(threading.Thread):
                     )
                     continue
 
-                if self._dryrun:
-                    # CLI argument indicated a simulation run.
-                    logging.info("Dry run: %s (target:%s)" % (fault.__name__, 
-                                  e.select_component_target()))
-                else:
-                    # Launch a worker thread to run a fault injection call.
-                    p = threading.Thread(
-                        name = "%s-%s" % (self._fault_module_name,
-                                          fault.__name__),
-                        target = self.worker, args = (fault, e)
-                    )
-                    jobs.append(p) # add to list of active worker threads
-                    p.start()
-
-            time.sleep(1) # sleep for 1 second between checkpoints
+                if e.is_state_transition_event():
+                    reconcile = daemons
+                if self._trace and e.is_state_transition_event():
+                    self._trace.instant(self._trace_pid, 'state transition',
+                                        {'component_id': e.get_component_id(),
+                                         'event_id': e.get_event_id(),
+                                         'fault': e.get_fault()})
+
+                # Fan out events hit several targets at once; each target
+                # gets its own worker thread so they run in parallel.  The
+                # activations of a burst (poisson model) are dispatched
+                # as one batch per target.
+                for target, count in self.get_batches(e):
+                    if self._dryrun:
+                        # CLI argument indicated a simulation run.
+                        logging.info("Dry run: %s (target:%s)%s" 
+                                     % (fault.__name__, target,
+                                        ' x%d' % count if count > 1 else ''))
+                    elif self.acquire(fault, e, target, count):
+                        # Launch a worker thread to run a fault injection call.
+                        p = threading.Thread(
+                            name = "%s-%s" % (self._fault_module_name,
+                                              fault.__name__),
+                            target = self.worker,
+                            args = (fault, e, target, count)
+                        )
+                        jobs.append(p) # add to list of active worker threads
+                        p.start()
+
+            if self._profiler and active_events:
+                self._profiler.add('dispatch', time.time() - start)
+
+            if reconcile or (daemons and
+                             self._ticks % DAEMON_RECONCILE_INTERVAL == 0):
+                self.reconcile_daemons()
+                reconcile = False
+
+            if time.time() >= next_report:
+                next_report += INTENSITY_REPORT_INTERVAL
+                for p in self._sut.get_intensity_profiles():
+                    logging.info("Intensity: %s"
+                                 % format_rates(p.take_window()))
+
+            if self._snapshot and time.time() >= next_snapshot:
+                next_snapshot = time.time() + self._snapshot.get_interval()
+                self.save_snapshot()
+
+            # Checkpoints start 1 second apart however long they take, so
+            # that hazard rates (and intensity profiles) are applied at
+            # the modeled pace.  Checkpoints which are due while the
+            # previous one runs are skipped.
+            next_checkpoint += 1
+            delay = next_checkpoint - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_checkpoint = time.time()
             # End of infinite loop. 
 
 
@@ -99,23 +280,462 @@ class Scheduler(threading.Thread):
         self._stop.set()
 
 
-    def worker(self, func, args):
+    def pause(self):
+        """ Stop activating events until resume() is called.  Running
+            worker threads are not affected."""
+        self._paused.set()
+
+
+    def resume(self):
+        """ Resume activating events after pause()."""
+        self._paused.clear()
+
+
+    def is_paused(self):
+        """ returns: true if the Scheduler is paused"""
+        return self._paused.isSet()
+
+
+    def get_sut(self):
+        """ returns: SystemUnderTest instance of the Scheduler"""
+        return self._sut
+
+
+    def get_tick_stats(self):
+        """ returns: tuple (# of checkpoints, duration of the latest
+                checkpoint in seconds)"""
+        return (self._ticks, self._tick_duration)
+
+
+    def inject(self, func_name, target, udf1 = '', udf2 = '', udf3 = '',
+               udd = None):
+        """ Launches a worker thread which runs a fault function now,
+                bypassing the activation and probability models (and
+                coalescing).  A ValueError exception will be thrown if
+                the Scheduler is stopping.
+            func_name: name of the function in the fault injector module
+            target: target of the fault
+            udf1, udf2, udf3, udd: user defined fields for the fault
+            returns: id of the injection (see get_injection)"""
+        func = self.get_function(func_name)
+        if self._stop.isSet():
+            raise ValueError("system '%s' is stopping"
+                             % self._sut.get_system_name())
+
+        with self._injection_lock:
+            self._injection_count += 1
+            injection_id = self._injection_count
+            if len(self._injections) >= INJECTION_HISTORY:
+                self._injections.popitem(last = False)
+            self._injections[injection_id] = None
+            if self._dryrun:
+                logging.info("Dry run: %s (target:%s) injected" 
+                             % (func.__name__, target))
+                return injection_id
+
+            logging.info("Injecting %s (target:%s)"
+                         % (func.__name__, target))
+            p = threading.Thread(
+                name = "%s-%s" % (self._fault_module_name, func.__name__),
+                target = self.inject_worker,
+                args = (injection_id, func, target, udf1, udf2, udf3, udd)
+            )
+            self._injectors = [job for job in self._injectors
+                               if job.is_alive()]
+            self._injectors.append(p)
+            p.start()
+        return injection_id
+
+
+    def inject_worker(self, injection_id, func, target, udf1, udf2, udf3,
+                      udd):
+        """ Entry point for a worker thread running an injected fault.
+            injection_id: id returned by inject()
+            func: a callable function object from a fault injector module
+            target: target of the fault
+            udf1, udf2, udf3, udd: user defined fields for the fault"""
+        outcome = self.run_fault(func, target, INJECTED_COMPONENT_ID,
+                                 udf1, udf2, udf3, udd)
+        with self._injection_lock:
+            if injection_id in self._injections:
+                self._injections[injection_id] = outcome
+
+
+    def get_injection(self, injection_id):
+        """ A KeyError exception will be thrown if the injection is
+                unknown (or too old to be kept).
+            injection_id: id returned by inject()
+            returns: tuple (true if the injection has finished, Outcome
+                instance; None while it runs and for a dry run)"""
+        with self._injection_lock:
+            if injection_id not in self._injections:
+                raise KeyError("unknown injection %s" % injection_id)
+            outcome = self._injections[injection_id]
+        return (outcome is not None or self._dryrun, outcome)
+
+
+    def submit_membership(self, change):
+        """ Queues a change of the SUT's components, which is applied
+                at the next checkpoint; may be called by any thread.  A
+                ValueError exception will be thrown if the change is
+                invalid.
+            change: a MembershipChange instance"""
+        change.prepare(self._sut)
+        self._membership.put(change)
+
+
+    def apply_membership(self):
+        """ Applies the queued changes of the SUT's components.
+            returns: true if any change was applied"""
+        start = time.time()
+        applied = False
+        while True:
+            try:
+                change = self._membership.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                targets = change.apply(self._sut)
+            except (KeyError, ValueError) as err:
+                logging.info("error: membership %s- %s" % (change,
+                                                            err.args[0]))
+                change.finish(err.args[0])
+                continue
+            logging.info("Membership: %s" % change)
+            if targets and not self._dryrun: self.setup_targets(targets)
+            change.finish()
+            applied = True
+        if self._profiler: self._profiler.add('membership',
+                                              time.time() - start)
+        return applied
+
+
+    def save_snapshot(self):
+        """ Saves the state of the session to the snapshot file."""
+        start = time.time()
+        state = {
+            'saved': start,
+            'checkpoints': self._ticks,
+            'random': random.getstate(),
+            'sut': self._sut.get_state()
+        }
+        try:
+            self._snapshot.save(state)
+        except (IOError, OSError) as err:
+            logging.info("error: %s- %s" % (self._snapshot.get_path(),
+                                            err.strerror))
+        if self._profiler: self._profiler.add('snapshot', time.time() - start)
+
+
+    def restore_snapshot(self):
+        """ Restores the state of the session from the snapshot file.
+                Times are shifted by the time since the snapshot was
+                saved, as if the session had been paused.  An IOError
+                exception will be thrown if the file cannot be read and a
+                ValueError exception if it does not match the session."""
+        path = self._snapshot.get_path()
+        state = self._snapshot.load()
+        offset = time.time() - state['saved']
+        try:
+            self._sut.set_state(state['sut'], offset)
+        except (KeyError, TypeError, ValueError) as err:
+            raise ValueError("Invalid snapshot: %s" % (err.args[0] if
+                             isinstance(err, ValueError) else
+                             "missing or invalid %s" % err), path)
+        version, internal, gauss = state['random']
+        random.setstate((version, tuple(internal), gauss))
+        self._ticks = state['checkpoints']
+        logging.info("Resumed from %s (%d checkpoints, saved %.0fs ago)"
+                     % (path, self._ticks, offset))
+
+
+    def reconcile_daemons(self):
+        """ Starts the daemons of the components' current states and
+            stops the others."""
+        wanted = {}
+        for key, e in self._sut.get_daemon_events():
+            try:
+                wanted[key] = (self.get_function(e.get_fault()), e)
+            except AttributeError as err:
+                # Could not find the function in fault injector module.
+                logging.info("error: %s- %s" % (
+                    self._fault_module_name, err.args[0])
+                )
+        self._daemons.reconcile(wanted)
+
+
+    def run_daemon(self, func, event, target, stop_event):
+        """ Runs the fault function of a daemon until it returns; called
+                by the daemon's thread.
+            func: a callable function object from a fault injector module
+            event: the daemon's Event instance
+            target: target of the daemon
+            stop_event: threading.Event set when the daemon must stop
+            returns: an Outcome instance"""
+        return self.run_fault(func, target, event.get_component_id(),
+                              event.get_user_def_field_1(),
+                              event.get_user_def_field_2(),
+                              event.get_user_def_field_3(),
+                              event.get_user_def_dictionary(),
+                              stop_event = stop_event)
+
+
+    def get_daemon_supervisor(self):
+        """ returns: DaemonSupervisor instance running the SUT's
+                daemons"""
+        return self._daemons
+
+
+    def get_batches(self, event):
+        """ Selects the targets of each activation of an event.
+            event: the active Event instance
+            returns: list of tuples (target, # of activations)"""
+        count = event.get_activation_count()
+        if count == 1:
+            return [(t, 1) for t in event.select_component_targets()]
+        batches = Counter()
+        for _ in xrange(count):
+            batches.update(event.select_component_targets())
+        return batches.items()
+
+
+    def worker(self, func, args, target, count = 1):
         """ Entry point for a worker thread running a fault injection task.
             func: a callable function object from a fault injector module
             args: will contain the active Event instance
+            target: target selected for the activation
+            count: number of activations of the target
             """
-        logging.debug("Starting %s (id:%s) fault simulation" 
-                     % (func.__name__, args.get_component_id()))
+        while True:
+            try:
+                logging.debug("Starting %s (id:%s) fault simulation" 
+                             % (func.__name__, args.get_component_id()))
+
+                outcome = self.execute(func, args, target, count)
+
+                logging.debug("Completed %s (id:%s) fault simulation in "
+                              "%.3fs (%s: %s)" % (
+                                  func.__name__, args.get_component_id(),
+                                  outcome.duration,
+                                  'ok' if outcome.success else 'error',
+                                  outcome.summary))
+            finally:
+                # Run the activation queued while running, if any.
+                queued = self.release(func, target)
+            if queued is None: return
+            args, count = queued
+
+
+    def execute(self, func, event, target, count = 1):
+        """ Runs a fault function and records its outcome.  Exceptions
+                raised by the fault function are caught and reported.
+                Several activations are passed to a fault function with
+                a 'batch' argument in a single call, which is one
+                execution; other fault functions are called once per
+                activation.
+            func: a callable function object from a fault injector module
+            event: the active Event instance
+            target: target selected for the activation
+            count: number of activations of the target
+            returns: an Outcome instance (of the last call)"""
+        args = (func, target, event.get_component_id(),
+                event.get_user_def_field_1(), event.get_user_def_field_2(),
+                event.get_user_def_field_3(), event.get_user_def_dictionary())
+        if 'batch' in self.get_arguments(func):
+            return self.run_fault(*args, batch = count)
+        for _ in xrange(count - 1): self.run_fault(*args)
+        return self.run_fault(*args)
+
+
+    def run_fault(self, func, target, component_id, udf1, udf2, udf3, udd,
+                  batch = None, stop_event = None):
+        """ Calls a fault function and records its outcome.
+            func: a callable function object from a fault injector module
+            target: target of the fault
+            component_id: id of the component which activated the fault
+            udf1, udf2, udf3, udd: user defined fields for the fault
+            batch: number of activations passed to a fault function which
+                accepts a batch; None for other fault functions
+            stop_event: threading.Event passed to the fault function of a
+                daemon; None for other fault functions
+            returns: an Outcome instance"""
+        kwargs = {'target': target, 'udf1': udf1, 'udf2': udf2,
+                  'udf3': udf3, 'udd': udd}
+        if 'context' in self.get_arguments(func):
+            kwargs['context'] = self._contexts.get(target)
+        if batch is not None: kwargs['batch'] = batch
+        if stop_event is not None: kwargs['stop_event'] = stop_event
+        start = time.time()
+        try:
+            result = func(**kwargs)
+            success = True
+        except Exception as err:
+            result = err
+            success = False
+            logging.info("error: %s (target:%s)- %s: %s" % (
+                func.__name__, target, type(err).__name__, err)
+            )
+
+        outcome = Outcome(func.__name__, target, component_id,
+                          success, summarize(result), time.time() - start)
+        self._stats.record(outcome)
+        if self._profiler: self._profiler.add('worker', outcome.duration)
+        if self._trace:
+            args = {'target': target, 'component_id': component_id,
+                    'success': success, 'summary': outcome.summary}
+            if batch is not None: args['batch'] = batch
+            if stop_event is not None: args['daemon'] = True
+            self._trace.span(self._trace_pid, func.__name__, start,
+                             outcome.duration, args)
+
+        return outcome
+
+
+    def get_fault_stats(self):
+        """ returns: FaultStats instance with outcomes of all fault
+                function executions so far"""
+        return self._stats
+
+
+    def acquire(self, func, event, target, count = 1):
+        """ Applies the event's coalescing policy against the in-flight
+                index and registers the activation if it should run.
+            func: a callable function object from a fault injector module
+            event: the active Event instance
+            target: target selected for the activation
+            count: number of activations of the target
+            returns: true if a worker thread should be launched"""
+        key = (func.__name__, target)
+        policy = event.get_coalesce_policy()
+
+        with self._inflight_lock:
+            entry = self._inflight.get(key)
+            if entry is None:
+                self._inflight[key] = [1, None]
+                return True
+            if policy == SessionConfig.EVENT_COAL_ALWAYS:
+                entry[0] += 1
+                return True
+            if policy == SessionConfig.EVENT_COAL_QUEUE and not entry[1]:
+                entry[1] = (event, count)
+                logging.debug("Queued %s (target:%s) behind running worker"
+                              % key)
+                self.trace_coalesced('queued', func, event, target)
+                return False
+
+        logging.debug("Coalesced %s (target:%s) into running worker" % key)
+        self.trace_coalesced('coalesced', func, event, target)
+        return False
+
+
+    def trace_coalesced(self, name, func, event, target):
+        """ Records an activation which did not launch a worker thread.
+            name: 'queued' or 'coalesced'
+            func: a callable function object from a fault injector module
+            event: the active Event instance
+            target: target selected for the activation"""
+        if self._trace:
+            self._trace.instant(self._trace_pid, name,
+                                {'fault': func.__name__, 'target': target,
+                                 'component_id': event.get_component_id()})
+
+
+    def release(self, func, target):
+        """ Removes a completed activation from the in-flight index.
+            func: a callable function object from a fault injector module
+            target: target of the completed activation
+            returns: tuple (Event instance, # of activations) of the
+                activation queued while running, which should run next;
+                None if there is none"""
+        key = (func.__name__, target)
+
+        with self._inflight_lock:
+            entry = self._inflight[key]
+            queued = entry[1]
+            if queued:
+                entry[1] = None
+                return queued
+            entry[0] -= 1
+            if not entry[0]: del self._inflight[key]
+
+        return None
+
+
+    def get_arguments(self, func):
+        """ func: a callable function object from a fault injector module
+            returns: set of the function's named arguments, ie. 'batch'
+                (the number of activations it should inject at once) or
+                'context' (the target's context from the setup hook)"""
+        args = self._argument_cache.get(func.__name__)
+        if args is None:
+            try:
+                args = frozenset(inspect.getargspec(func).args)
+            except TypeError:
+                args = frozenset() # not a Python function
+            self._argument_cache[func.__name__] = args
+        return args
+
+
+    def setup_fault_module(self):
+        """ Calls the setup hook of the fault module, if it has one.  An
+                ImportError exception will be thrown if the hook fails."""
+        setup = getattr(self._fault_module, SETUP_HOOK, None)
+        if not hasattr(setup, "__call__"): return
+
+        start = time.time()
+        targets = self._sut.get_targets()
+        try:
+            contexts = setup(targets, self._sut.get_fault_config())
+        except Exception as err:
+            raise ImportError(
+                "Fault injector module '%s' setup failed: %s: %s"
+                % (self._fault_module_name, type(err).__name__, err)
+            )
+        if contexts is not None and not isinstance(contexts, dict):
+            raise ImportError(
+                "Fault injector module '%s' setup must return a dictionary"
+                " of contexts or None" % self._fault_module_name
+            )
+        self._contexts = contexts or {}
+        logging.info("Set up %s for %d targets (%d contexts) in %.3fs"
+                     % (self._fault_module_name, len(targets),
+                        len(self._contexts), time.time() - start))
+
+
+    def setup_targets(self, targets):
+        """ Calls the setup hook of the fault module, if it has one, for
+                the targets of added components which have no context.
+                Errors are logged.
+            targets: list of targets"""
+        setup = getattr(self._fault_module, SETUP_HOOK, None)
+        if not hasattr(setup, "__call__"): return
+
+        targets = [t for t in targets if t not in self._contexts]
+        if not targets: return
+        try:
+            contexts = setup(targets, self._sut.get_fault_config())
+        except Exception as err:
+            logging.info("error: %s.%s- %s: %s" % (
+                self._fault_module_name, SETUP_HOOK,
+                type(err).__name__, err)
+            )
+            return
+        if isinstance(contexts, dict): self._contexts.update(contexts)
 
-        func(target = args.select_component_target(), 
-             udf1 = args.get_user_def_field_1(),
-             udf2 = args.get_user_def_field_2(),
-             udf3 = args.get_user_def_field_3(),
-             udd = args.get_user_def_dictionary())
 
-        logging.debug("Completed %s (id:%s) fault simulation"
-                     % (func.__name__, args.get_component_id()))
-        return
+    def teardown_fault_module(self):
+        """ Calls the teardown hook of the fault module, if it has one."""
+        teardown = getattr(self._fault_module, TEARDOWN_HOOK, None)
+        if not hasattr(teardown, "__call__"): return
+
+        try:
+            teardown()
+        except Exception as err:
+            logging.info("error: %s.%s- %s: %s" % (
+                self._fault_module_name, TEARDOWN_HOOK,
+                type(err).__name__, err)
+            )
+        self._contexts = {}
 
 
     def get_fault_module(self):
@@ -125,11 +745,14 @@ class Scheduler(threading.Thread):
             raise ValueError("Invalid fault module name type '%s'"
                              % self._fault_module_name)
 
+        # Fault modules may import helper modules from the same directory.
+        if FAULT_PKG not in sys.path: sys.path.append(FAULT_PKG)
+
         f, f_name, desc = imp.find_module(self._fault_module_name, [FAULT_PKG])
 
         try:
-            fault_module = imp.load_module(f_name, f, 
-                                           self._fault_module_name, desc)
+            fault_module = imp.load_module(self._fault_module_name, f,
+                                           f_name, desc)
         finally:
             if f: f.close()
 
@@ -137,15 +760,39 @@ class Scheduler(threading.Thread):
 
 
     def get_function(self, func_name):
-        """ Retrieves the fault injector function.
+        """ Retrieves the fault injector function.  The hooks, private
+                (underscore) names and classes of the module are not
+                fault functions; an AttributeError exception will be
+                thrown for them as for missing names.
             func_name: name of the function
             returns: a callable function"""
         func = self._function_cache.get(func_name, None)
 
         if func is None:
+            if func_name in (SETUP_HOOK, TEARDOWN_HOOK) or \
+                    func_name.startswith('_'):
+                raise AttributeError("'%s' is not a fault function"
+                                     % func_name)
             func = getattr(self._fault_module, func_name)
-            if not hasattr(func, "__call__"):
-                raise AttributeError()
+            if not hasattr(func, "__call__") or \
+                    inspect.isclass(func):
+                raise AttributeError("'%s' is not a fault function"
+                                     % func_name)
             self._function_cache[func_name] = func
 
         return func
+
+
+def find_scheduler(schedulers, sut):
+    """ Finds the Scheduler of a SUT.  A KeyError exception will be thrown
+            if there is no such SUT.
+        schedulers: list of Scheduler instances
+        sut: system name or index of a SUT; None for the only SUT
+        returns: the SUT's Scheduler"""
+    if sut is None:
+        if len(schedulers) == 1: return schedulers[0]
+        raise KeyError("a SUT must be given")
+    for i, s in enumerate(schedulers):
+        if str(sut) == str(i) or sut == s.get_sut().get_system_name():
+            return s
+    raise KeyError("unknown SUT '%s'" % sut)
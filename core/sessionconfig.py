@@ -15,6 +15,7 @@ contents.
 """
 
 from collections import namedtuple
+from collections import OrderedDict
 # Ideally we would use simplejson, but is it available
 # on every Python 2.7.x installation?
 # import simplejson as json
@@ -22,13 +23,23 @@ import json
 import os
 import sys
 
+from intensity import create_profile
+from rangepattern import RangePattern
+
 # JSON config file key names.
 SYSTEM_NAME = 'system_name'
 FAULT_MODULE = 'fault_module'
+FAULT_CONFIG = 'fault_config' # optional dictionary for the fault module's
+                              # setup hook
+INTENSITY = 'intensity' # optional session intensity profile (intensity.py)
 COMPONENTS = 'components'
 COMPONENT_ID = 'id'
 COMPONENT_ACTIVE = 'active'  # [true|false] component ignored if false
 COMPONENT_TARGETS = 'targets'
+COMPONENT_WEIGHTS = 'target_weights' # optional selection weight per target
+COMPONENT_FAMILY = 'family' # [true|false] id and targets are range patterns
+                            # (ie. 'vm[0-4999]') expanded to one component
+                            # per value of the id range
 OPERABLE_EVENTS = 'operable_events'
 NONOPERABLE_EVENTS = 'nonoperable_events'
 
@@ -38,8 +49,11 @@ EVENT_FAULT = 'fault'
 EVENT_STATE_TRANS = 'state_transition' # [true|false] event causes a state
                                        # transition of the SystemComponent
 EVENT_ACTIVATION_MODEL = 'a_model'
-EVENT_PROB_MODEL = 'p_model' # not required for fixed activation model
+EVENT_PROB_MODEL = 'p_model' # not required for daemon and triggered
+                             # activation models
 EVENT_MTTF = 'mttf' # required for all probability models except random
+                    # and poisson
+EVENT_RATE = 'rate' # activations per second for poisson probability model
 EVENT_THRESHOLD = 'threshold' # minimum wait time before event occurs
 EVENT_EFF_START = 'effective_start' # optionally used to sequence events
 EVENT_EFF_END = 'effective_end' # optionally used to sequence events
@@ -51,6 +65,24 @@ EVENT_UDF1 = 'udf1' # optional user defined field
 EVENT_UDF2 = 'udf2' # optional user defined field
 EVENT_UDF3 = 'udf3' # optional user defined field
 EVENT_UDD = 'udd' # optional user defined field as dictionary
+EVENT_FAN_OUT = 'fan_out' # number of targets (or 'all') hit per activation
+EVENT_COALESCE = 'coalesce' # policy for activations of a fault which is
+                            # still running against the same target
+EVENT_TICK = 'tick' # seconds between evaluations of a hazard p_model
+EVENT_INTENSITY = 'intensity' # intensity profile overriding the session's
+EVENT_TRIGGER = 'trigger' # source of a triggered event:
+                          # {"component": id, "event": id, "delay": s}
+TRIGGER_COMPONENT = 'component'
+TRIGGER_EVENT = 'event'
+TRIGGER_DELAY = 'delay' # seconds after the source event (default 0)
+
+# Activation/probability attributes of an event.
+ModelType = namedtuple(
+    'ModelType', 
+    'fault state_trans a_model p_model mttf thrld eff_s eff_e sd'
+    ' shape r_range r_w_type udf1 udf2 udf3 udd coalesce fan_out tick'
+    ' intensity rate trigger'
+)
 
 
 class SessionConfig(object):
@@ -58,6 +90,9 @@ class SessionConfig(object):
     # All possible activation models.
     EVENT_AMOD_RECUR = 'recurring'
     EVENT_AMOD_SINGLE = 'singular'
+    EVENT_AMOD_DAEMON = 'daemon' # runs while the component is in the
+                                 # event's state (see daemon.py)
+    EVENT_AMOD_TRIGGERED = 'triggered' # activated after another event
 
     # All possible probability models.
     EVENT_PMOD_EXP = 'exponential' # hazard rate function
@@ -65,16 +100,59 @@ class SessionConfig(object):
     EVENT_PMOD_WEI = 'weibull' # hazard rate function
     EVENT_PMOD_RANDOM = 'random' # uniformly distributed probability
     EVENT_PMOD_DETER = 'deterministic' # no random variable 
+    EVENT_PMOD_POISSON = 'poisson' # any number of activations per tick
 
     # All possible random probability model windows.
     EVENT_RAND_SLIDE = 'sliding'
     EVENT_RAND_FIXED = 'fixed'
 
-    def __init__(self, session_config_file):
-        """ Create SessionConfig object.
-            session_config_file: name of the configuration file"""
+    # All possible coalescing policies for overlapping activations.
+    EVENT_COAL_ALWAYS = 'always' # always launch a new worker
+    EVENT_COAL_SKIP = 'skip' # drop the activation
+    EVENT_COAL_QUEUE = 'queue' # rerun once after the running worker ends
+
+    # Fan out value for activations which hit every target.
+    EVENT_FAN_ALL = 'all'
+
+    def __init__(self, session_config_file, component = None,
+                 intensity = None, profiles = None):
+        """ Create SessionConfig object.  The file is parsed one component
+                at a time; only compact per-component structures are kept
+                rather than the whole JSON document.
+            session_config_file: name of the configuration file
+            component: optional component dictionary (ie. a component
+                added at runtime, see membership.py) which is loaded
+                instead of the file; session_config_file then only names
+                its source in error messages.  Its triggers are not
+                validated.
+            intensity: IntensityProfile of the session, for a component
+            profiles: dictionary of the session's intensity profiles (see
+                get_profile_index), for a component; identical profiles
+                of its events are shared and new ones are added"""
         self._file_name = session_config_file
-        self._json_data = None
+        self._system_name = None
+        self._fault_module = None
+        self._fault_config = {}
+        self._components = None # list of tuples:
+                                # (id, targets, weights, family)
+        self._events = {} # component id -> ([operable], [nonoperable])
+                          # lists of tuples: (event id, # of instances)
+        self._models = {} # (component id, event id) -> ModelType
+        self._model_cache = {} # frozen event attributes -> shared ModelType
+        self._intensity = None # IntensityProfile of the session
+        self._profiles = OrderedDict() # frozen intensity -> shared
+                                       # IntensityProfile, in file order
+
+        if component is not None:
+            self._components = []
+            self._intensity = intensity
+            if profiles is not None: self._profiles = profiles
+            self._add_component(component)
+            if not self._components:
+                raise ValueError("Component must be active",
+                                 self._file_name)
+            self._model_cache = None
+            return
 
         f = None
         if session_config_file is '-':
@@ -83,8 +161,9 @@ class SessionConfig(object):
             f = open(session_config_file)
 
         try:
-            self._json_data = json.load(f)
+            self._load(_JSONStream(f))
         except ValueError as err:
+            if len(err.args) > 1: raise # validation error
             # With simplejson, err will have more detailed error
             # info.  Also, it has the JSONDecodeError class.
             # But can be count on simplejson being installed?
@@ -93,77 +172,64 @@ class SessionConfig(object):
         finally:
             if session_config_file is not '-': f.close()
 
+        self._validate_triggers()
+        self._model_cache = None # only needed while loading
+
 
     def get_system_name(self):
         """ returns: name of the system under test"""
-        try:
-            return self._json_data[SYSTEM_NAME]
-        except KeyError:
+        if self._system_name is None:
             raise ValueError("Missing '%s' value" % SYSTEM_NAME,
                              self._file_name)
+        return self._system_name
 
 
     def get_fault_module_name(self):
         """ returns: name of the fault injector module for the system"""
-        fault_module_name = None
-        try:
-            s = self._json_data[FAULT_MODULE]
-            if not isinstance(s, basestring):
-                raise ValueError("Invalid fault module name type '%s'"
-                                 % s, self._file_name)
-            fault_module_name = s[:-3] if s.endswith('.py') else s 
-        except KeyError:
+        s = self._fault_module
+        if s is None:
             raise ValueError("Missing '%s' value" % FAULT_MODULE,
                              self._file_name)
+        if not isinstance(s, basestring):
+            raise ValueError("Invalid fault module name type '%s'"
+                             % s, self._file_name)
 
-        return fault_module_name
+        return s[:-3] if s.endswith('.py') else s 
 
 
-    def get_active_components(self):
-        """ returns: list of component tuples (id, list of targets) 
-                     which are marked as active"""
-        components = list() # list of tuples: (id, list of targets)
-        try:
-            for c in self._json_data[COMPONENTS]:
-                if COMPONENT_ID not in c:
-                    raise ValueError("Missing '%s' value in '%s' List"
-                                     % (COMPONENT_ID, COMPONENTS), 
-                                     self._file_name)
-                if COMPONENT_TARGETS not in c:
-                    raise ValueError("Missing '%s' value in '%s' List"
-                                     % (COMPONENT_TARGETS, COMPONENTS), 
-                                     self._file_name)
-                if not isinstance(c[COMPONENT_TARGETS], list):
-                    raise ValueError("'%s' must be mapped to type List" 
-                                     % COMPONENT_TARGETS, self._file_name)
-                if COMPONENT_ACTIVE not in c:
-                    raise ValueError("Missing '%s' value in '%s' List"
-                                     % (COMPONENT_ACTIVE, COMPONENTS), 
-                                     self._file_name)
-                if type(c[COMPONENT_ACTIVE]) is not bool:
-                    raise ValueError("Invalid '%s' data type" 
-                                     % COMPONENT_ACTIVE, 
-                                     self._file_name)
-                
-                if c[COMPONENT_ACTIVE]: 
-                    c_id = c[COMPONENT_ID]
-                    c_targets = c[COMPONENT_TARGETS]
+    def get_fault_config(self):
+        """ returns: dictionary passed to the setup hook of the fault
+                module; empty if not configured"""
+        return self._fault_config
 
-                    if not c_targets:
-                        raise ValueError("Invalid '%s' value (empty List)" 
-                                         % COMPONENT_TARGETS, self._file_name) 
 
-                    components.append((c_id, c_targets)) 
+    def get_intensity(self):
+        """ returns: IntensityProfile instance of the session; None if
+                the hazard rates are not scaled"""
+        return self._intensity
 
-        except KeyError:
-            if COMPONENTS not in self._json_data:
-                raise ValueError("Missing '%s' value" % COMPONENTS,
-                                 self._file_name)
-        except TypeError:
-            raise ValueError("'%s' must be mapped to List" % COMPONENTS,
-                             self._file_name)
 
-        return components
+    def get_intensity_profiles(self):
+        """ returns: list of all IntensityProfile instances, the session's
+                and the events'"""
+        return self._profiles.values()
+
+
+    def get_profile_index(self):
+        """ returns: OrderedDict mapping each distinct intensity value to
+                its shared IntensityProfile instance"""
+        return self._profiles
+
+
+    def get_active_components(self):
+        """ returns: list of component tuples (id, list of targets,
+                     list of target weights or None, family) which are
+                     marked as active.  If family is true, the id and
+                     targets are range patterns for a component family."""
+        if self._components is None:
+            raise ValueError("Missing '%s' value" % COMPONENTS,
+                             self._file_name)
+        return self._components
 
 
     def get_events_for_component(self, component_id, operable = True):
@@ -172,51 +238,147 @@ class SessionConfig(object):
                       false for nonoperable events
             returns list of event tuples (id, # of instances)
                     for the component and operable state"""
-        events = list() # list of tuples: (id, # of instances)
-        event_type = OPERABLE_EVENTS if operable else NONOPERABLE_EVENTS 
-
-        for c in self._json_data[COMPONENTS]:
-            try:
-                if (c[COMPONENT_ID] == component_id and event_type in c):
-                    for e in c[event_type]:
-                        event_id = e[EVENT_ID]
-                        instances = (e[EVENT_INSTANCES] 
-                                     if EVENT_INSTANCES in e
-                                     else 1)
-
-                        if type(instances) is not int or instances < 0:
-                            raise ValueError("Invalid '%s' value" 
-                                             % EVENT_INSTANCES, 
-                                             self._file_name) 
-
-                        events.append((event_id, instances))
-                    
-            except KeyError:
-                raise ValueError("Missing '%s' value for event" % EVENT_ID,
-                                 self._file_name)
-            except TypeError:
-                raise ValueError("Events must be mapped to dictionary",
-                                 self._file_name)
-
-        return events
+        events = self._events.get(component_id)
+        if events is None: return []
+        return events[0] if operable else events[1]
 
 
     def get_model_for_event(self, component_id, event_id):
         """ component_id: id of a component
             event_id: id of an event configured for the component
-            returns: a namedtuple instance with all activation/probability
-                attributes for the event"""
-        ModelType = namedtuple(
-            'ModelType', 
-            'fault state_trans a_model p_model mttf thrld eff_s eff_e sd'
-            ' shape r_range r_w_type udf1 udf2 udf3 udd'
-        )
-
-        e = self._get_event_config_for_component(component_id, event_id)
-
-        if not isinstance(e, dict):
-            raise ValueError("Event must be mapped to type Dictionary", 
+            returns: a ModelType namedtuple instance with all 
+                activation/probability attributes for the event.  Events
+                with identical attributes share the same instance."""
+        try:
+            return self._models[(component_id, event_id)]
+        except KeyError:
+            raise ValueError("Event %s must be mapped to type Dictionary" 
+                             % event_id, self._file_name)
+
+
+    def _load(self, stream):
+        """ Reads the top level of the configuration document.  Components
+                are decoded and validated one at a time.
+            stream: a _JSONStream instance"""
+        for key in stream.iter_object():
+            if key == COMPONENTS:
+                self._components = []
+                if stream.peek() != '[':
+                    stream.decode_value()
+                    raise ValueError("'%s' must be mapped to List" 
+                                     % COMPONENTS, self._file_name)
+                for c in stream.iter_array():
+                    self._add_component(c)
+            elif key == SYSTEM_NAME:
+                self._system_name = stream.decode_value()
+            elif key == FAULT_MODULE:
+                self._fault_module = stream.decode_value()
+            elif key == FAULT_CONFIG:
+                self._fault_config = stream.decode_value()
+                if not isinstance(self._fault_config, dict):
+                    raise ValueError("'%s' must be mapped to type "
+                                     "Dictionary" % FAULT_CONFIG,
+                                     self._file_name)
+            elif key == INTENSITY:
+                self._intensity = self._get_intensity(stream.decode_value(),
+                                                      INTENSITY)
+            else:
+                stream.decode_value() # not used
+
+
+    def _add_component(self, c):
+        """ Validates a component and, if it is active, adds it and its
+                events to the compact runtime structures.
+            c: component dictionary as read from the JSON file"""
+        if not isinstance(c, dict):
+            raise ValueError("'%s' must be mapped to List of dictionaries"
+                             % COMPONENTS, self._file_name)
+        if COMPONENT_ID not in c:
+            raise ValueError("Missing '%s' value in '%s' List"
+                             % (COMPONENT_ID, COMPONENTS), 
+                             self._file_name)
+        if COMPONENT_TARGETS not in c:
+            raise ValueError("Missing '%s' value in '%s' List"
+                             % (COMPONENT_TARGETS, COMPONENTS), 
+                             self._file_name)
+        if not isinstance(c[COMPONENT_TARGETS], list):
+            raise ValueError("'%s' must be mapped to type List" 
+                             % COMPONENT_TARGETS, self._file_name)
+        if COMPONENT_ACTIVE not in c:
+            raise ValueError("Missing '%s' value in '%s' List"
+                             % (COMPONENT_ACTIVE, COMPONENTS), 
                              self._file_name)
+        if type(c[COMPONENT_ACTIVE]) is not bool:
+            raise ValueError("Invalid '%s' data type" 
+                             % COMPONENT_ACTIVE, 
+                             self._file_name)
+
+        if not c[COMPONENT_ACTIVE]: return
+
+        c_id = c[COMPONENT_ID]
+        c_targets = c[COMPONENT_TARGETS]
+
+        if not c_targets:
+            raise ValueError("Invalid '%s' value (empty List)" 
+                             % COMPONENT_TARGETS, self._file_name) 
+
+        c_weights = c.get(COMPONENT_WEIGHTS)
+        if c_weights is not None:
+            self._validate_target_weights(c_weights, c_targets)
+
+        c_family = c.get(COMPONENT_FAMILY, False)
+        if type(c_family) is not bool:
+            raise ValueError("Invalid '%s' data type" % COMPONENT_FAMILY,
+                             self._file_name)
+        if c_family: self._validate_family(c_id, c_targets)
+
+        self._components.append((c_id, c_targets, c_weights, c_family)) 
+
+        events = self._events.setdefault(c_id, ([], []))
+        self._add_events(c_id, c.get(OPERABLE_EVENTS, []), events[0])
+        self._add_events(c_id, c.get(NONOPERABLE_EVENTS, []), events[1])
+
+
+    def _add_events(self, component_id, event_configs, events):
+        """ Validates the events of a component for one state.
+            component_id: id of the component
+            event_configs: list of event dictionaries as read from the
+                JSON file
+            events: list of tuples (id, # of instances) to append to"""
+        try:
+            for e in event_configs:
+                event_id = e[EVENT_ID]
+                instances = (e[EVENT_INSTANCES] 
+                             if EVENT_INSTANCES in e
+                             else 1)
+
+                if type(instances) is not int or instances < 0:
+                    raise ValueError("Invalid '%s' value" 
+                                     % EVENT_INSTANCES, 
+                                     self._file_name) 
+
+                events.append((event_id, instances))
+                if (component_id, event_id) not in self._models:
+                    self._models[(component_id, event_id)] = (
+                        self._get_model(event_id, e))
+
+        except KeyError:
+            raise ValueError("Missing '%s' value for event" % EVENT_ID,
+                             self._file_name)
+        except TypeError:
+            raise ValueError("Events must be mapped to dictionary",
+                             self._file_name)
+
+
+    def _get_model(self, event_id, e):
+        """ event_id: id of the event
+            e: event dictionary as read from the JSON file
+            returns: a validated ModelType instance; shared with all
+                previous events which have identical attributes"""
+        key = tuple(sorted((k, _freeze(v)) for k, v in e.items()
+                           if k != EVENT_ID and k != EVENT_INSTANCES))
+        event = self._model_cache.get(key)
+        if event is not None: return event
 
         if EVENT_FAULT not in e:
             raise ValueError("Missing '%s' value for event %s" % 
@@ -245,25 +407,114 @@ class SessionConfig(object):
                           e[EVENT_UDF1] if EVENT_UDF1 in e else '',
                           e[EVENT_UDF2] if EVENT_UDF2 in e else '',
                           e[EVENT_UDF3] if EVENT_UDF3 in e else '',
-                          e[EVENT_UDD] if EVENT_UDD in e else None)
+                          e[EVENT_UDD] if EVENT_UDD in e else None,
+                          e[EVENT_COALESCE] if EVENT_COALESCE in e
+                              else self.EVENT_COAL_ALWAYS,
+                          e[EVENT_FAN_OUT] if EVENT_FAN_OUT in e else 1,
+                          e[EVENT_TICK] if EVENT_TICK in e else 1,
+                          self._get_intensity(e[EVENT_INTENSITY],
+                                              "%s for event %s" %
+                                              (EVENT_INTENSITY, event_id))
+                              if EVENT_INTENSITY in e else None,
+                          e[EVENT_RATE] if EVENT_RATE in e else 1,
+                          self._get_trigger(e[EVENT_TRIGGER], event_id)
+                              if EVENT_TRIGGER in e else None)
 
         # Validate model
         self._validate_event_model(event)
 
+        self._model_cache[key] = event
         return event
 
 
-    def _get_event_config_for_component(self, component_id, event_id):
-        """ component_id: id of a component
-            event_id: id of an event configured for the component
-            returns: a dictionary instance with all activation/probability
-                attributes for the event as read directly from JSON file"""
-        for c in self._json_data[COMPONENTS]:
-            if c[COMPONENT_ID] == component_id:
-                for e in c[OPERABLE_EVENTS]:
-                    if (e[EVENT_ID] == event_id): return e
-                for e in c[NONOPERABLE_EVENTS]:
-                    if (e[EVENT_ID] == event_id): return e
+    def _get_intensity(self, spec, name):
+        """ spec: intensity value as read from the JSON file
+            name: description of the value for error messages
+            returns: a validated IntensityProfile instance; shared with all
+                previous identical values"""
+        key = _freeze(spec)
+        profile = self._profiles.get(key)
+        if profile is not None: return profile
+        try:
+            profile = create_profile(spec)
+        except ValueError as err:
+            raise ValueError("Invalid %s: %s" % (name, err.args[0]),
+                             self._file_name)
+        self._profiles[key] = profile
+        return profile
+
+
+    def _get_trigger(self, spec, event_id):
+        """ spec: trigger dictionary as read from the JSON file
+            event_id: id of the triggered event
+            returns: tuple (source component id, source event id, delay)"""
+        if (not isinstance(spec, dict) or TRIGGER_COMPONENT not in spec or
+                TRIGGER_EVENT not in spec):
+            raise ValueError("'%s' of event %s must be mapped to a "
+                             "dictionary with '%s' and '%s' values" %
+                             (EVENT_TRIGGER, event_id, TRIGGER_COMPONENT,
+                              TRIGGER_EVENT), self._file_name)
+        delay = spec.get(TRIGGER_DELAY, 0)
+        if type(delay) not in (float, int) or delay < 0:
+            raise ValueError("Invalid %s value '%s'" % (TRIGGER_DELAY, delay),
+                             self._file_name)
+        return (spec[TRIGGER_COMPONENT], spec[TRIGGER_EVENT], delay)
+
+
+    def _validate_triggers(self):
+        """ Validates the sources of the triggered events once every
+                component is loaded.  A ValueError exception will be
+                thrown for a source which is not an event of an active
+                component."""
+        for (c_id, e_id), m in self._models.items():
+            if m.trigger is None: continue
+            source = self._models.get(m.trigger[:2])
+            if source is None or source.a_model == self.EVENT_AMOD_DAEMON:
+                raise ValueError("Invalid %s of event %s: no event %s of "
+                                 "active component '%s'" %
+                                 (EVENT_TRIGGER, e_id, m.trigger[1],
+                                  m.trigger[0]), self._file_name)
+
+
+    def _validate_family(self, family_id, targets):
+        """ Validates the id and target patterns of a component family.  A
+                ValueError exception will be thrown for invalid patterns.
+            family_id: id pattern of the family
+            targets: list of target patterns"""
+        try:
+            if not isinstance(family_id, basestring):
+                raise ValueError("type must be string")
+            count = RangePattern(family_id).get_count()
+            if count is None:
+                raise ValueError("a range such as '[0-9]' is required")
+            for t in targets:
+                if not isinstance(t, basestring):
+                    raise ValueError("target '%s' must be a string" % t)
+                t_count = RangePattern(t).get_count()
+                if t_count is not None and t_count != count:
+                    raise ValueError("target '%s' must have %d values"
+                                     % (t, count))
+        except ValueError as err:
+            raise ValueError("Invalid %s '%s': %s" % 
+                             (COMPONENT_FAMILY, family_id, err.args[0]),
+                             self._file_name)
+
+
+    def _validate_target_weights(self, weights, targets):
+        """ Validates the target weights of a component.  A ValueError
+                exception will be thrown for invalid weights.
+            weights: list of target weights
+            targets: list of targets"""
+        if not isinstance(weights, list) or len(weights) != len(targets):
+            raise ValueError("'%s' must be mapped to a List with one value"
+                             " per target" % COMPONENT_WEIGHTS,
+                             self._file_name)
+
+        for w in weights:
+            if type(w) not in (float, int) or w <= 0:
+                raise ValueError("Invalid %s value '%s'" %
+                                 (COMPONENT_WEIGHTS, w),
+                                 self._file_name)
 
 
     def _validate_event_model(self, e):
@@ -277,17 +528,39 @@ class SessionConfig(object):
 
         # Validate activation model value
         if not (e.a_model == self.EVENT_AMOD_RECUR or 
-            e.a_model == self.EVENT_AMOD_SINGLE):
+            e.a_model == self.EVENT_AMOD_SINGLE or
+            e.a_model == self.EVENT_AMOD_DAEMON or
+            e.a_model == self.EVENT_AMOD_TRIGGERED):
             raise ValueError("Invalid %s value '%s'" % 
                              (EVENT_ACTIVATION_MODEL, e.a_model),
                              self._file_name)
 
-        # Validate probability model value
-        if not (e.p_model == self.EVENT_PMOD_EXP or
+        # Triggered events, and only they, have a trigger.
+        if (e.a_model == self.EVENT_AMOD_TRIGGERED) != (e.trigger is not None):
+            raise ValueError("'%s' is required for, and only for, %s '%s'" % 
+                             (EVENT_TRIGGER, EVENT_ACTIVATION_MODEL,
+                              self.EVENT_AMOD_TRIGGERED),
+                             self._file_name)
+
+        # Daemons are started and stopped by state transitions; they
+        # cannot cause one.
+        if e.a_model == self.EVENT_AMOD_DAEMON and e.state_trans:
+            raise ValueError("Invalid '%s' value for %s '%s'" % 
+                             (EVENT_STATE_TRANS, EVENT_ACTIVATION_MODEL,
+                              e.a_model),
+                             self._file_name)
+
+        # Validate probability model value; daemons and triggered events
+        # do not have one.
+        if not ((e.p_model == '' and
+                 (e.a_model == self.EVENT_AMOD_DAEMON or
+                  e.a_model == self.EVENT_AMOD_TRIGGERED)) or
+            e.p_model == self.EVENT_PMOD_EXP or
             e.p_model == self.EVENT_PMOD_NORM or
             e.p_model == self.EVENT_PMOD_WEI or
             e.p_model == self.EVENT_PMOD_RANDOM or
-            e.p_model == self.EVENT_PMOD_DETER):
+            e.p_model == self.EVENT_PMOD_DETER or
+            e.p_model == self.EVENT_PMOD_POISSON):
             raise ValueError("Invalid %s value '%s'" % 
                              (EVENT_PROB_MODEL, e.p_model),
                              self._file_name)
@@ -299,12 +572,33 @@ class SessionConfig(object):
                              (EVENT_RAND_W_TYPE, e.r_w_type),
                              self._file_name)
 
+        # Validate coalescing policy value
+        if not (e.coalesce == self.EVENT_COAL_ALWAYS or
+            e.coalesce == self.EVENT_COAL_SKIP or
+            e.coalesce == self.EVENT_COAL_QUEUE):
+            raise ValueError("Invalid %s value '%s'" % 
+                             (EVENT_COALESCE, e.coalesce),
+                             self._file_name)
+
+        # Validate fan out
+        if not (e.fan_out == self.EVENT_FAN_ALL or
+            (type(e.fan_out) is int and e.fan_out > 0)):
+            raise ValueError("Invalid %s value '%s'" % 
+                             (EVENT_FAN_OUT, e.fan_out),
+                             self._file_name)
+
         # Validate mttf
         if type(e.mttf) is not int or e.mttf <= 0:
             raise ValueError("Invalid %s value '%s'" %
                              (EVENT_MTTF, e.mttf),
                               self._file_name) 
 
+        # Validate rate
+        if type(e.rate) not in (float, int) or e.rate <= 0:
+            raise ValueError("Invalid %s value '%s'" %
+                             (EVENT_RATE, e.rate),
+                              self._file_name) 
+
         # Validate threshold
         if type(e.thrld) is not int or e.thrld < 0:
             raise ValueError("Invalid %s value '%s'" %
@@ -340,3 +634,125 @@ class SessionConfig(object):
             raise ValueError("Invalid %s value '%s'" %
                              (EVENT_RAND_RANGE, e.r_range),
                               self._file_name) 
+
+        # Validate tick
+        if type(e.tick) is not int or e.tick <= 0:
+            raise ValueError("Invalid %s value '%s'" %
+                             (EVENT_TICK, e.tick),
+                              self._file_name) 
+
+
+def _freeze(value):
+    """ value: a decoded JSON value
+        returns: a hashable equivalent of the value"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return ('[]',) + tuple(_freeze(v) for v in value)
+    return (type(value).__name__, value)
+
+
+class _JSONStream(object):
+    """ Incremental reader for a JSON document.  Values are decoded one
+        at a time from a buffer which is refilled from the file as
+        needed, so that a large array (ie. the components) can be
+        processed element by element without holding the whole document
+        in memory."""
+
+    _WHITESPACE = ' \t\n\r'
+
+    def __init__(self, f, chunk_size = 65536):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ''
+        self._pos = 0 # position of the next character in _buf
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+
+    def peek(self):
+        """ returns: the next non whitespace character; empty at end of
+                file"""
+        while True:
+            while (self._pos < len(self._buf) and 
+                    self._buf[self._pos] in self._WHITESPACE):
+                self._pos += 1
+            if self._pos < len(self._buf): return self._buf[self._pos]
+            if not self._fill(self._chunk_size): return ''
+
+
+    def decode_value(self):
+        """ returns: the next complete JSON value"""
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number which ends the buffer may continue in the file.
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._eof: raise
+            # The value is incomplete; read more (doubling the read size
+            # so that large values are not re-parsed too often).
+            self._fill(size)
+            size *= 2
+
+
+    def iter_object(self):
+        """ Iterates over the members of the next JSON object.  The
+                caller must consume each member's value before advancing.
+            yields: member names"""
+        self._expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"': self._error('property name')
+            key = self.decode_value()
+            self._expect(':')
+            yield key
+            if self._expect(',}') == '}': return
+
+
+    def iter_array(self):
+        """ Iterates over the elements of the next JSON array.
+            yields: decoded elements"""
+        self._expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            if self._expect(',]') == ']': return
+
+
+    def _expect(self, chars):
+        """ Consumes the next non whitespace character.
+            chars: the characters which are valid
+            returns: the character"""
+        c = self.peek()
+        if not c or c not in chars:
+            self._error(' or '.join("'%s'" % ch for ch in chars))
+        self._pos += 1
+        return c
+
+
+    def _fill(self, size):
+        """ Appends up to size characters from the file to the buffer,
+                dropping the characters already consumed.
+            returns: false at end of file"""
+        if self._eof: return False
+        data = self._f.read(size)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+
+    def _error(self, expected):
+        raise ValueError("Expecting %s: '%s'" 
+                         % (expected, self._buf[self._pos:self._pos + 20]))
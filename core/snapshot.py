@@ -0,0 +1,141 @@
+"""
+
+snapshot.py: Contains the SnapshotFile class.
+
+A Scheduler periodically saves the runtime state of its session to a
+snapshot file so that the session can be resumed (dtest-controller.py
+--resume) after the controller restarts, instead of starting over:
+
+    - the state, life start time, time of the last event and pause flag
+      of every component (and family member)
+    - the executed flag, random model window and tick countdown of every
+      event
+    - the start time and counts of the intensity profiles
+    - the activations of triggered events which are scheduled
+    - the components added and removed while the session ran (see
+      membership.py)
+    - the state of the random number generator
+
+Times are saved as they are.  On resume every time is shifted by the
+time between the snapshot and the resume, so the session continues as
+if it had been paused: elapsed lives, effective windows and the elapsed
+times of the models carry on where they left off.  Daemons are started
+again from the restored states.  Fault functions which were running are
+not resumed.  The random number generator is shared by all the SUTs of
+a controller, so with several SUTs the last one restored sets it.
+
+The file is JSON.  It is written to a temporary file which is flushed
+to disk and renamed over the previous snapshot, so a crash while saving
+leaves the previous snapshot intact.  The arrays of component families
+are saved in their machine representation (base64), so a snapshot may
+only be resumed on a machine of the same architecture.
+
+"""
+
+from array import array
+import base64
+import json
+import os
+
+# Format of the snapshot files; a snapshot of another format is not
+# resumed.
+SNAPSHOT_VERSION = 2
+
+# Default seconds between snapshots.
+DEFAULT_INTERVAL = 60
+
+
+class SnapshotFile(object):
+
+    def __init__(self, path, interval = DEFAULT_INTERVAL):
+        """ Create SnapshotFile object.
+            path: file name of the snapshot
+            interval: seconds between snapshots"""
+        self._path = path
+        self._interval = interval
+
+
+    def get_path(self):
+        """ returns: file name of the snapshot"""
+        return self._path
+
+
+    def get_interval(self):
+        """ returns: seconds between snapshots"""
+        return self._interval
+
+
+    def save(self, state):
+        """ Atomically replaces the snapshot.
+            state: dictionary of JSON values"""
+        state = dict(state, version = SNAPSHOT_VERSION)
+        tmp = self._path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, separators = (',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self._path)
+        # Make the rename itself durable.
+        fd = os.open(os.path.dirname(os.path.abspath(self._path)),
+                     os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+    def load(self):
+        """ Reads the snapshot.  An IOError exception will be thrown if
+                the file cannot be read and a ValueError exception if it
+                is not a snapshot.
+            returns: dictionary saved by save()"""
+        with open(self._path) as f:
+            try:
+                state = json.load(f)
+            except ValueError as err:
+                raise ValueError("Invalid snapshot: %s" % err, self._path)
+        if not isinstance(state, dict) or \
+                state.get('version') != SNAPSHOT_VERSION:
+            raise ValueError("Invalid snapshot version", self._path)
+        return state
+
+
+def get_event_faults(events):
+    """ events: dictionary mapping each component state to its list of
+            Event instances
+        returns: list of the events' fault names per state (Operable
+            first), which identifies the events of a component"""
+    return [[e.get_fault() for e in events[s]] for s in (True, False)]
+
+
+def match_events(component_id, state, faults):
+    """ Checks that a component's saved state belongs to the component.
+            A ValueError exception will be thrown if it does not.
+        component_id: id of the component
+        state: the component's saved state
+        faults: value of get_event_faults() for the component"""
+    if state.get('id') != component_id or state.get('events') != faults:
+        raise ValueError("snapshot does not match component '%s'"
+                         % component_id)
+
+
+def encode_array(values):
+    """ values: an array or bytearray
+        returns: the values' machine representation as a base64 string"""
+    return base64.b64encode(values.tostring() if isinstance(values, array)
+                            else str(values))
+
+
+def decode_array(typecode, data):
+    """ typecode: type code of the array
+        data: string returned by encode_array()
+        returns: the array"""
+    values = array(typecode)
+    values.fromstring(base64.b64decode(data))
+    return values
+
+
+def decode_bytes(data):
+    """ data: string returned by encode_array()
+        returns: the bytearray"""
+    return bytearray(base64.b64decode(data))
@@ -40,14 +40,28 @@ is calculated according to a hazard rate.  Whether the event occurs
 depends upon a random value retrieved from Python's pseudo-random number
 generator.  This is a uniformly distributed random number generated
 by the Mersenne Twister algorithm in the semi-open range [0.0, 1.0). 
+
+Models are evaluated at discrete moments, dt seconds apart (one
+Scheduler checkpoint by default).  The probability used is the exact
+probability that the event occurs within the interval (t - dt, t],
+given that it had not occurred by t - dt:
+
+        P = 1 - R(t) / R(t - dt) = 1 - exp(-(H(t) - H(t - dt))),
+
+where H(t) is the cumulative hazard, the integral of h(t).  Unlike the
+hazard rate h(t) itself, this is a probability for any dt, so a model
+evaluated every dt seconds has the same distribution of event times
+(at a resolution of dt) whatever dt is.
+
+An intensity factor k (see intensity.py) scales the hazard rate to
+k * h(t) over the interval, so that P = 1 - exp(-k * (H(t) - H(t - dt))).
 """
 
-from collections import namedtuple
 import math
 import random
 
 
-def exponential_hazard(mttf):
+def exponential_hazard(mttf, dt = 1.0, intensity = 1.0):
     """ A exponentially distributed hazard rate function.
         This is a Poisson distribution, which describes the probability
         of a number of events occurring in a fixed interval of time.
@@ -61,14 +75,24 @@ def exponential_hazard(mttf):
         very unpredictable intervals.
 
         mttf: mean time to failure (in seconds) in reliability engineering
+        dt: seconds since the model was last evaluated
+        intensity: factor applied to the hazard rate
         returns: true or false; true if the hazard has occurred at
             function call time.
     """
-    lambda_ = 1.0 / mttf
-    return random.random() <= lambda_
+    return random.random() < exponential_probability(mttf, dt, intensity)
+
 
+def exponential_probability(mttf, dt = 1.0, intensity = 1.0):
+    """ mttf: mean time to failure (in seconds)
+        dt: length of the interval in seconds
+        intensity: factor applied to the hazard rate
+        returns: probability that the event occurs within an interval
+            of dt seconds; H(t) = t / mttf"""
+    return -math.expm1(-intensity * dt / float(mttf))
 
-def normal_hazard(mu, sigma, t):
+
+def normal_hazard(mu, sigma, t, dt = 1.0, intensity = 1.0):
     """ A normal or Guassian distributed hazard rate function.
         This is an increasing failure rate (IFR).  This indicates
         that the probability of an event increases monotonically
@@ -82,18 +106,31 @@ def normal_hazard(mu, sigma, t):
             in reliability engineering
         sigma: standard deviation in seconds
         t: elapsed time in seconds since the last event
+        dt: seconds since the model was last evaluated
+        intensity: factor applied to the hazard rate
         returns: true or false; true if the hazard has occurred at
             the elapsed time.
     """
-    p1 = _normal_distributed(mu,sigma,t)
-    z = _z_table_search((t-mu)/float(sigma))
-    if z is None:
-        return False
-    p2 = p1/(1-z)
-    return random.random() <= p2
+    return random.random() < normal_probability(mu, sigma, t, dt, intensity)
 
 
-def weibull_hazard(a, mttf, t):
+def normal_probability(mu, sigma, t, dt = 1.0, intensity = 1.0):
+    """ mu: mean time to failure (in seconds)
+        sigma: standard deviation in seconds
+        t: elapsed time in seconds since the last event
+        dt: length of the interval in seconds
+        intensity: factor applied to the hazard rate
+        returns: probability that the event occurs within (t - dt, t]
+            given that it had not occurred by t - dt"""
+    r0 = _normal_reliability(mu, sigma, max(t - dt, 0.0))
+    if r0 == 0.0:
+        # far beyond the mean, the event is certain
+        return 1.0 if intensity else 0.0
+    r = _normal_reliability(mu, sigma, t) / r0
+    return 1.0 - (r if intensity == 1.0 else math.pow(r, intensity))
+
+
+def weibull_hazard(a, mttf, t, dt = 1.0, intensity = 1.0):
     """ A Weibull distributed hazard rate function.  This hazard rate
         is frequently used in reliability engineering because it allows
         all phases of a compenents life to be modeled.  The phases are
@@ -125,85 +162,97 @@ def weibull_hazard(a, mttf, t):
             (Note: mttf is a slight abuse of statistical precision for 
             the Weibull hazard function, ease of use is more desirable 
             for this application)
+        t: elapsed time in seconds since the last event
+        dt: seconds since the model was last evaluated
+        intensity: factor applied to the hazard rate
         returns: true or false; true if the hazard has occurred at
             the elapsed time.
     """
+    return random.random() < weibull_probability(a, mttf, t, dt, intensity)
+
+
+def weibull_probability(a, mttf, t, dt = 1.0, intensity = 1.0):
+    """ a: shape parameter
+        mttf: mean time to failure (in seconds)
+        t: elapsed time in seconds since the last event
+        dt: length of the interval in seconds
+        intensity: factor applied to the hazard rate
+        returns: probability that the event occurs within (t - dt, t]
+            given that it had not occurred by t - dt; the hazard rate
+            is h(t) = a * lambda^a * t^(a-1), so H(t) = (lambda * t)^a"""
     lambda_ = 1.0 / mttf
-    p = a*math.pow(lambda_,a) * math.pow(t,a-1)
-    return random.random() <= p
+    h = (math.pow(lambda_ * t, a) -
+         math.pow(lambda_ * max(t - dt, 0.0), a))
+    return -math.expm1(-intensity * h)
 
 
-def _normal_distributed(mu, sigma, t):
-    """ A normal or Gaussian distribution probability
-        density function.
+def poisson_count(rate, dt = 1.0, intensity = 1.0):
+    """ The number of events of a Poisson process within an interval.
+        Unlike the hazard functions, which tell whether an event has
+        occurred, this allows any number of events per interval, so
+        that one event definition can model a high rate fault (ie. 200
+        messages per second).  The inter-arrival times of the events are
+        exponentially distributed with mean 1 / rate.
 
-        mu: this will be the mean time to failure (in seconds)
-            in reliability engineering
-        sigma: standard deviation in seconds
-        t: elapsed time in seconds since the previous event
-        returns: an instantaneous probability
+        rate: mean number of events per second
+        dt: length of the interval in seconds
+        intensity: factor applied to the rate
+        returns: number of events within the interval
+    """
+    mean = rate * dt * intensity
+    if mean < _POISSON_INVERSION_MAX:
+        # Multiplication of uniform variates (Knuth); its cost grows
+        # with the mean.
+        limit = math.exp(-mean)
+        count = 0
+        product = random.random()
+        while product > limit:
+            count += 1
+            product *= random.random()
+        return count
+    return _poisson_ptrs(mean)
+
+
+# Largest mean drawn by multiplication rather than by rejection.
+_POISSON_INVERSION_MAX = 10
+
+
+def _poisson_ptrs(mean):
+    """ Draws a Poisson variate by transformed rejection with squeeze
+        (Hormann, "The transformed rejection method for generating
+        Poisson random variables", 1993), at a constant cost whatever the
+        mean.
+
+        mean: mean of the distribution; at least 10
+        returns: a Poisson variate
     """
-    f1 = 1.0/(sigma*math.sqrt(2*math.pi))
-    f2 = math.exp(-0.5*math.pow((t-mu)/float(sigma),2))
-    return f1*f2
+    log_mean = math.log(mean)
+    b = 0.931 + 2.53 * math.sqrt(mean)
+    a = -0.059 + 0.02483 * b
+    log_inv_alpha = math.log(1.1239 + 1.1328 / (b - 3.4))
+    v_r = 0.9277 - 3.6224 / (b - 2)
+    while True:
+        u = random.random() - 0.5
+        v = random.random()
+        us = 0.5 - abs(u)
+        k = int(math.floor((2 * a / us + b) * u + mean + 0.43))
+        if us >= 0.07 and v <= v_r:
+            return k
+        if k < 0 or (us < 0.013 and v > us):
+            continue
+        if (math.log(v) + log_inv_alpha - math.log(a / (us * us) + b) <=
+                -mean + k * log_mean - math.lgamma(k + 1)):
+            return k
 
 
-def _z_table_search(z_in):
-    """ A binary search of Z_TABLE.  Matching is based
-        on finding the best range fit for z_in.
+def _normal_reliability(mu, sigma, t):
+    """ The reliability function R(t) = 1 - F(t) of a normal or
+        Gaussian distribution.
 
-        z_in: the z-value
-        returns: the cumulative probability
+        mu: this will be the mean time to failure (in seconds)
+            in reliability engineering
+        sigma: standard deviation in seconds
+        t: elapsed time in seconds since the previous event
+        returns: probability that the event has not occurred by t
     """
-    l,u = 0,_Z_TABLE_LEN-2
-    while l <= u:
-        m = (l+u) // 2  
-        if _Z_TABLE[m].z <= z_in and _Z_TABLE[m+1].z > z_in:
-            return _Z_TABLE[m].area
-        elif _Z_TABLE[m].z > z_in:
-            u = m-1
-        else:
-            l = m+1
-
-
-# A Standard Normal (Z) table.
-# It consists of the standard normal critical points as provided in
-# Table T1 of Ref. 3.
-_cell = namedtuple('_cell', ['area','z'])
-_Z_TABLE_LEN = 107
-_Z_TABLE = [_cell(.0001,-3.719),_cell(.005,-2.576),_cell(.001,-3.09),
-            _cell(.01,-2.326),_cell(.02,-2.054),_cell(.025,-1.96),
-            _cell(.03,-1.881),_cell(.04,-1.751),_cell(.05,-1.645),
-            _cell(.06,-1.555),_cell(.07,-1.476),_cell(.08,-1.405),
-            _cell(.09,-1.341),_cell(.10,-1.282),_cell(.11,-1.227),
-            _cell(.12,-1.175),_cell(.13,-1.126),_cell(.14,-1.080),
-            _cell(.15,-1.036),_cell(.16,-0.994),_cell(.17,-0.954),
-            _cell(.18,-0.915),_cell(.19,-0.878),_cell(.20,-0.842),
-            _cell(.21,-0.806),_cell(.22,-0.772),_cell(.23,-0.739),
-            _cell(.24,-0.706),_cell(.25,-0.674),_cell(.26,-0.643),
-            _cell(.27,-0.613),_cell(.28,-0.583),_cell(.29,-0.553),
-            _cell(.30,-0.524),_cell(.31,-0.496),_cell(.32,-0.468),
-            _cell(.33,-0.440),_cell(.34,-0.412),_cell(.35,-0.385),
-            _cell(.36,-0.358),_cell(.37,-0.332),_cell(.38,-0.305),
-            _cell(.39,-0.279),_cell(.40,-0.253),_cell(.41,-0.228),
-            _cell(.42,-0.202),_cell(.43,-0.176),_cell(.44,-0.151),
-            _cell(.45,-0.126),_cell(.46,-0.100),_cell(.47,-0.075),
-            _cell(.48,-0.050),_cell(.49,-0.025),_cell(.50,0.000),
-            _cell(.51,0.025),_cell(.52,0.050),_cell(.53,0.075),
-            _cell(.54,0.100),_cell(.55,0.126),_cell(.56,0.151),
-            _cell(.57,0.176),_cell(.58,0.202),_cell(.59,0.228),
-            _cell(.60,0.253),_cell(.61,0.279),_cell(.62,0.305),
-            _cell(.63,0.332),_cell(.64,0.358),_cell(.65,0.385),
-            _cell(.66,0.412),_cell(.67,0.440),_cell(.68,0.468),
-            _cell(.69,0.496),_cell(.70,0.524),_cell(.71,0.553),
-            _cell(.72,0.583),_cell(.73,0.613),_cell(.74,0.643),
-            _cell(.75,0.674),_cell(.76,0.706),_cell(.77,0.739),
-            _cell(.78,0.772),_cell(.79,0.806),_cell(.80,0.842),
-            _cell(.81,0.878),_cell(.82,0.915),_cell(.83,0.954),
-            _cell(.84,0.994),_cell(.85,1.036),_cell(.86,1.080),
-            _cell(.87,1.126),_cell(.88,1.175),_cell(.89,1.227),
-            _cell(.90,1.282),_cell(.91,1.341),_cell(.92,1.405),
-            _cell(.93,1.476),_cell(.94,1.555),_cell(.95,1.645),
-            _cell(.96,1.751),_cell(.97,1.881),_cell(.975,1.960),
-            _cell(.98,2.054),_cell(.99,2.326),_cell(.999,3.090),
-            _cell(.9995,3.290),_cell(.9999,3.719)]
+    return 0.5 * math.erfc((t - mu) / (sigma * math.sqrt(2)))
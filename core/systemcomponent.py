@@ -12,13 +12,22 @@ states: Operable and Nonoperable.  A SystemComponent will transition
 between states only when a 'state_transition' event is activated.  By 
 default, events are not configured as 'state_transition'.  A SystemComponent 
 will always remain in the Operable state when all the events assigned to 
-it are not 'state_transition' events. 
+it are not 'state_transition' events.  Events with the 'daemon' activation
+model are not activated at checkpoints; they run while the component is
+in their state (see daemon.py).  Neither are events with the 'triggered'
+activation model, which the SystemUnderTest fires a delay after their
+source event is activated.
 
 """
 
 from time import time
 
 from event import Event
+from eventwindow import EventWindowIndex
+from eventwindow import is_in_effect
+from snapshot import get_event_faults
+from snapshot import match_events
+from targetselector import TargetSelector
 
 class SystemComponent(object):
 
@@ -26,16 +35,21 @@ class SystemComponent(object):
     OPERABLE = True
     NONOPERABLE = False
 
-    def __init__(self, component_id, targets, config):
+    __slots__ = ('_id', '_targets', '_state', '_events', '_life_start_time',
+                 '_last_event_time', '_windows', '_daemons', '_paused')
+
+    def __init__(self, component_id, targets, config, weights = None):
         """ Create SystemComponent object.
             component_id: id of the component
             targets: a list of component identifiers which may be subject 
                    to faults.  Frequently, this will be a single entity, 
                    but it could be a list of identifiers such that one 
                    is randomly selected during event activation
-            config: a SessionConfig instance"""
+            config: a SessionConfig instance
+            weights: optional list of selection weights, one per target"""
         self._id = component_id
-        self._targets = targets
+        # The selector (and its alias table) is shared by all events.
+        self._targets = TargetSelector(targets, weights)
         self._state = self.OPERABLE
         self._events = {self.OPERABLE:[], self.NONOPERABLE:[]}
         # Time when the component was initialized.  Used for sequencing
@@ -62,23 +76,169 @@ class SystemComponent(object):
                                                      e[0], config)
                                                )
 
+        # Index of the events in effect for each state.  Daemon and
+        # triggered events are not evaluated at checkpoints.
+        self._windows = {}
+        for state, events in self._events.items():
+            self._windows[state] = EventWindowIndex(
+                [e for e in events if e.is_evaluated()])
+
+        # Index of the daemon events in effect for each state; None if the
+        # component has none.
+        self._daemons = None
+        if any(e.is_daemon_event() for events in self._events.values()
+               for e in events):
+            self._daemons = {}
+            for state, events in self._events.items():
+                self._daemons[state] = EventWindowIndex(
+                    [e for e in events if e.is_daemon_event()])
+        self._paused = False # no events are activated while paused
+
 
     def checkpoint(self):
         """ Determines whether any events associated with the component's
                 state need to be activated.
             returns: list of Event instances which are active"""
-        # Build list of activated events.
+        if self._paused: return []
+
+        window = self._windows[self._state]
+
+        # Build list of activated events from the events in effect.
         active_events = [
-            e for e in self._events[self._state] 
-            if e.is_active(self._life_start_time, 
-                           self._last_event_time)
+            e for e in window.in_window(time() - self._life_start_time)
+            if e.is_active(self._last_event_time)
         ]
 
         for e in active_events:
             e.set_executed()
+            # Singular events are never evaluated again.
+            if e.is_singular_event(): window.retire(e)
             self._last_event_time = time()
             # Transition the component state if necessary.
             if e.is_state_transition_event(): 
                 self._state = not self._state
 
         return active_events
+
+
+    def has_daemon_events(self):
+        """ returns: true if the component has daemon events"""
+        return self._daemons is not None
+
+
+    def get_daemon_events(self):
+        """ returns: list of tuples (key, Event instance) of the daemon
+                events which should run: those of the component's state
+                which are in effect, unless the component is paused.  The
+                key is unique to the event of the component."""
+        if self._daemons is None or self._paused: return []
+        elapsed_life = time() - self._life_start_time
+        return [((self._id, e), e)
+                for e in self._daemons[self._state].in_window(elapsed_life)]
+
+
+    def get_triggered_events(self):
+        """ returns: list of tuples (Event instance, state) of the
+                component's triggered events"""
+        return [(e, state) for state, events in self._events.items()
+                for e in events if e.get_trigger() is not None]
+
+
+    def is_trigger_source(self, event_id):
+        """ event_id: id of an event
+            returns: true if the component has an event with the id which
+                may trigger other events (ie. not a daemon event)"""
+        return any(e.get_event_id() == event_id and not e.is_daemon_event()
+                   for events in self._events.values() for e in events)
+
+
+    def fire(self, event, state, member = None):
+        """ Activates a triggered event if the component is in the
+                event's state, the event is in effect and the component
+                is not paused.
+            event: a triggered Event instance of the component
+            state: state of the event (OPERABLE or NONOPERABLE)
+            member: not used (see ComponentFamily.fire)
+            returns: list with the Event instance if it is activated;
+                empty if not"""
+        if self._paused or self._state != state: return []
+        if not is_in_effect(event, time() - self._life_start_time):
+            return []
+        event.set_executed()
+        self._last_event_time = time()
+        # Transition the component state if necessary.
+        if event.is_state_transition_event():
+            self._state = not self._state
+        return [event]
+
+
+    def get_id(self):
+        """ returns: id of the component"""
+        return self._id
+
+
+    def get_targets(self):
+        """ returns: list of the component's targets"""
+        return list(self._targets.get_targets())
+
+
+    def set_paused(self, paused):
+        """ paused: true to stop activating the component's events;
+                false to resume"""
+        self._paused = paused
+
+
+    def get_state(self):
+        """ returns: dictionary of the component's runtime state (see
+                snapshot.py)"""
+        return {
+            'id': self._id,
+            'events': get_event_faults(self._events),
+            'state': self._state,
+            'life_start_time': self._life_start_time,
+            'last_event_time': self._last_event_time,
+            'paused': self._paused,
+            'event_states': [[e.get_state() for e in self._events[s]]
+                             for s in (self.OPERABLE, self.NONOPERABLE)]
+        }
+
+
+    def set_state(self, state, offset):
+        """ Restores the runtime state saved by get_state().  A
+                ValueError exception will be thrown if the component's
+                events differ from the saved ones.
+            state: dictionary returned by get_state()
+            offset: seconds added to the saved times"""
+        match_events(self._id, state, get_event_faults(self._events))
+        self._state = state['state']
+        self._life_start_time = state['life_start_time'] + offset
+        self._last_event_time = state['last_event_time'] + offset
+        self._paused = state['paused']
+        for s, saved in zip((self.OPERABLE, self.NONOPERABLE),
+                            state['event_states']):
+            for e, event_state in zip(self._events[s], saved):
+                e.set_state(event_state, offset)
+                # Singular events are never evaluated again.
+                if e.is_singular_event() and event_state[0]: # executed
+                    self._windows[s].retire(e)
+
+
+    def describe(self):
+        """ returns: dictionary describing the component's state and
+                the events which may next be activated"""
+        window = self._windows[self._state]
+        elapsed_life = time() - self._life_start_time
+        return {
+            'id': self._id,
+            'state': 'operable' if self._state else 'nonoperable',
+            'paused': self._paused,
+            'targets': len(self._targets.get_targets()),
+            'next_due': sorted(
+                [{'event': e.get_event_id(),
+                  'fault': e.get_fault(),
+                  'due': due}
+                 for e, due in ((e, e.get_next_due(self._last_event_time))
+                                for e in window.peek(elapsed_life))
+                 if due is not None],
+                key = lambda d: d['due'])
+        }
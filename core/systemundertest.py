@@ -7,25 +7,94 @@ system.  For instance, a system may be the Open Stack compute
 service (nova), or it may be the Linux networking stack, or a software
 application.  A SystemUnderTest instance will be mapped to a single
 fault injection module.
+
+Events with the 'triggered' activation model sequence events across
+components: each is fired a delay after its source event is activated.
+Rather than being evaluated at every checkpoint, the activations of
+triggered events are scheduled in a heap, so dormant triggered events
+cost nothing.  A triggered event fires at the checkpoint nearest its due
+time if its component is then in the event's state; the events it
+triggers in turn are scheduled from the next checkpoint on.  The event
+of a family fires for the member whose event triggered it, or for every
+member when the source event is another component's.
+
+Components may be added, removed or marked inactive while the session
+runs (see membership.py).  Each change costs time in proportion to the
+changed component only; the other components are not rebuilt and keep
+their timing.  The slot of a removed component is emptied and the list
+of components is compacted once half of it is empty.  Snapshots record
+the configured components which were removed and the definitions of the
+components which were added, so that a resumed session rebuilds the
+same components.
  
 """
 
+from collections import OrderedDict
+import heapq
+import threading
+from time import time
+
+from componentfamily import ComponentFamily
 from systemcomponent import SystemComponent
 from sessionconfig import SessionConfig
 
+# Triggered events fire at the checkpoint nearest their due time;
+# checkpoints are 1 second apart.
+TRIGGER_TOLERANCE = 0.5
+
 class SystemUnderTest(object):
 
-    def __init__(self, session_config_file):
+    def __init__(self, session_config_file, profiler = None):
         """ Create SystemUnderTest object.
             system_config_file: name of the configuration file;
-                used to create the full path name of the file"""
-        self._config_file = SessionConfig(session_config_file)
-        self._system_name = self._config_file.get_system_name()
-        self._fault_module_name = self._config_file.get_fault_module_name()
+                used to create the full path name of the file
+            profiler: optional Profiler which records the time spent
+                loading the configuration and building the components"""
+        # The SessionConfig is only needed while the components are
+        # built; it is not kept so that its memory is released.
+        start = time()
+        config = SessionConfig(session_config_file)
+        if profiler: profiler.add('config load', time() - start)
+        start = time()
+        self._system_name = config.get_system_name()
+        self._fault_module_name = config.get_fault_module_name()
+        self._fault_config = config.get_fault_config()
+        # Component families stand in for all of their members.
         self._components = [
-            SystemComponent(c[0], c[1], self._config_file) for 
-            c in self._config_file.get_active_components()
+            (ComponentFamily if c[3] else SystemComponent)(
+                c[0], c[1], config, c[2]) for 
+            c in config.get_active_components()
         ]
+        self._index = dict((c.get_id(), c) for c in self._components)
+        self._positions = dict((c.get_id(), i) for i, c in
+                               enumerate(self._components)) # id -> index
+                                                            # into _components
+        self._vacant = 0 # slots of removed components (None)
+        self._daemon_components = OrderedDict(
+            (c.get_id(), c) for c in self._components
+            if c.has_daemon_events()) # id -> component with daemon events
+        self._triggered = [] # (component, event, state) of triggered
+                             # events; None once removed
+        self._triggered_vacant = 0 # removed entries of _triggered
+        self._triggers = {} # source id (see Event.get_source_id) ->
+                            # list of (index into _triggered, delay, true
+                            # if fired for the source's family member)
+        self._component_triggered = {} # component id -> indexes into
+                                       # _triggered
+        for c in self._components: self._add_triggered(c)
+        self._scheduled = [] # heap of (due time, sequence, index into
+                             # _triggered, member index or None)
+        self._sequence = 0 # keeps the heap order stable
+        self._intensity = config.get_intensity()
+        self._profile_index = config.get_profile_index()
+        self._profiles = list(self._profile_index.values())
+        self._added = OrderedDict() # component id -> dictionary of a
+                                    # component added at runtime
+        self._removed = set() # ids of configured components removed at
+                              # runtime
+        self._lock = threading.Lock() # guards _profile_index and the
+                                      # changes of _components
+        if profiler: profiler.add('sut build', time() - start)
 
 
     def checkpoint(self):
@@ -33,19 +102,330 @@ class SystemUnderTest(object):
                 to be activated.
             returns: list of Event instances which are active"""
         events = []
+        now = time()
 
-        for c in self._components:
+        for p in self._profiles: p.update()
+
+        if self._scheduled and \
+                self._scheduled[0][0] <= now + TRIGGER_TOLERANCE:
+            events = self._fire_triggered(now)
+
+        components = self._components
+        if self._vacant:
+            components = [c for c in components if c is not None]
+        for c in components:
             active_events = c.checkpoint()
             if active_events: events.extend(active_events)
 
+        if self._triggers:
+            for e in events:
+                targets = self._triggers.get(e.get_source_id())
+                if targets: self._schedule(targets, e.get_member(), now)
+
+        return events
+
+
+    def _schedule(self, targets, member, now):
+        """ Schedules the events triggered by an activated event.
+            targets: list of (index into _triggered, delay, per member)
+            member: index of the family member which activated the
+                source event; None for a SystemComponent
+            now: time of the checkpoint"""
+        for i, delay, per_member in targets:
+            self._sequence += 1
+            heapq.heappush(self._scheduled, (
+                now + delay, self._sequence, i,
+                member if per_member else None))
+
+
+    def _fire_triggered(self, now):
+        """ Fires the triggered events which are due.
+            now: time of the checkpoint
+            returns: list of the Event instances which are active"""
+        events = []
+        scheduled = self._scheduled
+        while scheduled and scheduled[0][0] <= now + TRIGGER_TOLERANCE:
+            _, _, i, member = heapq.heappop(scheduled)
+            triggered = self._triggered[i]
+            if triggered is None: continue # component removed
+            c, e, state = triggered
+            events.extend(c.fire(e, state, member))
         return events
 
 
+    def _add_triggered(self, c):
+        """ Registers the triggered events of a component with their
+                sources.
+            c: a SystemComponent or ComponentFamily instance"""
+        indexes = []
+        for e, state in c.get_triggered_events():
+            source_component_id, source_event_id, delay = e.get_trigger()
+            self._triggers.setdefault(
+                (source_component_id, source_event_id), []).append(
+                    (len(self._triggered), delay,
+                     isinstance(c, ComponentFamily) and
+                     source_component_id == c.get_id()))
+            indexes.append(len(self._triggered))
+            self._triggered.append((c, e, state))
+        if indexes: self._component_triggered[c.get_id()] = indexes
+
+
+    def _remove_triggered(self, c):
+        """ Unregisters the triggered events of a removed component.
+                Their scheduled activations are dropped when due.
+            c: a SystemComponent or ComponentFamily instance"""
+        for i in self._component_triggered.pop(c.get_id(), ()):
+            source = self._triggered[i][1].get_trigger()[:2]
+            targets = [t for t in self._triggers[source] if t[0] != i]
+            if targets:
+                self._triggers[source] = targets
+            else:
+                del self._triggers[source]
+            self._triggered[i] = None
+            self._triggered_vacant += 1
+
+        if self._triggered_vacant * 2 > len(self._triggered):
+            self._compact_triggered()
+
+
+    def _compact_triggered(self):
+        """ Drops the removed entries of _triggered and renumbers the
+            indexes into it."""
+        numbers = {} # old index -> new index
+        triggered = []
+        for i, t in enumerate(self._triggered):
+            if t is not None:
+                numbers[i] = len(triggered)
+                triggered.append(t)
+        self._triggered = triggered
+        self._triggered_vacant = 0
+        for source, targets in self._triggers.items():
+            self._triggers[source] = [(numbers[i], delay, per_member) for
+                                      i, delay, per_member in targets]
+        for component_id, indexes in self._component_triggered.items():
+            self._component_triggered[component_id] = [numbers[i] for i in
+                                                       indexes]
+        # Activations of removed events are dropped.
+        self._scheduled = [(due, sequence, numbers[i], member) for
+                           due, sequence, i, member in self._scheduled
+                           if i in numbers]
+        heapq.heapify(self._scheduled)
+
+
+    def create_component(self, spec, source):
+        """ Builds a component to be added while the session runs; may
+                be called by any thread.  A ValueError exception will be
+                thrown if the component is invalid.
+            spec: component dictionary, as an entry of the configuration
+                file's 'components' list
+            source: name of the dictionary's source for error messages
+            returns: tuple (component, intensity profiles) for
+                add_component()"""
+        with self._lock:
+            profiles = OrderedDict(self._profile_index)
+        config = SessionConfig(source, spec, self._intensity, profiles)
+        c = config.get_active_components()[0]
+        return ((ComponentFamily if c[3] else SystemComponent)(
+                    c[0], c[1], config, c[2]), profiles)
+
+
+    def add_component(self, spec, component, profiles, validate = True):
+        """ Adds a component built by create_component(); called between
+                checkpoints.  A ValueError exception will be thrown if
+                there is a component with the same id, or if the source of
+                a triggered event is not an event of a component.
+            spec: component dictionary of the component
+            component: the SystemComponent or ComponentFamily instance
+            profiles: intensity profiles returned by create_component()
+            validate: false to skip the validation of the triggers
+            returns: list of the component's targets"""
+        component_id = component.get_id()
+        if component_id in self._index:
+            raise ValueError("component '%s' already exists" % component_id)
+        if validate:
+            for e, _ in component.get_triggered_events():
+                source_component_id, source_event_id, _ = e.get_trigger()
+                source = (component if source_component_id == component_id
+                          else self._index.get(source_component_id))
+                if source is None or \
+                        not source.is_trigger_source(source_event_id):
+                    raise ValueError("invalid trigger of event %s: no "
+                                     "event %s of component '%s'" %
+                                     (e.get_event_id(), source_event_id,
+                                      source_component_id))
+
+        with self._lock:
+            self._positions[component_id] = len(self._components)
+            self._components.append(component)
+        self._index[component_id] = component
+        if component.has_daemon_events():
+            self._daemon_components[component_id] = component
+        self._add_triggered(component)
+        self._added[component_id] = spec
+        with self._lock:
+            for key, p in profiles.iteritems():
+                known = self._profile_index.get(key)
+                if known is p: continue
+                if known is None: self._profile_index[key] = p
+                # A profile built at the same time as an identical one
+                # is updated separately.
+                self._profiles.append(p)
+        return component.get_targets()
+
+
+    def remove_component(self, component_id):
+        """ Removes a component; called between checkpoints.  A KeyError
+                exception will be thrown if there is no such component.
+            component_id: id of the component (or id pattern of a family)
+            returns: the removed component"""
+        c = self._index.pop(component_id, None)
+        if c is None:
+            raise KeyError("unknown component '%s'" % component_id)
+        with self._lock:
+            self._components[self._positions.pop(component_id)] = None
+            self._vacant += 1
+        self._daemon_components.pop(component_id, None)
+        self._remove_triggered(c)
+        if component_id in self._added:
+            del self._added[component_id]
+        else:
+            self._removed.add(component_id)
+
+        if self._vacant * 2 > len(self._components):
+            with self._lock:
+                self._components = [c for c in self._components
+                                    if c is not None]
+                self._positions = dict((c.get_id(), i) for i, c in
+                                       enumerate(self._components))
+                self._vacant = 0
+        return c
+
+
+    def has_daemon_events(self):
+        """ returns: true if any component has daemon events"""
+        return bool(self._daemon_components)
+
+
+    def get_daemon_events(self):
+        """ returns: list of tuples (key, Event instance) of the daemon
+                events which should now run (see
+                SystemComponent.get_daemon_events)"""
+        events = []
+        for c in self._daemon_components.itervalues():
+            events.extend(c.get_daemon_events())
+        return events
+
+
+    def get_state(self):
+        """ returns: dictionary of the runtime state of the components
+                and intensity profiles (see snapshot.py)"""
+        # Triggered events are numbered without the removed ones, as a
+        # resumed session builds them.
+        numbers = {}
+        for i, triggered in enumerate(self._triggered):
+            if triggered is not None: numbers[i] = len(numbers)
+        return {
+            'system_name': self._system_name,
+            'membership': {'removed': sorted(self._removed),
+                           'added': self._added.values()},
+            'components': [c.get_state() for c in self.get_components()],
+            'intensity': [p.get_state() for p in self._profiles],
+            'scheduled': [[due, numbers[i], member]
+                          for due, _, i, member in sorted(self._scheduled)
+                          if i in numbers]
+        }
+
+
+    def set_state(self, state, offset):
+        """ Restores the runtime state saved by get_state().  A
+                ValueError exception will be thrown if the session's
+                components or intensity profiles differ from the saved
+                ones.
+            state: dictionary returned by get_state()
+            offset: seconds added to the saved times"""
+        if state['system_name'] != self._system_name:
+            raise ValueError("snapshot does not match system '%s'"
+                             % self._system_name)
+        # Rebuild the membership changes first.
+        for component_id in state['membership']['removed']:
+            self.remove_component(component_id)
+        for spec in state['membership']['added']:
+            c, profiles = self.create_component(spec, 'snapshot')
+            self.add_component(spec, c, profiles, validate = False)
+
+        components = self.get_components()
+        if len(state['components']) != len(components):
+            raise ValueError("snapshot does not match system '%s'"
+                             % self._system_name)
+        # The profiles of removed components are saved too.
+        saved = {}
+        for p_state in state['intensity']:
+            saved.setdefault(p_state['profile'], []).append(p_state)
+        p_states = []
+        for p in self._profiles:
+            matching = saved.get(p.describe())
+            if not matching:
+                raise ValueError("snapshot does not match the intensity "
+                                 "profiles of system '%s'"
+                                 % self._system_name)
+            p_states.append(matching.pop(0))
+        for c, c_state in zip(components, state['components']):
+            c.set_state(c_state, offset)
+        for p, p_state in zip(self._profiles, p_states):
+            p.set_state(p_state, offset)
+        indexes = [i for i, triggered in enumerate(self._triggered)
+                   if triggered is not None]
+        self._scheduled = []
+        for due, i, member in state['scheduled']:
+            self._sequence += 1
+            self._scheduled.append((due + offset, self._sequence,
+                                    indexes[i], member))
+        heapq.heapify(self._scheduled)
+
+
+    def get_components(self):
+        """ returns: list of SystemComponent and ComponentFamily
+                instances; a copy, which may be read while components
+                are added or removed"""
+        with self._lock:
+            return [c for c in self._components if c is not None]
+
+
+    def get_component(self, component_id):
+        """ component_id: id of a component (or id pattern of a family)
+            returns: the component; None if there is no such component"""
+        return self._index.get(component_id)
+
+
+    def get_intensity_profiles(self):
+        """ returns: list of IntensityProfile instances scaling the
+                hazard rates of the SUT's events"""
+        return self._profiles
+
+
     def get_system_name(self):
         """ returns: name of system under test (SUT)"""
         return self._system_name
 
 
+    def get_fault_config(self):
+        """ returns: dictionary for the setup hook of the fault module"""
+        return self._fault_config
+
+
+    def get_targets(self):
+        """ returns: list of the targets of every component (and family
+                member), without duplicates"""
+        seen = set()
+        targets = []
+        for c in self.get_components():
+            for t in c.get_targets():
+                if t not in seen:
+                    seen.add(t)
+                    targets.append(t)
+        return targets
+
+
     def get_fault_module_name(self):
         """ returns: name of fault injector module associated with the SUT"""
         return self._fault_module_name
@@ -0,0 +1,115 @@
+"""
+
+targetselector.py: Contains the TargetSelector class.
+
+Each SystemComponent has a single TargetSelector instance which is
+shared by all of its events.  It selects the target(s) of an event
+activation from the component's list of targets.  Targets are selected
+uniformly unless the component is configured with target weights.  For
+weighted selection, an alias table (Walker's alias method) is built
+once, so that each selection takes constant time regardless of the
+number of targets.
+
+References:
+1) Vose, Michael D. "A Linear Algorithm For Generating Random Numbers
+With a Given Distribution", IEEE Transactions on Software Engineering,
+17(9), 1991.
+
+2) Efraimidis, Pavlos S. and Spirakis, Paul G. "Weighted random
+sampling with a reservoir", Information Processing Letters, 97(5), 2006.
+
+"""
+
+import heapq
+import random
+
+
+class TargetSelector(object):
+
+    __slots__ = ('_targets', '_weights', '_prob', '_alias')
+
+    def __init__(self, targets, weights = None):
+        """ Create TargetSelector object.
+            targets: a list of component identifiers which may be subject
+                   to faults
+            weights: optional list of positive selection weights, one per
+                   target; targets are selected uniformly if None"""
+        self._targets = targets
+        self._weights = weights
+        self._prob = None # alias table: probability of keeping column i
+        self._alias = None # alias table: alternative for column i
+
+        if weights is not None:
+            self._build_alias_table(weights)
+
+
+    def get_targets(self):
+        """ returns: list of all targets"""
+        return self._targets
+
+
+    def select(self):
+        """ returns: a single randomly selected target"""
+        if self._prob is None:
+            return random.choice(self._targets)
+
+        i = random.randrange(len(self._targets))
+        if random.random() < self._prob[i]:
+            return self._targets[i]
+        return self._targets[self._alias[i]]
+
+
+    def select_many(self, k):
+        """ k: number of distinct targets to select
+            returns: list of k distinct randomly selected targets;
+                all targets if k is not less than the number of targets"""
+        n = len(self._targets)
+        if k >= n:
+            return list(self._targets)
+        if k == 1:
+            return [self.select()]
+        if self._prob is None:
+            return random.sample(self._targets, k)
+
+        if 2 * k <= n:
+            # Draw from the alias table, rejecting duplicates.  The number
+            # of draws is bounded in case a few targets hold most of the
+            # weight.
+            selected = set()
+            for _ in range(4 * k):
+                selected.add(self.select())
+                if len(selected) == k:
+                    return list(selected)
+
+        # Weighted sampling without replacement: the k largest keys
+        # u^(1/w) form the sample.
+        keys = [(random.random() ** (1.0 / w), i)
+                for i, w in enumerate(self._weights)]
+        return [self._targets[i] for _, i in heapq.nlargest(k, keys)]
+
+
+    def _build_alias_table(self, weights):
+        """ Builds the alias table for the weights (Vose's method)."""
+        n = len(weights)
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        self._prob = [0.0] * n
+        self._alias = [0] * n
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        # Remaining columns are full (up to floating point error).
+        for i in large + small:
+            self._prob[i] = 1.0
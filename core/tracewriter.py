@@ -0,0 +1,158 @@
+"""
+
+tracewriter.py: Contains the TraceWriter class.
+
+A TraceWriter streams Scheduler activity to a file in the Chrome
+trace event format, which can be opened in Perfetto
+(https://ui.perfetto.dev) or chrome://tracing.  Each SUT is shown as a
+process and each worker thread as a thread of that process:
+
+    fault executions        complete events ('X') spanning the fault
+                            function call, with the target, component
+                            id and outcome as arguments
+    checkpoints             complete events on the Scheduler thread with
+                            the number of activated events
+    state transitions       instant events ('i') for activated state
+                            transition events
+    coalesced activations   instant events for activations that were
+                            folded into (or queued behind) a running
+                            worker
+
+Timestamps are Unix times in microseconds, so a trace can be lined up
+with SUT metrics collected over the same period.
+
+Recording only appends a tuple to a deque; a writer thread formats and
+writes the records in batches.  The file is a JSON array which is left
+open until close(), as the format allows, so the trace of a session
+that is killed remains readable up to the last batch written.
+
+"""
+
+from collections import deque
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+# Seconds between batch writes.
+FLUSH_INTERVAL = 0.5
+
+# Record kinds.
+_SPAN = 'X'
+_INSTANT = 'i'
+_PROCESS = 'M'
+
+
+class TraceWriter(threading.Thread):
+
+    def __init__(self, path):
+        """ Create TraceWriter object.
+            path: trace file name"""
+        threading.Thread.__init__(self, name = "trace")
+        self.daemon = True
+        self._file = open(path, 'w')
+        self._file.write('[\n')
+        self._records = deque()
+        self._tids = itertools.count(1) # trace thread ids
+        self._threads = set() # trace thread ids with a name record written
+        self._pids = 0 # number of processes added
+        self._stop = threading.Event()
+
+
+    def run(self):
+        """ Entry point for threading.Thread (trace writer thread)"""
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self._write_batch()
+
+
+    def close(self):
+        """ Writes the remaining records and closes the trace file."""
+        self._stop.set()
+        if self.is_alive(): self.join()
+        self._write_batch()
+        # The last record is written without a trailing comma so that the
+        # file is also valid JSON for tools other than trace viewers.
+        self._file.write(json.dumps({'ph': 'i', 's': 'g', 'pid': 0, 'tid': 0,
+                                     'name': 'session end',
+                                     'ts': int(time.time() * 1e6)}) + ']\n')
+        self._file.close()
+
+
+    def add_process(self, name):
+        """ Adds a process (one per SUT) to the trace.
+            name: process name shown by trace viewers
+            returns: process id to use when recording"""
+        self._pids += 1
+        self._records.append((_PROCESS, self._pids, None, None, name,
+                              None, None, None))
+        return self._pids
+
+
+    def span(self, pid, name, start, duration, args = None):
+        """ Records a span on the calling thread.
+            pid: process id returned by add_process()
+            name: span name
+            start: Unix time when the span started
+            duration: duration of the span in seconds
+            args: optional dictionary shown with the span"""
+        t = threading.current_thread()
+        self._records.append((_SPAN, pid, self._get_tid(t), t.name, name,
+                              start, duration, args))
+
+
+    def instant(self, pid, name, args = None):
+        """ Records an instant on the calling thread.
+            pid: process id returned by add_process()
+            name: instant name
+            args: optional dictionary shown with the instant"""
+        t = threading.current_thread()
+        self._records.append((_INSTANT, pid, self._get_tid(t), t.name, name,
+                              time.time(), None, args))
+
+
+    def _get_tid(self, thread):
+        """ thread: a Thread instance
+            returns: trace thread id of the thread"""
+        # Thread idents are reused by later threads, which would merge
+        # unrelated workers into one track; each Thread gets its own id.
+        tid = getattr(thread, 'trace_tid', None)
+        if tid is None:
+            tid = thread.trace_tid = next(self._tids)
+        return tid
+
+
+    def _write_batch(self):
+        """ Formats and writes all records recorded so far."""
+        lines = []
+        records = self._records
+        while records:
+            kind, pid, tid, tname, name, ts, dur, args = records.popleft()
+
+            if kind == _PROCESS:
+                lines.append({'ph': 'M', 'pid': pid, 'name': 'process_name',
+                              'args': {'name': name}})
+                continue
+
+            if (pid, tid) not in self._threads:
+                self._threads.add((pid, tid))
+                lines.append({'ph': 'M', 'pid': pid, 'tid': tid,
+                              'name': 'thread_name', 'args': {'name': tname}})
+
+            record = {'ph': kind, 'pid': pid, 'tid': tid, 'name': name,
+                      'ts': int(ts * 1e6)}
+            if kind == _SPAN:
+                record['dur'] = int(dur * 1e6)
+            else:
+                record['s'] = 't' # instant is scoped to its thread
+            if args: record['args'] = args
+            lines.append(record)
+
+        if not lines: return
+        try:
+            self._file.write(''.join(json.dumps(l, default = str) + ',\n'
+                                     for l in lines))
+            self._file.flush()
+        except (IOError, OSError) as err:
+            logging.info("error: trace- %s" % os.strerror(err.errno))
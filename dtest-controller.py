@@ -10,12 +10,22 @@
 
 
 import logging
+import os
 import signal
 import sys
 import warnings
 from argparse import ArgumentParser
 
+from core.controlserver import ControlServer
+from core.intensity import format_rates
+from core.membership import MembershipStream
+from core.profiler import DUMP_CPROFILE
+from core.profiler import DUMP_SAMPLE
+from core.profiler import Profiler
 from core.scheduler import Scheduler
+from core.snapshot import DEFAULT_INTERVAL
+from core.snapshot import SnapshotFile
+from core.tracewriter import TraceWriter
 
 # Suppress runtime warning for import statements in event modules.
 # Imports of Python standard library packages do work, but a warning was given
@@ -27,24 +37,55 @@ warnings.filterwarnings(
 
 def main():
     schedulers = None # will reference a list of Scheduler instances 
+    control = None # ControlServer instance when a control socket is given
+    membership = None # MembershipStream instance when a stream is given
+    trace = None # TraceWriter instance when a trace file is given
 
     def exit_dtrace(signum, stack):
         """ shuts down all schedulers (running threads) and exits"""
+        if control: control.close()
+        if membership: membership.close()
         map(lambda s: s.stop(), schedulers)
+        if trace:
+            # Workers record until their Scheduler stops.
+            map(lambda s: s.join(), schedulers)
+            trace.close()
         print
         sys.exit()
 
+    def report_stats(signum, stack):
+        """ logs the live fault outcome statistics of all schedulers"""
+        if schedulers is None: return # still starting
+        for s in schedulers:
+            for line in s.get_fault_stats().report():
+                logging.info("Fault stats: %s" % line)
+            for p in s.get_sut().get_intensity_profiles():
+                logging.info("Intensity: %s" % format_rates(p.snapshot()))
+            for line in s.get_daemon_supervisor().report():
+                logging.info("Daemon: %s" % line)
+
     arg_parser = get_arg_parser()
     args = arg_parser.parse_args()  # get CLI arguments
+    if args.resume and not args.snapshot_dir:
+        arg_parser.error("--resume requires --snapshot-dir")
+    if args.snapshot_interval <= 0:
+        arg_parser.error("invalid snapshot interval")
     config_logger(args.e, args.d) # configure Python logging facility
     signal.signal(signal.SIGINT, exit_dtrace) # register Interrupt signal
     signal.signal(signal.SIGTERM, exit_dtrace) # register Terminate signal
     signal.signal(signal.SIGHUP, exit_dtrace) # register Terminal HangUp
     signal.signal(signal.SIGALRM, exit_dtrace) # register alarm 
+    signal.signal(signal.SIGUSR1, report_stats) # register live stats report
     
     try:
+        if args.trace: trace = TraceWriter(args.trace)
         # Instantiate a Scheduler instance for each config file given at CLI.
-        schedulers = [Scheduler(f, args.r) for f in args.session_config_file]
+        schedulers = [Scheduler(f, args.r, trace,
+                                get_profiler(f, args) if args.profile or
+                                args.profile_dump else None,
+                                get_snapshot(f, args) if args.snapshot_dir
+                                else None, args.resume)
+                      for f in args.session_config_file]
     except IOError as err:
         # Failed to open a system config file.
         sys.stderr.write('%s: error: %s- %s\n\n' 
@@ -60,14 +101,52 @@ def main():
         sys.stderr.write('%s: error: %s\n\n' % (arg_parser.prog, err.args[0]))
         sys.exit(1) # exit with error
 
+    if trace: trace.start()
     # Scheduler is derived from Thread.  This will start each Thread.
     map(lambda s: s.start(), schedulers)
 
+    if args.control:
+        try:
+            control = ControlServer(args.control, schedulers)
+        except (OSError, IOError) as err:
+            # Failed to create the control socket.
+            map(lambda s: s.stop(), schedulers)
+            sys.stderr.write('%s: error: %s- %s\n\n'
+                             % (arg_parser.prog, err.strerror, args.control))
+            sys.exit(2) # exit with error - 2 for CLI syntax errors
+        control.start()
+
+    if args.membership:
+        membership = MembershipStream(args.membership, schedulers)
+        membership.start()
+
     # Setup alarm for a fixed duration session if necessary.
     if args.time: signal.alarm(args.time)
 
     # All FaultSims (threads) are running, main thread now waits for OS signal.
-    signal.pause()
+    # Signals which do not end the session (ie. SIGUSR1) resume the wait.
+    while True: signal.pause()
+
+
+def get_profiler(session_config_file, args):
+    """ session_config_file: configuration file of a Scheduler
+        args: parsed CLI arguments
+        returns: a Profiler instance for the Scheduler; its dump is named
+            after the configuration file"""
+    name = os.path.splitext(os.path.basename(session_config_file))[0]
+    return Profiler(name if name != '-' else 'stdin', args.profile_dump,
+                    args.profile_dir)
+
+
+def get_snapshot(session_config_file, args):
+    """ session_config_file: configuration file of a Scheduler
+        args: parsed CLI arguments
+        returns: a SnapshotFile instance for the Scheduler; it is named
+            after the configuration file"""
+    name = os.path.splitext(os.path.basename(session_config_file))[0]
+    return SnapshotFile(os.path.join(args.snapshot_dir, '%s.snapshot' %
+                                     (name if name != '-' else 'stdin')),
+                        args.snapshot_interval)
 
 
 def config_logger(export = False, debug = False):
@@ -103,6 +182,11 @@ def get_arg_parser():
         description = "DTest Controller - distributed test scheduler"
     )
 
+    parser.add_argument(
+        '-c', '--control', metavar = 'PATH',
+        help = "listen for control commands on Unix domain socket PATH"
+    )
+
     parser.add_argument(
         '-d', '--debug', action = 'store_true', default = False, 
         dest = 'd', help = "set logging level to debug output"
@@ -113,11 +197,56 @@ def get_arg_parser():
         dest = 'e', help = "logging output will be in file export format"
     )
 
+    parser.add_argument(
+        '--membership', metavar = 'PATH',
+        help = "add and remove components while the session runs, as"
+               " directed by the JSON lines read from file or FIFO PATH"
+    )
+
+    parser.add_argument(
+        '--profile', action = 'store_true', default = False,
+        help = "log the time spent in each phase of the session at exit"
+    )
+
+    parser.add_argument(
+        '--profile-dump', choices = (DUMP_CPROFILE, DUMP_SAMPLE),
+        help = "also profile each Scheduler thread with cProfile or a stack"
+               " sampler and write the result to <FILE name>.prof or"
+               " .folded (implies --profile)"
+    )
+
+    parser.add_argument(
+        '--profile-dir', metavar = 'DIR', default = '.',
+        help = "directory for the profile dumps (default: .)"
+    )
+
     parser.add_argument(
         '-r', '--dryrun', action = 'store_true', default = False, 
         dest = 'r', help = "scheduled events will be reported but not executed"
     )
 
+    parser.add_argument(
+        '--resume', action = 'store_true', default = False,
+        help = "continue the session from the snapshots in --snapshot-dir"
+    )
+
+    parser.add_argument(
+        '--snapshot-dir', metavar = 'DIR',
+        help = "save the state of each session to <FILE name>.snapshot in"
+               " DIR periodically and at exit, so that it can be resumed"
+    )
+
+    parser.add_argument(
+        '--snapshot-interval', type = float, default = DEFAULT_INTERVAL,
+        metavar = 'SECONDS',
+        help = "seconds between snapshots (default: %d)" % DEFAULT_INTERVAL
+    )
+
+    parser.add_argument(
+        '--trace', metavar = 'FILE',
+        help = "write a Chrome trace (Perfetto) timeline of the session to FILE"
+    )
+
     parser.add_argument(
         '-t', '--time', type = int, default = 0, 
         help = "session duration in seconds"
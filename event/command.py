@@ -0,0 +1,196 @@
+"""
+
+command.py: Generic fault module for faults which run a command.
+
+By default commands are forked from the controller.  Forking a large,
+multithreaded Python process on every activation is expensive, so the
+session may instead start a small pool of helper processes
+(commandhelper.py) from which the commands are forked:
+
+    "fault_config": {"pool_size": 8}
+
+The pool is started by the setup hook and stopped by the teardown hook
+(neither is called for a dry run), so importing the module starts no
+process.  Forking the controller gets slower as its heap grows, and in
+Python 2 closing its descriptors in the command (Popen's close_fds)
+sweeps every possible descriptor; a pool is faster in either case.
+
+The command is a template in udf1.  Each whitespace separated word of
+the template is formatted with str.format() using the target, udf2,
+udf3 and the udd entries, ie.
+
+    "udf1": "ssh {target} sudo systemctl {action} etcd",
+    "udd": {"action": "stop", "timeout": 10}
+
+Each command runs in a process group of its own; the whole group is
+killed when the command times out.
+
+"""
+
+import json
+import logging
+import os
+import Queue
+import shlex
+import subprocess
+import sys
+import threading
+
+import commandhelper
+
+logging.basicConfig(level = logging.INFO,
+                    format='(%(threadName)-10s) %(message)s')
+
+# Key of the 'fault_config' dictionary with the number of helper
+# processes; 0 (the default) forks the commands from the controller.
+POOL_SIZE = 'pool_size'
+
+# Defaults for udd options.
+DEFAULT_TIMEOUT = 60 # seconds
+DEFAULT_MAX_OUTPUT = 65536 # bytes captured per stream
+
+_HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'commandhelper.py')
+
+_pool = None # _HelperPool started by setup(); None to fork directly
+_pool_lock = threading.Lock()
+
+
+def setup(targets, config):
+    """ Scheduler hook called when the module is loaded (and when
+        components are added).
+
+    targets: all targets of the SUT (unused)
+    config: the session's 'fault_config' dictionary; "pool_size" is the
+        number of helper processes to start
+
+    returns: None
+
+    """
+    global _pool
+    size = config.get(POOL_SIZE, 0)
+    if type(size) is not int or size < 0:
+        raise ValueError("Invalid '%s' value '%s'" % (POOL_SIZE, size))
+    with _pool_lock:
+        if size and _pool is None: _pool = _HelperPool(size)
+
+
+def teardown():
+    """ Scheduler hook called when the session stops; stops the helper
+        processes."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None: pool.close()
+
+
+def run_command(*args, **kwargs):
+    """
+
+    kwargs['target']: substituted for {target} in the command template
+    kwargs['udf1']: command template
+    kwargs['udf2']: substituted for {udf2} in the command template
+    kwargs['udf3']: substituted for {udf3} in the command template
+    kwargs['udd']: "timeout" : seconds before the command is killed
+                              (default: 60)
+                   "max_output" : bytes of stdout and of stderr which are
+                                 captured (default: 65536)
+                   "shell" : if true, the formatted template is run by
+                            /bin/sh (default: false)
+                   "env" : dictionary of extra environment variables
+                   other entries are substituted into the template
+
+    returns: dictionary with the exit status and captured output
+    raises: RuntimeError if the command times out or exits with a
+        non-zero status
+
+    """
+
+    udd = kwargs['udd'] if 'udd' in kwargs and kwargs['udd'] else {}
+    fields = dict(udd)
+    fields.update(target = kwargs['target'],
+                  udf2 = kwargs['udf2'] if 'udf2' in kwargs else '',
+                  udf3 = kwargs['udf3'] if 'udf3' in kwargs else '')
+
+    template = kwargs['udf1']
+    if not template:
+        raise ValueError("Missing command template (udf1)")
+
+    if udd.get('shell'):
+        argv = ['/bin/sh', '-c', template.format(**fields)]
+    else:
+        argv = [w.format(**fields) for w in shlex.split(str(template))]
+
+    request = {
+        'argv': argv,
+        'timeout': udd.get('timeout', DEFAULT_TIMEOUT),
+        'max_output': udd.get('max_output', DEFAULT_MAX_OUTPUT),
+        'env': udd.get('env')
+    }
+    pool = _pool
+    if pool is not None:
+        result = pool.run(request)
+    else:
+        # The controller's own descriptors are not passed to commands.
+        result = commandhelper.run(close_fds = True, **request)
+
+    if result['timed_out']:
+        raise RuntimeError("Command timed out: %s" % ' '.join(argv))
+    if result['rc'] != 0:
+        raise RuntimeError("Command exited with status %d: %s (%s)" % (
+            result['rc'], ' '.join(argv), result['stderr'].strip()[-200:]))
+
+    logging.info("Command completed: %s" % ' '.join(argv))
+
+    return result
+
+
+class _HelperPool(object):
+    """ A fixed number of helper processes; each runs one command at a
+        time.  Callers block until a helper is idle."""
+
+    def __init__(self, size):
+        self._idle = Queue.Queue()
+        self._size = size
+        for _ in range(size): self._idle.put(self._spawn())
+
+
+    def run(self, request):
+        """ Runs a request on an idle helper.
+            returns: response dictionary"""
+        helper = self._idle.get()
+        try:
+            helper.stdin.write(json.dumps(request) + '\n')
+            helper.stdin.flush()
+            line = helper.stdout.readline()
+            if not line: raise IOError("command helper exited")
+        except (IOError, OSError):
+            # Replace a helper which died.
+            helper.kill()
+            helper.wait()
+            self._idle.put(self._spawn())
+            raise
+        self._idle.put(helper)
+
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+
+    def close(self):
+        """ Stops the helpers once they are idle (the workers have
+            finished when the teardown hook is called)."""
+        for _ in range(self._size):
+            helper = self._idle.get()
+            helper.stdin.close() # the helper exits at end of input
+            helper.wait()
+            helper.stdout.close()
+
+
+    def _spawn(self):
+        """ returns: a new helper process"""
+        return subprocess.Popen([sys.executable, _HELPER],
+                                stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE,
+                                close_fds = True)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+
+commandhelper.py: Helper process for the command fault module.
+
+The command fault module may start a small pool of these processes
+once and send them commands over a pipe.  Commands are then forked from
+this small, single-threaded interpreter rather than from the large,
+multithreaded controller process.  Without a pool, the module calls
+run() in the controller.
+
+Each request and response is a single line of JSON.
+    request: {"argv": [...], "timeout": seconds, "max_output": bytes,
+              "env": {...}}
+    response: {"rc": exit status, "stdout": text, "stderr": text,
+               "truncated": bool, "timed_out": bool}
+
+"""
+
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import time
+
+_CHUNK = 4096
+
+
+def run(argv, timeout = None, max_output = 65536, env = None,
+        close_fds = False):
+    """ Runs a command in a process group of its own, capturing at most
+            max_output bytes of its stdout and stderr.  The process
+            group is killed after timeout seconds.
+        close_fds: true to close the caller's descriptors in the
+            command.  The helper holds no descriptors besides its own
+            pipes, so it skips the (costly in Python 2) sweep.
+        returns: response dictionary"""
+    proc_env = None
+    if env:
+        proc_env = dict(os.environ)
+        proc_env.update(env)
+
+    with open(os.devnull) as devnull:
+        proc = subprocess.Popen(argv, stdin = devnull,
+                                stdout = subprocess.PIPE,
+                                stderr = subprocess.PIPE,
+                                env = proc_env, close_fds = close_fds,
+                                preexec_fn = os.setsid)
+
+    deadline = time.time() + timeout if timeout else None
+    output = {proc.stdout: [], proc.stderr: []}
+    sizes = {proc.stdout: 0, proc.stderr: 0}
+    truncated = False
+    timed_out = False
+    pipes = [proc.stdout, proc.stderr]
+
+    while pipes:
+        wait = None
+        if deadline is not None:
+            wait = deadline - time.time()
+            if wait <= 0:
+                timed_out = True
+                # Children of the command (ie. of a shell) are killed too.
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except OSError:
+                    pass # the group has exited
+                break
+        readable, _, _ = select.select(pipes, [], [], wait)
+        for pipe in readable:
+            data = os.read(pipe.fileno(), _CHUNK)
+            if not data:
+                pipes.remove(pipe)
+                continue
+            # Output beyond the limit is read and discarded so the
+            # command never blocks on a full pipe.
+            room = max_output - sizes[pipe]
+            if room > 0: output[pipe].append(data[:room])
+            if len(data) > room: truncated = True
+            sizes[pipe] += len(data)
+
+    rc = proc.wait()
+    proc.stdout.close()
+    proc.stderr.close()
+
+    return {
+        'rc': rc,
+        'stdout': ''.join(output[proc.stdout]).decode('utf-8', 'replace'),
+        'stderr': ''.join(output[proc.stderr]).decode('utf-8', 'replace'),
+        'truncated': truncated,
+        'timed_out': timed_out
+    }
+
+
+def main():
+    # The controller handles terminal signals for the whole process group.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        line = sys.stdin.readline()
+        if not line: return # controller closed the pipe
+        try:
+            req = json.loads(line)
+            resp = run(req['argv'], req.get('timeout'),
+                       req.get('max_output', 65536), req.get('env'))
+        except Exception as err:
+            resp = {'error': '%s: %s' % (type(err).__name__, err)}
+        sys.stdout.write(json.dumps(resp) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,23 @@
 import logging
-import subprocess
 
-logging.basicConfig(level = logging.info,
+import procsignal
+
+logging.basicConfig(level = logging.INFO,
                     format='(%(threadName)-10s) %(message)s')
 
 def kill_leader(*args, **kwargs):
     """
-    kwargs['target']:  Linux process to kill
-    kwargs['udf1']:  Signal to send to pkill 
+    kwargs['target']:  Linux process to kill (matched against the full
+                       command line of root's processes)
+    kwargs['udf1']:  Signal to send (ie. '-TERM'); SIGTERM if not given
     """
 
     node = kwargs['target']
-    signal = (kwargs['udf1'] if kwargs['udf1'] and kwargs['udf1'] > 0
-                               else "") 
+    signum = procsignal.parse_signal(kwargs['udf1'])
+
+    hits = procsignal.signal_matching(node, signum, uid = 0)
 
-    subprocess.call(["pkill", signal, "-f", "-u", "root", node])
+    logging.info("Process killed: %s (pids: %s)" % 
+                 (node, ', '.join(str(pid) for pid, _ in hits)))
 
-    logging.info("Process killed: %s" % node)
+    return [pid for pid, _ in hits]
@@ -0,0 +1,216 @@
+"""
+
+procsignal.py: Fault module which delivers signals to local processes.
+
+Processes are matched by a regular expression against their full
+command line (as with 'pkill -f') and signalled directly with os.kill.
+This avoids the fork/exec of a pkill process on every activation.  An
+index of the processes' start times is kept.  Each process is indexed
+once, when its pid appears, so kernel threads are skipped without
+reading /proc again.  A kernel thread's pid which is reused between
+two matches is not noticed.  As with pkill -f, the current command line
+of every other process is read at each match, since a process may exec
+(ie. after a fork) or change its title.  Before a matching process is
+signalled, its start time is compared with the indexed one (a reused
+pid is indexed again and its own command line tested), and its owner is
+read again.
+
+"""
+
+import logging
+import os
+import re
+import signal
+import threading
+import time
+
+logging.basicConfig(level = logging.INFO,
+                    format='(%(threadName)-10s) %(message)s')
+
+PROC = '/proc'
+
+
+def kill_process(*args, **kwargs):
+    """
+
+    kwargs['target']: regular expression matched against the full
+                      command line of local processes
+    kwargs['udf1']: signal to send, by name or number (ie. '-TERM',
+                    'KILL', 9); SIGTERM if not given
+    kwargs['udd']: "user" : only signal processes of this user
+                   (name or uid)
+
+    returns: dictionary with the signalled PIDs and the latency of
+        each kill (seconds)
+
+    """
+
+    pattern = kwargs['target']
+    signum = parse_signal(kwargs['udf1'] if 'udf1' in kwargs else None)
+    udd = kwargs['udd'] if 'udd' in kwargs and kwargs['udd'] else {}
+    uid = _parse_user(udd['user']) if 'user' in udd else None
+
+    hits = signal_matching(pattern, signum, uid)
+
+    logging.info("Signal %d sent to '%s': %s" % (
+        signum, pattern,
+        ', '.join('%d (%.1fus)' % (pid, 1e6 * lat) for pid, lat in hits)
+        if hits else 'no matching process'))
+
+    return {'pids': [pid for pid, _ in hits],
+            'latency': [lat for _, lat in hits]}
+
+
+def signal_matching(pattern, signum, uid = None):
+    """ Sends a signal to every process whose command line matches.
+        pattern: regular expression searched for in the command line
+        signum: signal number
+        uid: if given, only processes owned by this uid are signalled
+        returns: list of (pid, kill latency in seconds) tuples"""
+    hits = []
+    for pid in _index.match(pattern, uid):
+        start = time.time()
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            # The process exited (or is not ours to signal).
+            _index.discard(pid)
+            continue
+        hits.append((pid, time.time() - start))
+    return hits
+
+
+def parse_signal(value):
+    """ value: signal name ('-TERM', 'SIGTERM', 'term'), number (9, '-9')
+            or empty
+        returns: signal number; SIGTERM if value is empty"""
+    if value is None or value == '':
+        return signal.SIGTERM
+    if isinstance(value, int):
+        return value
+
+    name = str(value).lstrip('-').upper()
+    if name.isdigit():
+        return int(name)
+    if not name.startswith('SIG'):
+        name = 'SIG' + name
+    signum = getattr(signal, name, None)
+    if not isinstance(signum, int):
+        raise ValueError("Unknown signal '%s'" % value)
+    return signum
+
+
+def _parse_user(user):
+    """ user: user name or uid
+        returns: uid"""
+    if isinstance(user, int) or str(user).isdigit():
+        return int(user)
+    import pwd
+    return pwd.getpwnam(user).pw_uid
+
+
+# Process flag of kernel threads (field 9 of /proc/<pid>/stat).
+_PF_KTHREAD = 0x00200000
+
+
+class _ProcessIndex(object):
+    """ Index of local processes: pid -> (start time, true if a kernel
+        thread)."""
+
+    def __init__(self):
+        self._procs = {}
+        self._patterns = {} # cache of compiled regular expressions
+        self._lock = threading.Lock()
+        self._self_pid = os.getpid()
+
+
+    def match(self, pattern, uid = None):
+        """ Refreshes the index and returns the matching processes.
+            pattern: regular expression searched for in the command line
+            uid: if given, only processes owned by this uid match
+            returns: list of matching pids"""
+        regex = self._patterns.get(pattern)
+        if regex is None:
+            regex = self._patterns[pattern] = re.compile(pattern)
+
+        with self._lock:
+            self._refresh()
+            candidates = [(pid, start)
+                          for pid, (start, kernel) in self._procs.items()
+                          if not kernel and pid != self._self_pid]
+
+        pids = []
+        for pid, start in candidates:
+            cmdline = self._read_cmdline(pid)
+            if cmdline is None or not regex.search(cmdline): continue
+            entry = self._read(pid)
+            if entry is None: continue # exited
+            if entry[0] != start:
+                # The pid was reused since it was indexed; the command
+                # line read may be the earlier process'.
+                with self._lock:
+                    self._procs[pid] = entry
+                if entry[1]: continue
+                cmdline = self._read_cmdline(pid)
+                if cmdline is None or not regex.search(cmdline) or \
+                        self._read(pid) != entry:
+                    continue
+            # The owner may have changed since the process started.
+            if uid is not None:
+                try:
+                    if os.stat(os.path.join(PROC, str(pid))).st_uid != uid:
+                        continue
+                except OSError:
+                    continue
+            pids.append(pid)
+        return pids
+
+
+    def discard(self, pid):
+        """ Removes a pid from the index."""
+        with self._lock:
+            self._procs.pop(pid, None)
+
+
+    def _refresh(self):
+        """ Adds processes which started and drops processes which
+            exited since the last refresh.  Indexed processes are not
+            read again (reused pids are found when they match)."""
+        live = set(int(n) for n in os.listdir(PROC) if n.isdigit())
+
+        for pid in [pid for pid in self._procs if pid not in live]:
+            del self._procs[pid]
+
+        for pid in live:
+            if pid not in self._procs:
+                entry = self._read(pid)
+                if entry is not None: self._procs[pid] = entry
+
+
+    def _read(self, pid):
+        """ returns: index entry of the process, (start time, true if a
+                kernel thread); None if the process has exited"""
+        try:
+            with open(os.path.join(PROC, str(pid), 'stat'), 'rb') as f:
+                stat = f.read()
+            # The command name (field 2) may contain spaces; the fields
+            # from 3 on follow its closing parenthesis.
+            fields = stat[stat.rindex(')') + 2:].split()
+            return (int(fields[19]), # field 22
+                    bool(int(fields[6]) & _PF_KTHREAD)) # field 9
+        except (IOError, OSError, ValueError, IndexError):
+            return None
+
+
+    def _read_cmdline(self, pid):
+        """ returns: current command line of the process; None if the
+                process has exited"""
+        try:
+            with open(os.path.join(PROC, str(pid), 'cmdline'), 'rb') as f:
+                cmdline = f.read()
+        except (IOError, OSError):
+            return None
+        return cmdline.rstrip('\0').replace('\0', ' ')
+
+
+_index = _ProcessIndex()
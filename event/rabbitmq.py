@@ -1,12 +1,47 @@
 import logging
 import pika
+import Queue
+import threading
+import time
+import uuid
 
 logging.basicConfig(level = logging.info,
                     format='(%(threadName)-10s) %(message)s')
 
-def send_msg(*args, **kwargs):
+_publishers = {} # node URI -> _Publisher created by setup()
+
+
+def setup(targets, config):
+    """ Scheduler hook called when the module is loaded.
+
+    targets: all targets of the SUT
+    config: the session's 'fault_config' dictionary (unused)
+
+    returns: dictionary mapping each AMQP target to a _Publisher, passed
+        to send_msg() and send_msg_batch() as their context.  The
+        publishers connect on first use and keep their connection.
+
+    """
+    for node in targets:
+        if node.startswith(('amqp://', 'amqps://')) and \
+                node not in _publishers:
+            _publishers[node] = _Publisher(node)
+    return dict(_publishers)
+
+
+def teardown():
+    """ Scheduler hook called when the session stops; closes the
+        publishers' connections."""
+    for publisher in _publishers.values():
+        publisher.close()
+    _publishers.clear()
+
+
+def send_msg(context = None, *args, **kwargs):
     """
 
+    context: the target's _Publisher from setup(); if None the message
+        is published on a connection of its own
     kwargs['target']: RabbitMQ node URI 
     kwargs['udf1']: RabbitMQ exhange to publish to 
     kwargs['udf2']: Msg topic 
@@ -22,6 +57,11 @@ def send_msg(*args, **kwargs):
     msg = (kwargs['udf3'] if kwargs['udf3'] and kwargs['udf3'] > 0
                           else "") 
 
+    if context is not None:
+        context.publish(exchange_name, routing_key, msg)
+        logging.info("Message sent to %s:%s:%s, body:  %s" % 
+            (node, exchange_name, routing_key, msg))
+        return
 
     parameters = pika.URLParameters(node)
     connection = pika.BlockingConnection(parameters)
@@ -32,9 +72,7 @@ def send_msg(*args, **kwargs):
                              type='topic')
 
 
-    channel.basic_publish(exchange=exchange_name,
-                          routing_key=routing_key,
-                          body=msg)
+    _publish(channel, exchange_name, routing_key, msg)
 
     connection.close()
 
@@ -42,20 +80,34 @@ def send_msg(*args, **kwargs):
         (node, exchange_name, routing_key, msg))
 
 
-def receive_msg(*args, **kwargs):
+def send_msg_batch(batch = 1, context = None, *args, **kwargs):
     """
 
+    batch: # of messages to send (activations of a poisson event)
+    context: the target's _Publisher from setup(); if None the batch is
+        published on a connection of its own
     kwargs['target']: RabbitMQ node URI 
-    kwargs['udf1']: RabbitMQ exhange to subscribe to 
-    kwargs['udf2']: Topic to subscribe to
+    kwargs['udf1']: RabbitMQ exhange to publish to 
+    kwargs['udf2']: Msg topic 
+    kwargs['udf3']: Msg body to deliver 
+
+    All messages of the batch are published on one connection.
 
     """
 
     node = kwargs['target']
     exchange_name = (kwargs['udf1'] if kwargs['udf1'] and kwargs['udf1'] > 0
                                else "") 
-    binding_key = (kwargs['udf2'] if kwargs['udf2'] and kwargs['udf2'] > 0
+    routing_key = (kwargs['udf2'] if kwargs['udf2'] and kwargs['udf2'] > 0
                             else "") 
+    msg = (kwargs['udf3'] if kwargs['udf3'] and kwargs['udf3'] > 0
+                          else "") 
+
+    if context is not None:
+        context.publish(exchange_name, routing_key, msg, batch)
+        logging.info("%d messages sent to %s:%s:%s, body:  %s" % 
+            (batch, node, exchange_name, routing_key, msg))
+        return
 
     parameters = pika.URLParameters(node)
     connection = pika.BlockingConnection(parameters)
@@ -65,20 +117,390 @@ def receive_msg(*args, **kwargs):
     channel.exchange_declare(exchange=exchange_name,
                              type='topic')
 
-    result = channel.queue_declare(exclusive=True)
-    queue_name = result.method.queue
+    for _ in xrange(batch):
+        _publish(channel, exchange_name, routing_key, msg)
+
+    connection.close()
+
+    logging.info("%d messages sent to %s:%s:%s, body:  %s" % 
+        (batch, node, exchange_name, routing_key, msg))
+
+
+def receive_msg(*args, **kwargs):
+    """
+
+    kwargs['target']: RabbitMQ node URI 
+    kwargs['udf1']: RabbitMQ exhange to subscribe to 
+    kwargs['udf2']: Topic to subscribe to
+    kwargs['udd']: "prefetch" : # of unacknowledged messages delivered
+                               to the consumer (default: 100)
+                   "ack_batch" : # of messages acknowledged at once
+                                (default: 50)
+
+    All subscriptions to the same node share a single consumer service
+    (connection, queue and thread).  The binding is added to the service
+    and the call returns without waiting for messages.  The prefetch and
+    ack_batch values of the first subscription to a node are used.
+
+    """
+
+    node = kwargs['target']
+    exchange_name = (kwargs['udf1'] if kwargs['udf1'] and kwargs['udf1'] > 0
+                               else "") 
+    binding_key = (kwargs['udf2'] if kwargs['udf2'] and kwargs['udf2'] > 0
+                            else "") 
+    udd = kwargs['udd'] if 'udd' in kwargs and kwargs['udd'] else {}
+
+    service = _get_consumer(node, 
+                            udd.get('prefetch', DEFAULT_PREFETCH),
+                            udd.get('ack_batch', DEFAULT_ACK_BATCH))
+    if service.bind(exchange_name, binding_key):
+        logging.info("Subscribed to %s:%s:%s" % 
+            (node, exchange_name, binding_key))
+
+    return service.get_stats()
+
+
+def consume_msg(stop_event = None, *args, **kwargs):
+    """
+
+    stop_event: threading.Event set when the daemon must stop (a_model
+                'daemon')
+    kwargs['target']: RabbitMQ node URI 
+    kwargs['udf1']: RabbitMQ exhange to subscribe to 
+    kwargs['udf2']: Topic to subscribe to
+    kwargs['udd']: "prefetch" : # of unacknowledged messages delivered
+                               to the consumer (default: 100)
+                   "ack_batch" : # of messages acknowledged at once
+                                (default: 50)
+
+    Consumes from its own connection and exclusive queue until
+    stop_event is set.  Connection failures are raised so that the
+    daemon is restarted by the Scheduler.
+
+    returns: dictionary with the # of messages received
+
+    """
+
+    if stop_event is None:
+        raise ValueError("consume_msg runs as a daemon (a_model 'daemon')")
+
+    node = kwargs['target']
+    exchange_name = (kwargs['udf1'] if kwargs['udf1'] and kwargs['udf1'] > 0
+                               else "") 
+    binding_key = (kwargs['udf2'] if kwargs['udf2'] and kwargs['udf2'] > 0
+                            else "") 
+    udd = kwargs['udd'] if 'udd' in kwargs and kwargs['udd'] else {}
+    ack_batch = max(udd.get('ack_batch', DEFAULT_ACK_BATCH), 1)
+    counters = {'received': 0}
+    unacked = [0, None] # deliveries since the last ack, latest tag
+
+    def on_message(ch, method, properties, body):
+        counters['received'] += 1
+        logging.debug("Message received: %s:%r" % (method.routing_key, body))
+        unacked[0] += 1
+        unacked[1] = method.delivery_tag
+        if unacked[0] >= ack_batch:
+            ch.basic_ack(delivery_tag=unacked[1], multiple=True)
+            unacked[0] = 0
+
+    connection = pika.BlockingConnection(pika.URLParameters(node))
+    try:
+        channel = connection.channel()
+        channel.basic_qos(prefetch_count=udd.get('prefetch',
+                                                 DEFAULT_PREFETCH))
+        channel.exchange_declare(exchange=exchange_name, type='topic')
+        queue_name = channel.queue_declare(exclusive=True).method.queue
+        channel.queue_bind(exchange=exchange_name, queue=queue_name,
+                           routing_key=binding_key)
+        channel.basic_consume(on_message, queue=queue_name, no_ack=False)
+        logging.info("Consuming %s:%s:%s" % 
+            (node, exchange_name, binding_key))
+
+        while not stop_event.isSet():
+            connection.process_data_events(time_limit=_POLL_INTERVAL)
+            if unacked[0]:
+                channel.basic_ack(delivery_tag=unacked[1], multiple=True)
+                unacked[0] = 0
+    finally:
+        if connection.is_open: connection.close()
+
+    return counters
+
+
+def _publish(channel, exchange_name, routing_key, msg):
+    """ Publishes one message.  The timestamp allows consumers to
+        measure delivery lag; the message id allows them to detect
+        redeliveries."""
+    channel.basic_publish(exchange=exchange_name,
+                          routing_key=routing_key,
+                          body=msg,
+                          properties=pika.BasicProperties(
+                              timestamp=int(time.time()),
+                              message_id=uuid.uuid4().hex))
+
+
+class _Publisher(object):
+    """ A connection to one node kept open between send_msg() calls.
+        pika connections are not thread safe, so worker threads publish
+        in turn.  A connection which fails is dropped and the next
+        publish reconnects."""
+
+    def __init__(self, node):
+        self._node = node
+        self._connection = None
+        self._channel = None
+        self._declared = set() # exchanges declared on the connection
+        self._lock = threading.Lock()
+
+
+    def publish(self, exchange_name, routing_key, msg, count = 1):
+        """ Publishes count messages; exceptions are passed on after
+                the connection is dropped."""
+        with self._lock:
+            try:
+                if self._channel is None:
+                    self._connection = pika.BlockingConnection(
+                        pika.URLParameters(self._node))
+                    self._channel = self._connection.channel()
+                    self._declared = set()
+                if exchange_name not in self._declared:
+                    self._channel.exchange_declare(exchange=exchange_name,
+                                                   type='topic')
+                    self._declared.add(exchange_name)
+                for _ in xrange(count):
+                    _publish(self._channel, exchange_name, routing_key, msg)
+            except Exception:
+                self._close()
+                raise
+
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+    def _close(self):
+        connection = self._connection
+        self._connection = self._channel = None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except Exception as err:
+                logging.info("error: publisher %s- %s" % (self._node, err))
+
+
+def consumer_stats():
+    """ returns: dictionary mapping node URI to the counters of its
+            consumer service"""
+    with _consumers_lock:
+        services = _consumers.items()
+    return dict((node, s.get_stats()) for node, s in services)
+
+
+# Defaults for consumer services.
+DEFAULT_PREFETCH = 100
+DEFAULT_ACK_BATCH = 50
+
+# Maximum time (seconds) between the handling of a delivery and its
+# acknowledgement, and between a subscription request and its binding.
+_POLL_INTERVAL = 0.2
+
+# Time (seconds) between polls while deliveries wait to be acknowledged,
+# so that handled deliveries release the prefetch window promptly.
+_ACK_POLL_INTERVAL = 0.002
+
+# Delay (seconds) before reconnecting after a connection failure.
+_RECONNECT_DELAY = 5
+
+_consumers = {} # node URI -> _ConsumerService
+_consumers_lock = threading.Lock()
+
+
+def _get_consumer(node, prefetch, ack_batch):
+    """ returns: the consumer service for the node; the service is
+            created and started on first use"""
+    with _consumers_lock:
+        service = _consumers.get(node)
+        if service is None:
+            service = _consumers[node] = _ConsumerService(node, prefetch,
+                                                          ack_batch)
+            service.start()
+    return service
+
+
+class _ConsumerService(threading.Thread):
+    """ A single connection and exclusive queue consuming all bindings
+        subscribed to one node.  pika connections are not thread safe, so
+        bindings requested by worker threads are applied by the service
+        thread between polls of the connection.  Deliveries are handed to
+        a separate handler thread so that handling never blocks the pika
+        callback.  They are acknowledged in batches by the service thread
+        once handled, so the prefetch count bounds the deliveries waiting
+        to be handled and a delivery which was not handled is redelivered
+        after a failure."""
+
+    def __init__(self, node, prefetch, ack_batch):
+        threading.Thread.__init__(self, name = "rabbitmq-consumer-%s" % node)
+        self.daemon = True
+        self._node = node
+        self._prefetch = prefetch
+        self._ack_batch = max(ack_batch, 1)
+        self._bindings = set() # (exchange, binding key)
+        self._bindings_lock = threading.Lock()
+        self._requests = Queue.Queue() # bindings not yet applied
+        self._deliveries = Queue.Queue() # messages not yet handled
+        self._handled_tags = Queue.Queue() # (connection, delivery tag) of
+                                           # handled messages not yet
+                                           # acknowledged
+        self._connection_count = 0 # identifies the current connection
+        self._unacked = 0 # handled deliveries since the last
+                          # acknowledgement
+        self._outstanding = 0 # deliveries on this connection not yet
+                              # acknowledged
+        self._last_tag = None # delivery tag of the latest handled delivery
+
+        # Counters
+        self._received = 0
+        self._handled = 0
+        self._lag_total = 0.0 # sum of delivery lag (timestamped msgs)
+        self._lag_count = 0
+        self._lag_max = 0.0
+
+        handler = threading.Thread(name = "rabbitmq-handler-%s" % node,
+                                   target = self._handle)
+        handler.daemon = True
+        handler.start()
+
+
+    def bind(self, exchange_name, binding_key):
+        """ Requests a binding on the service's queue.
+            returns: true if the binding is new"""
+        with self._bindings_lock:
+            if (exchange_name, binding_key) in self._bindings: return False
+            self._bindings.add((exchange_name, binding_key))
+        self._requests.put((exchange_name, binding_key))
+        return True
+
+
+    def get_stats(self):
+        """ returns: dictionary of consumer counters"""
+        return {
+            'bindings': len(self._bindings),
+            'received': self._received,
+            'handled': self._handled,
+            'backlog': self._deliveries.qsize(),
+            'lag_mean': (self._lag_total / self._lag_count 
+                         if self._lag_count else 0.0),
+            'lag_max': self._lag_max
+        }
+
+
+    def run(self):
+        """ Entry point for threading.Thread (consumer service thread)"""
+        while True:
+            try:
+                self._consume()
+            except Exception as err:
+                logging.info("error: consumer %s- %s" % (self._node, err))
+            # Re-request all bindings on the new connection (binding
+            # twice is harmless).
+            with self._bindings_lock:
+                bindings = list(self._bindings)
+            for b in bindings: self._requests.put(b)
+            time.sleep(_RECONNECT_DELAY)
+
+
+    def _consume(self):
+        """ Connects to the node and consumes until the connection fails."""
+        connection = pika.BlockingConnection(pika.URLParameters(self._node))
+        try:
+            channel = connection.channel()
+            channel.basic_qos(prefetch_count=self._prefetch)
+            result = channel.queue_declare(exclusive=True)
+            queue_name = result.method.queue
+            declared = set() # exchanges declared on this connection
+            # Deliveries of a previous connection are redelivered on this
+            # one; the handler skips them and their tags are not acked.
+            self._connection_count += 1
+            self._unacked = 0
+            self._outstanding = 0
+
+            channel.basic_consume(self._on_message,
+                                  queue=queue_name,
+                                  no_ack=False)
+
+            while True:
+                connection.process_data_events(
+                    time_limit=_ACK_POLL_INTERVAL if self._outstanding
+                               else _POLL_INTERVAL)
+                self._apply_bindings(channel, queue_name, declared)
+                self._ack_handled(channel)
+        finally:
+            if connection.is_open: connection.close()
+
+
+    def _apply_bindings(self, channel, queue_name, declared):
+        """ Binds the queue for all pending subscription requests."""
+        while True:
+            try:
+                exchange_name, binding_key = self._requests.get_nowait()
+            except Queue.Empty:
+                return
+            if exchange_name not in declared:
+                channel.exchange_declare(exchange=exchange_name,
+                                         type='topic')
+                declared.add(exchange_name)
+            channel.queue_bind(exchange=exchange_name,
+                               queue=queue_name,
+                               routing_key=binding_key)
+
+
+    def _ack_handled(self, channel):
+        """ Acknowledges the handled deliveries in batches, and a partial
+                batch once the handler has no deliveries waiting.  The
+                handler handles deliveries in order, so acknowledging the
+                latest handled tag with multiple=True only covers handled
+                deliveries."""
+        while True:
+            try:
+                connection, tag = self._handled_tags.get_nowait()
+            except Queue.Empty:
+                break
+            if connection != self._connection_count: continue
+            self._last_tag = tag
+            self._unacked += 1
+            if self._unacked >= self._ack_batch:
+                channel.basic_ack(delivery_tag=tag, multiple=True)
+                self._outstanding -= self._unacked
+                self._unacked = 0
+        if self._unacked and self._deliveries.empty():
+            channel.basic_ack(delivery_tag=self._last_tag, multiple=True)
+            self._outstanding -= self._unacked
+            self._unacked = 0
 
-    channel.queue_bind(exchange=exchange_name,
-                       queue=queue_name,
-                       routing_key=binding_key)
 
+    def _on_message(self, ch, method, properties, body):
+        """ pika callback; queues the message for the handler."""
+        self._received += 1
+        if properties.timestamp:
+            lag = max(time.time() - properties.timestamp, 0.0)
+            self._lag_total += lag
+            self._lag_count += 1
+            if lag > self._lag_max: self._lag_max = lag
 
-    logging.info('Waiting for messages')
-    def callback(ch, method, properties, body):
-        logging.info("Message received: %r" % body)
+        self._outstanding += 1
+        self._deliveries.put((self._connection_count, method.delivery_tag,
+                              method.routing_key, body))
 
-    channel.basic_consume(callback,
-                          queue=queue_name,
-                          no_ack=True)
 
-    channel.start_consuming()
+    def _handle(self):
+        """ Entry point for the handler thread."""
+        while True:
+            connection, tag, routing_key, body = self._deliveries.get()
+            if connection != self._connection_count: continue
+            try:
+                self._handled += 1
+                logging.info("Message received: %s:%r" % (routing_key, body))
+            finally:
+                self._handled_tags.put((connection, tag))
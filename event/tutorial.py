@@ -37,6 +37,48 @@ def electric_shock(*args, **kwargs):
                  % (node, voltage))
 
 
+def smolder(stop_event = None, *args, **kwargs):
+    """
+
+    stop_event: threading.Event set when the daemon must stop (a_model
+                'daemon')
+    kwargs['target']: node to smolder
+    kwargs['udf1']: seconds between puffs of smoke
+    kwargs['udd']:  "flare_up" : seconds after which the fire flares up
+                    (an exception, so that the daemon is restarted)
+
+    """
+
+    node = kwargs['target']
+    interval = (kwargs['udf1'] if kwargs['udf1'] 
+                                 and type(kwargs['udf1']) is int 
+                                 and kwargs['udf1'] > 0 
+                               else 1) 
+    udd = kwargs['udd'] if 'udd' in kwargs and kwargs['udd'] else {}
+    flare_up = udd.get('flare_up')
+    start = time.time()
+
+    logging.info('Node: [%s] Smoldering ...' % node)
+    while not stop_event.wait(interval):
+        if flare_up and time.time() - start >= flare_up:
+            raise RuntimeError('Node: [%s] Flare up!' % node)
+        logging.info('Node: [%s] Puff' % node)
+    logging.info('Node: [%s] Extinguished' % node)
+
+
+def static_discharge(batch = 1, *args, **kwargs):
+    """
+
+    batch: # of discharges (activations of a poisson event)
+    kwargs['target']: node to discharge into
+
+    """
+
+    node = kwargs['target']
+
+    logging.info('Node: [%s] %d discharges - Zap!' % (node, batch))
+
+
 def tranquilize(*args, **kwargs):
     """
 
@@ -66,3 +108,21 @@ def nuclear_air_burst(*args, **kwargs):
 
     """
     logging.info('Electromagnetic pulse in 10 seconds ...')
+
+
+def slow_burn(*args, **kwargs):
+    """
+
+    kwargs['target']: node to burn
+    kwargs['udf1']: burn duration (seconds)
+
+    """
+
+    node = kwargs['target']
+    duration = (kwargs['udf1'] if kwargs['udf1'] 
+                                 and type(kwargs['udf1']) is int 
+                                 and kwargs['udf1'] > 0 
+                               else 1) 
+
+    logging.info("Node: [%s] Burning for %d seconds ..." % (node, duration))
+    time.sleep(duration)
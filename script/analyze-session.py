@@ -0,0 +1,578 @@
+#!/usr/bin/env python
+#
+# analyze-session  Estimates the behavior of a session before it is run.
+#
+# The session file is read with SessionConfig and many replications of
+# the session are simulated at once with NumPy (required by this script
+# only).  Each replication is a run of the SystemComponent state machine
+# of every active component (family members are simulated individually)
+# with one checkpoint per simulated second, using the probabilities of
+# core/stochastic.py.  Nothing is executed against the SUT.
+#
+# Reported:
+#   - activations (and fault executions, counting fan out) per event
+#   - time spent Nonoperable per component
+#   - the number of concurrently Nonoperable components and the number
+#     of fault executions started by a single checkpoint
+#
+# Simulated checkpoints are taken 1, 2, ... seconds after the components
+# are initialized.  Processing time and scheduling jitter of a real
+# session are not modeled.  Intensity profiles (core/intensity.py) scale
+# the hazard models as in a session whose first checkpoint is the
+# simulated one at 1 second.  Daemon and triggered events (a_model
+# 'daemon' and 'triggered') are not evaluated at checkpoints and are left
+# out, so cascades of triggered events are not simulated.
+#
+# examples:
+#   analyze-session.py test/tutorial-mixed.json
+#   analyze-session.py -n 200 -T 86400 test/tutorial-family.json
+
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'core')
+sys.path.insert(0, CORE)
+
+from event import RATE_MODELS
+from rangepattern import RangePattern
+from sessionconfig import SessionConfig
+import stochastic
+
+# Percentiles reported across replications.
+PERCENTILES = (50, 90, 99)
+
+
+def main():
+    args = get_arg_parser().parse_args()
+
+    if np is None:
+        sys.stderr.write("analyze-session.py: error: NumPy is required\n")
+        sys.exit(1)
+
+    try:
+        config = SessionConfig(args.session_config_file)
+        model = SessionModel(config, args.duration)
+    except IOError as err:
+        sys.stderr.write("analyze-session.py: error: %s- %s\n"
+                         % (err.strerror, err.filename))
+        sys.exit(2)
+    except ValueError as err:
+        sys.stderr.write("analyze-session.py: error: %s- %s\n"
+                         % (err.args[1], err.args[0]))
+        sys.exit(1)
+
+    start = time.time()
+    result = model.simulate(args.replications, np.random.RandomState(args.seed))
+    elapsed = time.time() - start
+
+    if args.json:
+        json.dump(result, sys.stdout, indent = 2, sort_keys = True)
+        print('')
+        return
+
+    print("%s: %d replications of %ds (%d components, %d events) in %.1fs"
+          % (config.get_system_name(), args.replications, args.duration,
+             model.components, model.events, elapsed))
+    report(result)
+
+
+class SessionModel(object):
+    """ The events of every active component of a session, flattened
+        into parameter vectors.  Each component column (a component or a
+        family member) has the same number of event slots, in
+        SystemComponent evaluation order (operable, then nonoperable);
+        unused slots are never eligible.  Event k is slot k % slots of
+        column k // slots."""
+
+    def __init__(self, config, duration):
+        """ config: a SessionConfig instance
+            duration: simulated session length in seconds"""
+        self.duration = duration
+        self.groups = [] # (component or family id, # of members, events,
+                         # first column) per report row
+        columns = [] # list of event tuples per component column
+
+        for c_id, targets, _, family in config.get_active_components():
+            members = RangePattern(c_id).get_count() if family else 1
+            events = []
+            for state in (True, False):
+                for e_id, instances in config.get_events_for_component(
+                        c_id, state):
+                    m = config.get_model_for_event(c_id, e_id)
+                    if m.a_model in (SessionConfig.EVENT_AMOD_DAEMON,
+                                     SessionConfig.EVENT_AMOD_TRIGGERED):
+                        continue
+                    fan = (len(targets)
+                           if m.fan_out == SessionConfig.EVENT_FAN_ALL
+                           else m.fan_out)
+                    events.append((e_id, state, m, instances, fan))
+            if not any(e[3] for e in events):
+                continue # always Operable, never activates
+
+            self.groups.append((c_id, members, events, len(columns)))
+            slots = [(state, m, fan) for _, state, m, instances, fan in events
+                     for _ in range(instances)]
+            columns.extend([slots] * members)
+
+        self.components = len(columns)
+        self.slots = max([len(c) for c in columns] or [0])
+        # Unused slots get a model which is never eligible.
+        unused = (True, None, 0)
+        models = [c[i] if i < len(c) else unused
+                  for c in columns for i in range(self.slots)]
+        self.events = sum(len(c) for c in columns)
+
+        def get(f, dtype = float, default = 0):
+            return np.array([f(m) if m else default for _, m, _ in models],
+                            dtype = dtype)
+
+        self.operable = np.array([state for state, _, _ in models])
+        self.fan = np.array([fan for _, _, fan in models], dtype = np.intp)
+        self.trans = get(lambda m: bool(m.state_trans), bool)
+        self.singular = get(
+            lambda m: m.a_model == SessionConfig.EVENT_AMOD_SINGLE, bool)
+        self.threshold = get(lambda m: m.thrld, np.intp, duration + 1)
+        self.used = get(lambda m: True, bool, False)
+        self.eff_start = get(lambda m: m.eff_s, default = -1)
+        self.eff_end = get(lambda m: m.eff_e, default = -1)
+
+        # Rate models are evaluated every tick checkpoints.
+        self.tick = get(lambda m: m.tick if m.p_model in RATE_MODELS
+                        else 1, np.intp, 1)
+
+        # IntensityProfile scaling each rate model, as Event selects it.
+        session_intensity = config.get_intensity()
+        intensity = [(m.intensity if m.intensity is not None
+                      else session_intensity)
+                     if m and m.p_model in RATE_MODELS else None
+                     for _, m, _ in models]
+        scaled = np.array([p is not None for p in intensity], dtype = bool)
+
+        # Constant per evaluation probabilities; 0 for the other models.
+        self.p_const = get(
+            lambda m: 1.0 if m.p_model == SessionConfig.EVENT_PMOD_DETER
+            else stochastic.exponential_probability(m.mttf, m.tick)
+            if m.p_model == SessionConfig.EVENT_PMOD_EXP else 0.0)
+        self.p_const[scaled] = 0.0
+
+        # Scaled exponential models have the hazard -log(1 - p) per
+        # evaluation, times the profile's factor.
+        self.hazard = np.flatnonzero(scaled & get(
+            lambda m: m.p_model == SessionConfig.EVENT_PMOD_EXP, bool))
+        self.hazard_rate = -np.log1p(-np.array(
+            [stochastic.exponential_probability(models[k][1].mttf,
+                                                models[k][1].tick)
+             for k in self.hazard], dtype = float))
+        self.hazard_scaled = _group_by_profile(self.hazard, intensity,
+                                               models, duration)
+
+        # Normal and Weibull probabilities depend only on the (whole
+        # second) elapsed time and the tick; they are tabulated once per
+        # distinct model.
+        self.tabulated = np.flatnonzero(get(
+            lambda m: m.p_model in (SessionConfig.EVENT_PMOD_NORM,
+                                    SessionConfig.EVENT_PMOD_WEI), bool))
+        tables, rows, offsets = {}, [], []
+        for k in self.tabulated:
+            m = models[k][1]
+            key = (m.p_model, m.mttf, m.sd, m.shape, m.tick)
+            if key not in tables:
+                tables[key] = len(rows) * (duration + 1)
+                rows.append(self._tabulate(m, duration))
+            offsets.append(tables[key])
+        self.table = np.concatenate(rows) if rows else np.zeros(0)
+        self.table_offset = np.array(offsets, dtype = np.intp)
+
+        # Tabulated models scaled by a profile.
+        self.scaled = _group_by_profile(self.tabulated, intensity, models,
+                                        duration)
+
+        # Poisson models draw a number of activations per evaluation,
+        # with mean rate * tick (scaled by a profile).
+        self.poisson = np.flatnonzero(get(
+            lambda m: m.p_model == SessionConfig.EVENT_PMOD_POISSON, bool))
+        self.poisson_mean = np.array(
+            [models[k][1].rate * models[k][1].tick for k in self.poisson],
+            dtype = float)
+        self.poisson_scaled = _group_by_profile(self.poisson, intensity,
+                                                models, duration)
+
+        # State of the random model is simulated explicitly.
+        self.random = np.flatnonzero(get(
+            lambda m: m.p_model == SessionConfig.EVENT_PMOD_RANDOM, bool))
+        self.r_range = np.array([models[k][1].r_range for k in self.random],
+                                dtype = float)
+        self.r_fixed = np.array(
+            [models[k][1].r_w_type == SessionConfig.EVENT_RAND_FIXED
+             for k in self.random], dtype = bool)
+
+
+    def _tabulate(self, m, duration):
+        """ m: a ModelType instance with a hazard p_model
+            duration: largest elapsed time
+            returns: array of probabilities indexed by elapsed seconds"""
+        p = np.zeros(duration + 1)
+        for t in range(1, duration + 1):
+            if m.p_model == SessionConfig.EVENT_PMOD_NORM:
+                p[t] = stochastic.normal_probability(m.mttf, m.sd, t, m.tick)
+            else:
+                p[t] = stochastic.weibull_probability(m.shape, m.mttf, t,
+                                                      m.tick)
+        return p
+
+
+    def simulate(self, n, rng):
+        """ Simulates n replications of the session.  Event arrays have
+                the shape (component column, slot, replication); the
+                flat (event, replication) view is used to select events
+                by model.
+            n: number of replications
+            rng: a numpy RandomState instance
+            returns: dictionary of statistics"""
+        C, S = self.components, self.slots
+        K = C * S
+        operable = np.ones((C, 1, n), dtype = bool)
+        last = np.zeros((C, 1, n), dtype = np.intp) # time of the last event
+        retired = np.zeros((C, S, n), dtype = bool) # singular events
+                                                    # activated
+        count = np.zeros((C, S, n), dtype = np.int32) # activations
+        nonop_time = np.zeros((C, n), dtype = np.int32)
+        concurrent = np.zeros(C + 1, dtype = np.int64) # seconds per # of
+                                                       # Nonoperable comps.
+        max_concurrent = np.zeros(n, dtype = np.intp)
+        max_burst = np.zeros(n, dtype = np.intp) # fault executions started
+                                                 # by one checkpoint
+        slot = lambda v: v.reshape(C, S, 1)
+        col = lambda v: v[:, None]
+        state = slot(self.operable)
+        used = slot(self.used)
+        threshold = slot(self.threshold)
+        singular = slot(self.singular)
+        # The eligibility conditions which cannot change an event's
+        # eligibility are skipped (at least 1 second elapses between
+        # two activations of a component).
+        thresholds = (self.threshold[self.used] > 1).any()
+        singulars = self.singular.any()
+        # Per slot weights for the sums over the slots of each column.
+        trans = self.trans.reshape(C, S).astype(np.uint8)
+        fan = self.fan.reshape(C, S)
+
+        deterministic = slot(self.p_const >= 1.0)
+
+        # Hazard models with a tick count the eligible checkpoints down
+        # to their next evaluation, as Event does.
+        T = np.flatnonzero(self.tick > 1)
+        t_tick = col(self.tick[T])
+        t_countdown = np.repeat(t_tick, n, axis = 1)
+
+        # The exponential hazard has the same probability at every
+        # checkpoint, so the number of eligible checkpoints until it
+        # occurs is geometric.  It is drawn once per activation and
+        # counted down instead of drawing a number per checkpoint.
+        E = np.flatnonzero((self.p_const > 0.0) & (self.p_const < 1.0))
+        p_exp = np.repeat(col(self.p_const[E]), n, axis = 1)
+        countdown = rng.geometric(p_exp) if len(E) else None
+
+        # Scaled exponential hazards change with the profile's factor.
+        # The hazard left until the next activation is drawn instead
+        # (the same for factor 1), and counted down by the hazard of
+        # each eligible checkpoint.
+        X = self.hazard
+        x_rate = self.hazard_rate
+        x_left = rng.exponential(size = (len(X), n))
+
+        # Normal and Weibull hazards draw a number per checkpoint.
+        H = self.tabulated
+        table_offset = col(self.table_offset)
+        h_column = H // S # component column of each event
+
+        Q = self.poisson
+        q_mean = col(self.poisson_mean)
+        # Singular events are activated once, however many draws.
+        q_max = np.where(col(self.singular[Q]), 1, np.iinfo(np.int32).max)
+
+        R = self.random
+        r_low = col(self.threshold[R])
+        r_range = col(self.r_range)
+        r_fixed = col(self.r_fixed)
+        r_time = np.zeros((len(R), n))
+        r_end = np.zeros((len(R), n))
+        r_set = np.zeros((len(R), n), dtype = bool)
+
+        sequenced = (self.eff_start != -1).any()
+        in_window = True
+
+        for t in xrange(1, self.duration + 1) if self.events else ():
+            if sequenced:
+                in_window = slot((self.eff_start == -1) |
+                                 ((self.eff_start <= t) &
+                                  ((self.eff_end == -1) |
+                                   (t <= self.eff_end))))
+
+            elapsed = t - last
+            eligible = operable == state
+            eligible &= used
+            if sequenced: eligible &= in_window
+            if thresholds: eligible &= elapsed >= threshold
+            if singulars: eligible &= ~retired
+
+            active = eligible & deterministic
+            flat = active.reshape(K, n)
+            evaluated = eligible.reshape(K, n)
+            if len(T):
+                evaluated = evaluated.copy()
+                e = evaluated[T]
+                t_countdown -= e
+                due = e & (t_countdown == 0)
+                t_countdown = np.where(due, t_tick, t_countdown)
+                evaluated[T] = due
+
+            if len(E):
+                e = evaluated[E]
+                countdown -= e
+                fire = e & (countdown == 0)
+                if fire.any():
+                    countdown[fire] = rng.geometric(p_exp[fire])
+                flat[E] = fire
+
+            if len(X):
+                e = evaluated[X]
+                x_left -= e * col(x_rate *
+                                  _factors(self.hazard_scaled, t))
+                fire = e & (x_left <= 0.0)
+                if fire.any():
+                    x_left[fire] = rng.exponential(size = fire.sum())
+                flat[X] = fire
+
+            if len(H):
+                p = self.table[table_offset + elapsed[h_column, 0]]
+                if self.scaled:
+                    # The hazard rate is scaled by the mean factor over
+                    # the tick; session time starts at the first
+                    # checkpoint.
+                    p = 1.0 - np.power(1.0 - p,
+                                       col(_factors(self.scaled, t)))
+                flat[H] = evaluated[H] & (
+                    rng.random_sample(p.shape) <= p)
+
+            # Activations beyond the first of a poisson model.
+            extra = None
+            if len(Q):
+                mean = q_mean
+                if self.poisson_scaled:
+                    mean = q_mean * col(_factors(self.poisson_scaled, t))
+                draws = rng.poisson(np.broadcast_to(mean, (len(Q), n)))
+                draws *= evaluated[Q]
+                np.minimum(draws, q_max, out = draws)
+                flat[Q] = draws > 0
+                if (draws > 1).any():
+                    extra = np.zeros((K, n), dtype = np.int32)
+                    extra[Q] = np.maximum(draws - 1, 0)
+
+            if len(R):
+                e = eligible.reshape(K, n)[R]
+                fire = e & r_set & (t >= r_time)
+                draw = e & ~r_set & (t > r_end)
+                if draw.any():
+                    r_time = np.where(draw, r_end + np.floor(
+                        r_low + rng.random_sample(r_time.shape) *
+                        (r_range - r_low + 1)), r_time)
+                    r_end = np.where(draw, np.where(r_fixed, t + r_range,
+                                                    r_time), r_end)
+                r_set = (r_set | draw) & ~fire
+                flat[R] = fire
+
+            if active.any():
+                if singulars: retired |= active & singular
+                a = active.view(np.uint8)
+                activations = (a if extra is None
+                               else a + extra.reshape(C, S, n))
+                count += activations
+
+                # Components with an activation; their state toggles once
+                # per activated state transition event.
+                last[active.any(axis = 1)[:, None, :]] = t
+                operable ^= (np.einsum('csn,cs->cn', a, trans)[:, None, :]
+                             & 1).astype(bool)
+                np.maximum(max_burst,
+                           np.einsum('csn,cs->n', activations, fan),
+                           out = max_burst)
+
+            nonop = C - operable.sum(axis = (0, 1))
+            nonop_time += ~operable[:, 0]
+            concurrent += np.bincount(nonop, minlength = C + 1)
+            np.maximum(max_concurrent, nonop, out = max_concurrent)
+
+        return self._statistics(count, nonop_time, concurrent,
+                                max_concurrent, max_burst)
+
+
+    def _statistics(self, count, nonop_time, concurrent, max_concurrent,
+                    max_burst):
+        """ returns: dictionary of statistics from the simulation arrays"""
+        events, components = [], []
+        for c_id, members, model_events, first in self.groups:
+            columns = slice(first, first + members)
+            offset = 0 # first slot of the event
+            for e_id, state, m, instances, fan in model_events:
+                # Sum the instances of the event and the family members.
+                n = (count[columns, offset:offset + instances]
+                     .sum(axis = (0, 1)) / float(members))
+                offset += instances
+                if not instances: continue
+                events.append({
+                    'component': c_id, 'event': e_id, 'fault': m.fault,
+                    'state': 'operable' if state else 'nonoperable',
+                    'activations': _summary(n),
+                    'executions': _summary(n * fan)
+                })
+            t = nonop_time[columns].ravel()
+            components.append({
+                'component': c_id, 'members': members,
+                'nonoperable_seconds': _summary(t),
+                'nonoperable_fraction': float(t.mean()) / self.duration
+            })
+
+        # Time weighted percentiles of the concurrent Nonoperable count.
+        cumulative = np.cumsum(concurrent) / float(max(concurrent.sum(), 1))
+        return {
+            'duration': self.duration,
+            'replications': len(max_burst),
+            'events': events,
+            'components': components,
+            'concurrent_nonoperable': dict(
+                [('p%d' % q, int(np.searchsorted(cumulative, q / 100.0)))
+                 for q in PERCENTILES] +
+                [('max', _summary(max_concurrent))]),
+            'checkpoint_executions_max': _summary(max_burst)
+        }
+
+
+def _summary(values):
+    """ values: array of per replication values
+        returns: dictionary with the mean and percentiles"""
+    s = {'mean': float(np.mean(values))}
+    for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        s['p%d' % q] = float(v)
+    return s
+
+
+def _group_by_profile(indexes, intensity, models, duration):
+    """ Groups the events scaled by an intensity profile, and tabulates
+            the mean factor of each group over its tick at every
+            simulated time (session time starts at the first
+            checkpoint).
+        indexes: array of event indexes
+        intensity: IntensityProfile (or None) of each event
+        models: (state, ModelType, fan out) of each event
+        duration: simulated session length in seconds
+        returns: tuple (array of factors indexed by simulated time and
+            group, array of the group of each event in indexes); None if
+            no event is scaled.  Group 0 has the factor 1."""
+    groups = {}
+    rows = []
+    for k in indexes:
+        key = ((intensity[k], models[k][1].tick)
+               if intensity[k] is not None else None)
+        if key is not None and key not in groups:
+            groups[key] = len(groups) + 1
+        rows.append(groups[key] if key is not None else 0)
+    if not groups: return None
+
+    table = np.ones((duration + 1, len(groups) + 1))
+    for (profile, tick), g in groups.items():
+        table[1:, g] = [profile.get_mean(t - 1, tick)
+                        for t in xrange(1, duration + 1)]
+    return (table, np.array(rows, dtype = np.intp))
+
+
+def _factors(scaled, t):
+    """ scaled: tuple returned by _group_by_profile(); None if no event
+            is scaled
+        t: simulated time
+        returns: vector of the mean factors of the events at t"""
+    if scaled is None: return 1.0
+    table, rows = scaled
+    return table[t][rows]
+
+
+def report(result):
+    """ Prints the statistics as text."""
+    def row(label, s, fmt = '%10.1f'):
+        print('  %-40s' % label[:40] +
+              ''.join(fmt % s[k] for k in ['mean'] +
+                      ['p%d' % q for q in PERCENTILES]))
+
+    header = '  %-40s' % '' + ''.join('%10s' % h for h in
+        ['mean'] + ['p%d' % q for q in PERCENTILES])
+
+    print('\nActivations per event (executions when fanned out):')
+    print(header)
+    for e in result['events']:
+        label = '%s/%s %s' % (e['component'], e['event'], e['fault'])
+        row(label, e['activations'])
+        if e['executions'] != e['activations']:
+            row('  executions', e['executions'])
+
+    print('\nSeconds Nonoperable per component (per member for families):')
+    print(header)
+    for c in result['components']:
+        row('%s (%.1f%%)' % (c['component'],
+                             100 * c['nonoperable_fraction']),
+            c['nonoperable_seconds'])
+
+    print('\nConcurrent Nonoperable components:')
+    c = result['concurrent_nonoperable']
+    print('  over time: ' + '  '.join('p%d %d' % (q, c['p%d' % q])
+                                      for q in PERCENTILES))
+    print(header)
+    row('peak per replication', c['max'])
+    row('peak executions per checkpoint', result['checkpoint_executions_max'])
+
+
+def get_arg_parser():
+    """ returns: an ArgumentParser instance with CLI arguments and help
+            information"""
+    parser = ArgumentParser(
+        description = "Estimate activations and component downtime of a "
+                      "session by Monte Carlo simulation"
+    )
+
+    parser.add_argument(
+        '-n', '--replications', type = int, default = 1000,
+        help = "number of simulated sessions (default: 1000)"
+    )
+
+    parser.add_argument(
+        '-T', '--duration', type = int, default = 3600,
+        help = "simulated session duration in seconds (default: 3600)"
+    )
+
+    parser.add_argument(
+        '-s', '--seed', type = int, default = None,
+        help = "random seed for reproducible results"
+    )
+
+    parser.add_argument(
+        '--json', action = 'store_true', default = False,
+        help = "print the statistics as JSON"
+    )
+
+    parser.add_argument(
+        'session_config_file', metavar = 'FILE',
+        help = "configuration (JSON) file of the session"
+    )
+
+    return parser
+
+
+if __name__ == '__main__':
+    main()
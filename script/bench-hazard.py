@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+#
+# bench-hazard  Checks the inter-arrival times produced by the hazard
+#               models against the distributions they are meant to
+#               follow, and measures their evaluation rate.
+#
+# Each model is driven as a session drives it: an Event is evaluated
+# with Event.is_active once per virtual second (the event module's clock
+# is replaced by a virtual one), and the elapsed time restarts whenever
+# the event is activated.  A model with a 'tick' of n seconds is only
+# evaluated every n seconds, so an arrival at elapsed time t means the
+# event occurred within (t - n, t].  The empirical distribution of the
+# inter-arrival times is compared with the intended continuous
+# distribution at the evaluation times by a one-sample
+# Kolmogorov-Smirnov test (conservative for discrete data).
+#
+#   exponential  exponential with mean mttf
+#   normal       normal with mean mttf and standard_deviation, given
+#                that the event occurs after the previous one
+#   weibull      F(t) = 1 - exp(-(t / mttf) ** shape), the distribution
+#                whose hazard rate is the one weibull_hazard evaluates
+#
+# A case with an intensity factor k scales the hazard rate to k * h(t),
+# so the intended distribution has the cumulative hazard k * H(t).
+#
+# Cases with a time varying intensity profile (see core/intensity.py),
+# and the poisson model, are checked by the number of activations
+# instead: the sum of the evaluated probabilities (or poisson means) is
+# the expected number and the actual number should be within 4 standard
+# deviations of it.
+#
+# Also reported: the fraction of evaluations at which the probability
+# exceeded 1 (the model is saturated and fires on every tick) or was 0
+# after the elapsed time passed mttf (the model is dead and will never
+# fire again), and the evaluation rate of Event.is_active and of the
+# bare hazard function.
+#
+# examples:
+#   bench-hazard.py
+#   bench-hazard.py -n 5000000 --seed 1
+
+import math
+import os
+import random
+import sys
+import timeit
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'core'))
+import event
+import intensity
+from sessionconfig import ModelType
+from sessionconfig import SessionConfig
+import stochastic
+
+# (p_model, mttf, standard_deviation, shape, tick, intensity) of each
+# benchmarked case.
+CASES = [
+    (SessionConfig.EVENT_PMOD_EXP, 10, 1, 1, 1, 1),
+    (SessionConfig.EVENT_PMOD_EXP, 10, 1, 1, 5, 1),
+    (SessionConfig.EVENT_PMOD_EXP, 100, 1, 1, 1, 1),
+    (SessionConfig.EVENT_PMOD_EXP, 100, 1, 1, 1, 10),
+    (SessionConfig.EVENT_PMOD_NORM, 100, 10, 1, 1, 1),
+    (SessionConfig.EVENT_PMOD_NORM, 100, 30, 1, 1, 1),
+    (SessionConfig.EVENT_PMOD_NORM, 100, 30, 1, 10, 1),
+    (SessionConfig.EVENT_PMOD_NORM, 100, 30, 1, 1, 3),
+    (SessionConfig.EVENT_PMOD_WEI, 100, 1, 0.5, 1, 1),
+    (SessionConfig.EVENT_PMOD_WEI, 100, 1, 1, 1, 1),
+    (SessionConfig.EVENT_PMOD_WEI, 100, 1, 2, 1, 1),
+    (SessionConfig.EVENT_PMOD_WEI, 100, 1, 2, 10, 1),
+    (SessionConfig.EVENT_PMOD_WEI, 100, 1, 2, 10, 5),
+    (SessionConfig.EVENT_PMOD_WEI, 100, 1, 5, 1, 1),
+]
+
+# (p_model, mttf, standard_deviation, shape, tick, intensity) of each
+# case with a time varying intensity profile; None is replaced by the
+# number of virtual ticks.  The rate of a poisson case is 1 / mttf.
+PROFILE_CASES = [
+    (SessionConfig.EVENT_PMOD_EXP, 1000, 1, 1, 1,
+     {'profile': 'ramp', 'from': 1, 'to': 50, 'duration': None}),
+    (SessionConfig.EVENT_PMOD_EXP, 1000, 1, 1, 7,
+     {'profile': 'sine', 'base': 10, 'amplitude': 10, 'period': 3600}),
+    (SessionConfig.EVENT_PMOD_WEI, 100, 1, 2, 5,
+     {'profile': 'step', 'steps': [[0, 0.5], [100000, 4], [150000, 0]]}),
+    (SessionConfig.EVENT_PMOD_POISSON, 0.05, 1, 1, 1,
+     {'profile': 'ramp', 'from': 0, 'to': 10, 'duration': None}),
+]
+
+# Significance level of the goodness-of-fit tests.
+ALPHA = 0.01
+
+
+class _Clock(object):
+    """ Virtual replacement for time.time in the event module."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Config(object):
+    """ Provides a single event model to an Event instance."""
+
+    def __init__(self, model):
+        self._model = model
+
+    def get_model_for_event(self, component_id, event_id):
+        return self._model
+
+    def get_intensity(self):
+        return None
+
+
+def main():
+    args = get_arg_parser().parse_args()
+    random.seed(args.seed)
+    clock = _Clock()
+    event.time = clock
+    intensity.time = clock
+
+    print("%d virtual ticks per model, KS test at alpha %.2f"
+          % (args.ticks, ALPHA))
+    print("%-36s %8s %8s %8s %7s %8s %4s %7s %7s %8s %8s"
+          % ('model', 'arrivals', 'mean', 'expected', 'KS D', 'p-value',
+             'fit', 'p>1', 'dead', 'active/s', 'hazard/s'))
+
+    failed = 0
+    for p_model, mttf, sd, shape, tick, k in CASES:
+        clock.now = 0.0
+        profile = intensity.create_profile(k) if k != 1 else None
+        e = event.Event('0', None, '0',
+                        _Config(_model(p_model, mttf, sd, shape, tick,
+                                       profile)))
+        name = describe(p_model, mttf, sd, shape, tick, k)
+
+        samples, saturated, dead = drive(e, clock, args.ticks, p_model,
+                                         mttf, sd, shape, tick, k)
+
+        cdf, mean = intended(p_model, mttf, sd, shape, k)
+        d, p = ks_test(samples, cdf)
+        fit = p >= ALPHA and not dead # a dead model stops producing
+                                      # arrivals, whatever their fit
+        if not fit: failed += 1
+        print("%-36s %8d %8.2f %8.2f %7.4f %8.2g %4s %6.2f%% %6.2f%% "
+              "%8.0f %8.0f"
+              % (name, len(samples), _mean(samples), mean, d, p,
+                 'ok' if fit else 'FAIL', 100.0 * saturated / args.ticks,
+                 100.0 * dead / args.ticks,
+                 active_rate(e, clock),
+                 hazard_rate(p_model, mttf, sd, shape, tick)))
+
+    print("")
+    print("%-32s %-36s %8s %10s %7s %4s %8s"
+          % ('model', 'intensity', 'arrivals', 'expected', 'z', 'fit',
+             'active/s'))
+    for p_model, mttf, sd, shape, tick, spec in PROFILE_CASES:
+        if spec.get('duration', 0) is None:
+            spec = dict(spec, duration = args.ticks)
+        clock.now = 0.0
+        profile = intensity.create_profile(spec)
+        e = event.Event('0', None, '0',
+                        _Config(_model(p_model, mttf, sd, shape, tick,
+                                       profile)))
+        drive(e, clock, args.ticks, p_model, mttf, sd, shape, tick, None,
+              profile)
+        rates = profile.snapshot()
+        expected, arrivals = rates['expected'], rates['activated']
+        z = (arrivals - expected) / math.sqrt(max(expected, 1e-9))
+        fit = abs(z) <= 4
+        if not fit: failed += 1
+        print("%-32s %-36s %8d %10.1f %7.2f %4s %8.0f"
+              % (describe(p_model, mttf, sd, shape, tick, 1),
+                 profile.describe(), arrivals, expected, z,
+                 'ok' if fit else 'FAIL', active_rate(e, clock)))
+
+    sys.exit(1 if failed else 0)
+
+
+def _model(p_model, mttf, sd, shape, tick, profile):
+    """ profile: IntensityProfile of the event or None
+        returns: a recurring ModelType with the probability model"""
+    return ModelType(fault = 'bench', state_trans = False,
+                     a_model = SessionConfig.EVENT_AMOD_RECUR,
+                     p_model = p_model, mttf = mttf, thrld = 0, eff_s = -1,
+                     eff_e = -1, sd = sd, shape = shape, r_range = 1,
+                     r_w_type = SessionConfig.EVENT_RAND_FIXED, udf1 = '',
+                     udf2 = '', udf3 = '', udd = None,
+                     coalesce = SessionConfig.EVENT_COAL_ALWAYS,
+                     fan_out = 1, tick = tick, intensity = profile,
+                     rate = 1.0 / mttf, trigger = None)
+
+
+def describe(p_model, mttf, sd, shape, tick, k):
+    """ returns: short description of a case"""
+    if p_model == SessionConfig.EVENT_PMOD_NORM:
+        s = '%s mttf=%g sd=%g' % (p_model, mttf, sd)
+    elif p_model == SessionConfig.EVENT_PMOD_WEI:
+        s = '%s mttf=%g shape=%g' % (p_model, mttf, shape)
+    elif p_model == SessionConfig.EVENT_PMOD_POISSON:
+        s = '%s rate=%g' % (p_model, 1.0 / mttf)
+    else:
+        s = '%s mttf=%g' % (p_model, mttf)
+    return (s + (' tick=%d' % tick if tick != 1 else '') +
+            (' x%g' % k if k != 1 else ''))
+
+
+def drive(e, clock, ticks, p_model, mttf, sd, shape, tick, k,
+          profile = None):
+    """ Evaluates the event once per virtual second, as SystemComponent
+            does.
+        k: constant intensity factor; None with a profile
+        profile: IntensityProfile of the event, advanced every second
+        returns: tuple (list of inter-arrival times, # of evaluations
+            at which the model probability exceeded 1, # of evaluations
+            at which it was 0 after mttf)"""
+    samples = []
+    saturated = dead = 0
+    last = 0.0
+    for t in xrange(1, ticks + 1):
+        clock.now = float(t)
+        if profile:
+            profile.update()
+        else:
+            p = probability(p_model, mttf, sd, shape, t - last, tick, k)
+            if p > 1:
+                saturated += 1
+            elif p == 0 and t - last > mttf:
+                dead += 1
+        if e.is_active(last):
+            samples.append(t - last)
+            last = clock.now
+    return samples, saturated, dead
+
+
+def probability(p_model, mttf, sd, shape, t, dt, k):
+    """ returns: probability evaluated by the model's hazard function"""
+    if p_model == SessionConfig.EVENT_PMOD_EXP:
+        return stochastic.exponential_probability(mttf, dt, k)
+    if p_model == SessionConfig.EVENT_PMOD_NORM:
+        return stochastic.normal_probability(mttf, sd, t, dt, k)
+    return stochastic.weibull_probability(shape, mttf, t, dt, k)
+
+
+def intended(p_model, mttf, sd, shape, k):
+    """ returns: tuple (cdf function, mean) of the intended inter-arrival
+            distribution, with the cumulative hazard scaled by k"""
+    if p_model == SessionConfig.EVENT_PMOD_EXP:
+        return (lambda t: 1 - math.exp(-k * t / float(mttf))), mttf / float(k)
+    if p_model == SessionConfig.EVENT_PMOD_NORM:
+        phi = lambda t: 0.5 * (1 + math.erf((t - mttf) / (sd * math.sqrt(2))))
+        r = lambda t: ((1 - phi(t)) / (1 - phi(0))) ** k
+        # Mean of the scaled distribution, integrating R(t) numerically.
+        mean = sum(r(t + 0.5) for t in xrange(int(mttf + 10 * sd)))
+        return (lambda t: 1 - r(t)), mean
+    return ((lambda t: 1 - math.exp(-k * (t / float(mttf)) ** shape)),
+            mttf * k ** (-1.0 / shape) * math.gamma(1 + 1.0 / shape))
+
+
+def ks_test(samples, cdf):
+    """ One-sample Kolmogorov-Smirnov test of inter-arrival times which
+            are only observed at the evaluation times.  The empirical
+            distribution is compared with the intended one at each
+            observed time.
+        returns: tuple (D statistic, asymptotic p-value)"""
+    x = sorted(samples)
+    n = len(x)
+    if not n: return 1.0, 0.0
+    d = 0.0
+    for i, v in enumerate(x):
+        if i + 1 < n and x[i + 1] == v: continue # last of equal times
+        d = max(d, abs((i + 1.0) / n - cdf(v)))
+    return d, _kolmogorov_p(d, n)
+
+
+def _kolmogorov_p(d, n):
+    """ returns: asymptotic p-value of the KS statistic d for n samples
+            (Stephens' small sample correction)"""
+    sqrt_n = math.sqrt(n)
+    l = (sqrt_n + 0.12 + 0.11 / sqrt_n) * d
+    if l < 0.2: return 1.0
+    p = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * l * l)
+                for k in range(1, 101))
+    return min(max(p, 0.0), 1.0)
+
+
+def active_rate(e, clock):
+    """ returns: evaluations per second of Event.is_active"""
+    last = clock.now - 73.0
+    n = 200000
+    return n / timeit.timeit(lambda: e.is_active(last), number = n)
+
+
+def hazard_rate(p_model, mttf, sd, shape, tick):
+    """ returns: evaluations per second of the bare hazard function"""
+    if p_model == SessionConfig.EVENT_PMOD_EXP:
+        f = lambda: stochastic.exponential_hazard(mttf, tick)
+    elif p_model == SessionConfig.EVENT_PMOD_NORM:
+        f = lambda: stochastic.normal_hazard(mttf, sd, 73.0, tick)
+    else:
+        f = lambda: stochastic.weibull_hazard(shape, mttf, 73.0, tick)
+    n = 200000
+    return n / timeit.timeit(f, number = n)
+
+
+def _mean(values):
+    return sum(values) / float(len(values)) if values else float('nan')
+
+
+def get_arg_parser():
+    """ returns: an ArgumentParser instance with CLI arguments and help
+            information"""
+    parser = ArgumentParser(
+        description = "Check hazard model inter-arrival distributions and "
+                      "evaluation rates"
+    )
+
+    parser.add_argument(
+        '-n', '--ticks', type = int, default = 2000000,
+        help = "virtual ticks (seconds) per model (default: 2000000)"
+    )
+
+    parser.add_argument(
+        '-s', '--seed', type = int, default = None,
+        help = "random seed for reproducible results"
+    )
+
+    return parser
+
+
+if __name__ == '__main__':
+    main()
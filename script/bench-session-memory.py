@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# bench-session-memory  Measures the memory used to load a large session.
+#
+# A session file with many components is generated and loaded into a
+# SystemUnderTest by a separate process.  That process reports its peak
+# RSS (high water mark while loading) and its steady-state RSS (after
+# loading, with the SystemUnderTest still referenced).
+
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+CORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'core')
+
+
+def main():
+    args = get_arg_parser().parse_args()
+
+    if args.load:
+        load(args.load)
+        return
+
+    fd, path = tempfile.mkstemp(suffix = '.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            generate(f, args.components)
+        print("%d components, %.1f MB session file"
+              % (args.components, os.path.getsize(path) / 1e6))
+        subprocess.check_call([sys.executable, os.path.abspath(__file__),
+                               '--load', path])
+    finally:
+        os.remove(path)
+
+
+def generate(f, n):
+    """ Writes a session with n components, each with one target, two
+        operable events and one nonoperable event."""
+    f.write('{"system_name":"Memory benchmark","fault_module":"tutorial",'
+            '"components":[')
+    for i in range(n):
+        if i: f.write(',')
+        json.dump({
+            'id': str(i),
+            'targets': ['vm%d' % i],
+            'active': True,
+            'operable_events': [
+                {'id': '0', 'fault': 'tranquilize', 'state_transition': True,
+                 'a_model': 'recurring', 'p_model': 'exponential',
+                 'mttf': 3600},
+                {'id': '1', 'fault': 'electric_shock', 'a_model': 'singular',
+                 'p_model': 'random', 'random_range': 600, 'threshold': 60,
+                 'udd': {'volts': 220}}
+            ],
+            'nonoperable_events': [
+                {'id': '2', 'fault': 'revive', 'state_transition': True,
+                 'a_model': 'recurring', 'p_model': 'normal', 'mttf': 300,
+                 'standard_deviation': 60}
+            ]
+        }, f)
+    f.write(']}')
+
+
+def load(path):
+    """ Loads the session and prints memory statistics."""
+    sys.path.insert(0, CORE)
+    from systemundertest import SystemUnderTest
+
+    start = time.time()
+    sut = SystemUnderTest(path)
+    elapsed = time.time() - start
+    gc.collect()
+
+    # ru_maxrss is in kilobytes on Linux.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print("load time: %.1fs  peak RSS: %.1f MB  steady-state RSS: %.1f MB"
+          % (elapsed, peak, rss()))
+    return sut
+
+
+def rss():
+    """ returns: current resident set size (MB)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def get_arg_parser():
+    """ returns: an ArgumentParser instance with CLI arguments and help
+            information"""
+    parser = ArgumentParser(
+        description = "Measure memory used to load a large session"
+    )
+
+    parser.add_argument(
+        '-n', '--components', type = int, default = 100000,
+        help = "number of components in the generated session"
+    )
+
+    parser.add_argument(
+        '--load', metavar = 'FILE',
+        help = "load FILE and report memory (used internally)"
+    )
+
+    return parser
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#
+# bench-signal  Compares signal delivery through pkill subprocess calls
+#               with the native procsignal fault module.
+#
+# Many local dummy processes are started so that /proc is populated as
+# on a busy host.  Each round signals one of them (signal 0 by default,
+# which checks delivery without killing) through both paths and the
+# per-call latencies are reported.
+
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'event'))
+import procsignal
+
+MARKER = 'dtest-bench-signal'
+
+
+def main():
+    args = get_arg_parser().parse_args()
+
+    procs = [subprocess.Popen(['bash', '-c', 'exec -a %s-%d sleep 3600'
+                                             % (MARKER, i)])
+             for i in range(args.processes)]
+    time.sleep(0.5) # let every dummy process exec
+
+    try:
+        patterns = ['^%s-%d( |$)' % (MARKER, i % args.processes)
+                    for i in range(args.rounds)]
+
+        pkill = []
+        for p in patterns:
+            start = time.time()
+            subprocess.call(['pkill', '-%d' % args.signal, '-f', p])
+            pkill.append(time.time() - start)
+
+        native = []
+        hits = 0
+        for p in patterns:
+            start = time.time()
+            hits += len(procsignal.signal_matching(p, args.signal))
+            native.append(time.time() - start)
+
+        print("%d dummy processes, %d rounds, signal %d (%d native hits)"
+              % (args.processes, args.rounds, args.signal, hits))
+        report('pkill', pkill)
+        report('os.kill', native)
+    finally:
+        for p in procs: p.kill()
+        for p in procs: p.wait()
+
+
+def report(name, latencies):
+    """ Prints latency statistics (milliseconds) for a signalling path."""
+    latencies = sorted(latencies)
+    n = len(latencies)
+    print("%-8s mean:%8.3fms p50:%8.3fms p99:%8.3fms max:%8.3fms "
+          "(%.0f signals/s)" % (
+              name, 1e3 * sum(latencies) / n, 1e3 * latencies[n // 2],
+              1e3 * latencies[min(int(n * 0.99), n - 1)], 1e3 * latencies[-1],
+              n / sum(latencies)))
+
+
+def get_arg_parser():
+    """ returns: an ArgumentParser instance with CLI arguments and help
+            information"""
+    parser = ArgumentParser(
+        description = "Benchmark pkill versus native signal delivery"
+    )
+
+    parser.add_argument(
+        '-p', '--processes', type = int, default = 500,
+        help = "number of dummy processes"
+    )
+
+    parser.add_argument(
+        '-n', '--rounds', type = int, default = 200,
+        help = "number of signals sent through each path"
+    )
+
+    parser.add_argument(
+        '-s', '--signal', type = int, default = 0,
+        help = "signal number (0 checks delivery without killing)"
+    )
+
+    return parser
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# dtest-ctl  Sends commands to the control socket of a running
+#            dtest-controller (see dtest-controller.py --control).
+#
+# Each command given at the CLI is sent as one request and its JSON
+# response is printed.  With no command, requests are read from
+# standard input, one per line.
+#
+# examples:
+#   dtest-ctl.py /tmp/dtest.sock list
+#   dtest-ctl.py /tmp/dtest.sock 'pause 0' 'components 0'
+#   dtest-ctl.py /tmp/dtest.sock 'inject 0 revive vm7 {"udd": {"reason": "test"}}'
+#   dtest-ctl.py /tmp/dtest.sock 'member 0 {"op": "remove", "id": "vm7"}'
+
+import json
+import socket
+import sys
+from argparse import ArgumentParser
+
+
+def main():
+    args = get_arg_parser().parse_args()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(args.socket)
+    except socket.error as err:
+        sys.stderr.write("dtest-ctl.py: error: %s- %s\n"
+                         % (err.strerror, args.socket))
+        sys.exit(2)
+    stream = sock.makefile('rw')
+
+    commands = args.command or (l.strip() for l in sys.stdin)
+    ok = True
+    for command in commands:
+        if not command: continue
+        stream.write(command + '\n')
+        stream.flush()
+        response = json.loads(stream.readline())
+        ok = ok and response['ok']
+        if args.raw:
+            print(json.dumps(response))
+        elif response['ok']:
+            result = response['result']
+            print(result if isinstance(result, basestring)
+                  else json.dumps(result, indent = 2, sort_keys = True))
+        else:
+            sys.stderr.write("error: %s\n" % response['error'])
+
+    sock.close()
+    sys.exit(0 if ok else 1)
+
+
+def get_arg_parser():
+    """ returns: an ArgumentParser instance with CLI arguments and help
+            information"""
+    parser = ArgumentParser(
+        description = "Send commands to a dtest-controller control socket"
+    )
+
+    parser.add_argument(
+        '-r', '--raw', action = 'store_true', default = False,
+        help = "print each response as a single line of JSON"
+    )
+
+    parser.add_argument(
+        'socket', metavar = 'PATH', help = "control socket path"
+    )
+
+    parser.add_argument(
+        'command', nargs = '*',
+        help = "command and arguments, quoted (default: read standard input)"
+    )
+
+    return parser
+
+
+if __name__ == '__main__':
+    main()
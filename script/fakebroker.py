@@ -0,0 +1,1029 @@
+#!/usr/bin/env python
+#
+# fakebroker  A stand-in AMQP 0-9-1 broker for benchmarking and testing
+#             the rabbitmq fault module and scripts without RabbitMQ.
+#
+# It implements the subset of the protocol used by pika's
+# BlockingConnection for topic, direct and fanout exchanges:
+#
+#   connection   start/tune/open (PLAIN, any user and password, any
+#                virtual host), close
+#   channel      open, close, flow
+#   exchange     declare (also passive), delete
+#   queue        declare (also passive and server named), bind, unbind,
+#                purge, delete
+#   basic        qos (prefetch count, per channel), consume, cancel,
+#                publish, get, ack, nack, reject, recover
+#   confirm      select (every publish is confirmed at once)
+#
+# Messages are only kept in memory, heartbeats are not negotiated and
+# nothing is persisted.  A single thread serves every connection with
+# select(), so the broker is cheap enough to run in the same process as
+# the client being measured (see FakeBroker), or standalone:
+#
+#   fakebroker.py -p 5672
+#
+# The broker counts published, routed, delivered and acknowledged
+# messages and records the latency from publish to delivery and from
+# publish to acknowledgement of each message.
+
+import collections
+import errno
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+from argparse import ArgumentParser
+from array import array
+
+PROTOCOL_HEADER = 'AMQP\x00\x00\x09\x01'
+
+# Largest frame offered to clients.
+FRAME_MAX = 131072
+
+# Largest number of routing keys whose matching queues are cached per
+# exchange.
+ROUTE_CACHE_SIZE = 10000
+
+# Seconds select() waits before checking for stop().
+_POLL_INTERVAL = 0.1
+
+_FRAME_METHOD = 1
+_FRAME_HEADER = 2
+_FRAME_BODY = 3
+_FRAME_HEARTBEAT = 8
+_FRAME_END = '\xce'
+
+# Reply codes
+_REPLY_SUCCESS = 200
+_NOT_FOUND = 404
+_RESOURCE_LOCKED = 405
+_PRECONDITION_FAILED = 406
+_COMMAND_INVALID = 503
+_CHANNEL_ERROR = 504
+_NOT_IMPLEMENTED = 540
+
+_EXCHANGE_TYPES = ('direct', 'fanout', 'topic')
+
+
+class FakeBroker(threading.Thread):
+
+    def __init__(self, host = '127.0.0.1', port = 0):
+        """ Create FakeBroker object.  The broker listens at once and
+                serves clients once the thread is started.
+            host: address to listen on
+            port: TCP port; 0 for any free port"""
+        threading.Thread.__init__(self, name = "fakebroker")
+        self.daemon = True
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(128)
+        self._listener.setblocking(False)
+        self._host, self._port = self._listener.getsockname()
+        self._done = False
+
+        self._connections = {} # socket -> _Connection
+        self._exchanges = {} # (vhost, name) -> _Exchange
+        self._queues = {} # (vhost, name) -> _Queue
+        self._queue_names = 0 # number of server named queues
+        self.reset_stats()
+
+
+    def get_url(self, vhost = '/'):
+        """ vhost: virtual host
+            returns: AMQP URL of the broker for pika.URLParameters"""
+        return "amqp://guest:guest@%s:%d/%s" % (
+            self._host, self._port, vhost.replace('/', '%2F'))
+
+
+    def get_port(self):
+        """ returns: TCP port the broker listens on"""
+        return self._port
+
+
+    def reset_stats(self):
+        """ Clears the counters and latencies."""
+        self._published = 0
+        self._unroutable = 0
+        self._delivered = 0
+        self._acked = 0
+        self._requeued = 0
+        self._deliver_latency = array('d') # publish to delivery
+        self._ack_latency = array('d') # publish to acknowledgement
+
+
+    def get_stats(self):
+        """ returns: dictionary of counters (number of messages, bindings
+                and connections) and latencies (arrays of seconds)"""
+        return {
+            'published': self._published,
+            'unroutable': self._unroutable,
+            'delivered': self._delivered,
+            'acked': self._acked,
+            'requeued': self._requeued,
+            'queued': sum(len(q.messages) for q in self._queues.values()),
+            'bindings': sum(len(e.bindings) for e in self._exchanges.values()),
+            'consumers': sum(len(q.consumers) for q in self._queues.values()),
+            'connections': len(self._connections),
+            'deliver_latency': self._deliver_latency,
+            'ack_latency': self._ack_latency
+        }
+
+
+    def stop(self):
+        """ Closes every connection and the listening socket; returns
+            once the thread has exited."""
+        self._done = True
+        if self.is_alive(): self.join()
+
+
+    def run(self):
+        """ Entry point for threading.Thread (broker thread)"""
+        try:
+            while not self._done:
+                readers = [self._listener] + self._connections.keys()
+                writers = [s for s, c in self._connections.items() if c.out]
+                readable, writable, _ = select.select(readers, writers, [],
+                                                      _POLL_INTERVAL)
+                for s in readable:
+                    if s is self._listener:
+                        self._accept()
+                    elif s in self._connections:
+                        self._connections[s].receive()
+                for s in writable:
+                    if s in self._connections:
+                        self._connections[s].send()
+        finally:
+            for c in self._connections.values(): c.close()
+            self._listener.close()
+
+
+    def _accept(self):
+        try:
+            s, _ = self._listener.accept()
+        except socket.error:
+            return
+        s.setblocking(False)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._connections[s] = _Connection(self, s)
+
+
+    def _remove_connection(self, connection):
+        self._connections.pop(connection.socket, None)
+        for key, q in self._queues.items():
+            if q.owner is connection: self._delete_queue(key)
+
+
+    def _declare_exchange(self, vhost, name, type_, passive):
+        """ returns: reply code; _REPLY_SUCCESS if declared"""
+        if not name: return _REPLY_SUCCESS # the default exchange
+        e = self._exchanges.get((vhost, name))
+        if e is None:
+            if passive: return _NOT_FOUND
+            if type_ not in _EXCHANGE_TYPES: return _COMMAND_INVALID
+            self._exchanges[(vhost, name)] = _Exchange(type_)
+        elif not passive and e.type != type_:
+            return _PRECONDITION_FAILED
+        return _REPLY_SUCCESS
+
+
+    def _declare_queue(self, connection, name, passive, exclusive,
+                       auto_delete):
+        """ returns: tuple (reply code, _Queue instance or None)"""
+        vhost = connection.vhost
+        if not name and not passive:
+            self._queue_names += 1
+            name = 'amq.gen-%d' % self._queue_names
+        q = self._queues.get((vhost, name))
+        if q is None:
+            if passive: return _NOT_FOUND, None
+            q = self._queues[(vhost, name)] = _Queue(
+                name, connection if exclusive else None, auto_delete)
+        elif q.owner is not None and q.owner is not connection:
+            return _RESOURCE_LOCKED, None
+        return _REPLY_SUCCESS, q
+
+
+    def _get_queue(self, connection, name):
+        """ returns: tuple (reply code, _Queue instance or None)"""
+        q = self._queues.get((connection.vhost, name))
+        if q is None: return _NOT_FOUND, None
+        if q.owner is not None and q.owner is not connection:
+            return _RESOURCE_LOCKED, None
+        return _REPLY_SUCCESS, q
+
+
+    def _delete_queue(self, key):
+        q = self._queues.pop(key)
+        for e in self._exchanges.values(): e.unbind_queue(q)
+        for c in list(q.consumers):
+            c.channel.consumers.pop(c.tag, None)
+        del q.consumers[:]
+        return len(q.messages)
+
+
+    def _publish(self, vhost, exchange, routing_key, header, body):
+        """ Routes a message to the queues bound to the exchange."""
+        self._published += 1
+        if exchange:
+            e = self._exchanges.get((vhost, exchange))
+            queues = e.route(routing_key) if e else ()
+        else:
+            q = self._queues.get((vhost, routing_key))
+            queues = (q,) if q else ()
+        if not queues:
+            self._unroutable += 1
+            return
+        now = time.time()
+        for q in queues:
+            q.messages.append(_Message(exchange, routing_key, header, body,
+                                       now))
+            self._dispatch(q)
+
+
+    def _dispatch(self, q):
+        """ Delivers queued messages to the queue's consumers in turn,
+                as far as their channels' prefetch counts allow."""
+        consumers = q.consumers
+        while q.messages and consumers:
+            n = len(consumers)
+            for i in xrange(n):
+                c = consumers[(q.next_consumer + i) % n]
+                if c.channel.has_capacity():
+                    q.next_consumer = (q.next_consumer + i + 1) % n
+                    c.channel.deliver(c, q, q.messages.popleft())
+                    break
+            else:
+                return
+
+
+    def _record_delivery(self, message):
+        self._delivered += 1
+        self._deliver_latency.append(time.time() - message.published)
+
+
+    def _record_ack(self, message):
+        self._acked += 1
+        self._ack_latency.append(time.time() - message.published)
+
+
+    def _requeue(self, q, messages):
+        """ Returns unacknowledged messages to the front of their queue."""
+        for m in reversed(messages):
+            m.redelivered = True
+            q.messages.appendleft(m)
+        self._requeued += len(messages)
+        if (q.owner is None or q.owner.socket in self._connections):
+            self._dispatch(q)
+
+
+class _Message(object):
+
+    __slots__ = ('exchange', 'routing_key', 'header', 'body', 'published',
+                 'redelivered')
+
+    def __init__(self, exchange, routing_key, header, body, published):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.header = header # content header frame payload
+        self.body = body
+        self.published = published # time of publication
+        self.redelivered = False
+
+
+class _Queue(object):
+
+    __slots__ = ('name', 'owner', 'auto_delete', 'messages', 'consumers',
+                 'next_consumer')
+
+    def __init__(self, name, owner, auto_delete):
+        self.name = name
+        self.owner = owner # _Connection of an exclusive queue
+        self.auto_delete = auto_delete
+        self.messages = collections.deque()
+        self.consumers = [] # _Consumer instances
+        self.next_consumer = 0 # index of the next consumer served
+
+
+class _Consumer(object):
+
+    __slots__ = ('channel', 'tag', 'queue', 'no_ack')
+
+    def __init__(self, channel, tag, queue, no_ack):
+        self.channel = channel
+        self.tag = tag
+        self.queue = queue
+        self.no_ack = no_ack
+
+
+class _Exchange(object):
+    """ Bindings of an exchange and a cache of the queues matched by
+        each routing key."""
+
+    __slots__ = ('type', 'bindings', '_routes')
+
+    def __init__(self, type_):
+        self.type = type_
+        self.bindings = set() # (binding key, _Queue)
+        self._routes = {} # routing key -> tuple of _Queue instances
+
+
+    def bind(self, key, q):
+        self.bindings.add((key, q))
+        self._routes.clear()
+
+
+    def unbind(self, key, q):
+        self.bindings.discard((key, q))
+        self._routes.clear()
+
+
+    def unbind_queue(self, q):
+        self.bindings = set(b for b in self.bindings if b[1] is not q)
+        self._routes.clear()
+
+
+    def route(self, routing_key):
+        """ returns: tuple of the queues bound to the routing key"""
+        queues = self._routes.get(routing_key)
+        if queues is None:
+            if self.type == 'fanout':
+                match = lambda key: True
+            elif self.type == 'direct':
+                match = lambda key: key == routing_key
+            else:
+                words = routing_key.split('.')
+                match = lambda key: topic_matches(key.split('.'), words)
+            queues = tuple(set(q for key, q in self.bindings if match(key)))
+            if len(self._routes) >= ROUTE_CACHE_SIZE: self._routes.clear()
+            self._routes[routing_key] = queues
+        return queues
+
+
+def topic_matches(pattern, words):
+    """ pattern: words of a binding key, where '*' matches exactly one
+            word and '#' matches zero or more words
+        words: words of a routing key
+        returns: true if the routing key matches the binding key"""
+    positions = set([0]) # numbers of routing key words matched so far
+    for p in pattern:
+        if p == '#':
+            positions = set(xrange(min(positions), len(words) + 1))
+        else:
+            positions = set(i + 1 for i in positions
+                            if i < len(words) and (p == '*' or
+                                                   words[i] == p))
+            if not positions: return False
+    return len(words) in positions
+
+
+class _Channel(object):
+
+    __slots__ = ('connection', 'id', 'prefetch', 'consumers', 'unacked',
+                 'next_tag', 'confirm', 'publish_tag', 'content', 'flow')
+
+    def __init__(self, connection, channel_id):
+        self.connection = connection
+        self.id = channel_id
+        self.prefetch = 0 # unacknowledged deliveries allowed; 0: no limit
+        self.consumers = {} # consumer tag -> _Consumer
+        # Maps delivery tag to (_Message, _Queue), in delivery order.
+        self.unacked = collections.OrderedDict()
+        self.next_tag = 1
+        self.confirm = False # publisher confirms selected
+        self.publish_tag = 0 # number of publishes confirmed
+        # Publish awaiting its content: [exchange, routing key, content
+        # header payload, body size, list of body frames].
+        self.content = None
+        self.flow = True
+
+
+    def has_capacity(self):
+        return self.flow and (not self.prefetch or
+                              len(self.unacked) < self.prefetch)
+
+
+    def deliver(self, consumer, q, message):
+        tag = self.next_tag
+        self.next_tag += 1
+        self.connection.send_message(
+            self.id, 60, 60,
+            _shortstr(consumer.tag) + struct.pack('>QB', tag,
+                                                  message.redelivered) +
+            _shortstr(message.exchange) + _shortstr(message.routing_key),
+            message)
+        broker = self.connection.broker
+        broker._record_delivery(message)
+        if consumer.no_ack:
+            broker._record_ack(message)
+        else:
+            self.unacked[tag] = (message, q)
+
+
+    def take_unacked(self, tag, multiple):
+        """ returns: list of (_Message, _Queue) removed from the
+                unacknowledged deliveries; None for an unknown tag"""
+        if not multiple:
+            entry = self.unacked.pop(tag, None)
+            return [entry] if entry else None
+        if not tag: tag = self.next_tag # 0 with multiple: everything
+        taken = []
+        while self.unacked:
+            first = next(iter(self.unacked))
+            if first > tag: break
+            taken.append(self.unacked.pop(first))
+        return taken
+
+
+    def release(self, requeue):
+        """ Cancels the channel's consumers and releases its
+                unacknowledged deliveries."""
+        broker = self.connection.broker
+        for c in self.consumers.values():
+            if c in c.queue.consumers: c.queue.consumers.remove(c)
+        queues = [c.queue for c in self.consumers.values()]
+        self.consumers.clear()
+        self.connection.settle(self, self.unacked.values(), requeue)
+        self.unacked.clear()
+        for q in queues: self.connection.consumer_removed(q)
+
+
+class _Connection(object):
+    """ The protocol state of one client connection."""
+
+    def __init__(self, broker, s):
+        self.broker = broker
+        self.socket = s
+        self.vhost = '/'
+        self.out = [] # frames not yet sent
+        self._in = ''
+        self._started = False # protocol header received
+        self._frame_max = FRAME_MAX
+        self._channels = {} # channel id -> _Channel
+        self._closing = False # Connection.Close sent or received
+
+
+    # I/O
+
+    def receive(self):
+        try:
+            data = self.socket.recv(262144)
+        except socket.error:
+            data = ''
+        if not data:
+            self.close()
+            return
+
+        buf = self._in + data
+        offset = 0
+        if not self._started:
+            if len(buf) < 8:
+                self._in = buf
+                return
+            if buf[:8] != PROTOCOL_HEADER:
+                self.socket.send(PROTOCOL_HEADER)
+                self.close()
+                return
+            self._started = True
+            offset = 8
+            self._send_start()
+
+        end = len(buf)
+        while end - offset >= 8:
+            type_, channel, size = struct.unpack_from('>BHI', buf, offset)
+            if end - offset < size + 8: break
+            payload = buf[offset + 7:offset + 7 + size]
+            if buf[offset + 7 + size] != _FRAME_END:
+                self.close()
+                return
+            offset += size + 8
+            self._frame(type_, channel, payload)
+            if self.socket is None: return
+        self._in = buf[offset:]
+        self.send()
+
+
+    def send(self):
+        if not self.out or self.socket is None: return
+        data = ''.join(self.out)
+        try:
+            sent = self.socket.send(data)
+        except socket.error as err:
+            if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                sent = 0
+            else:
+                self.close()
+                return
+        self.out = [data[sent:]] if sent < len(data) else []
+        if not self.out and self._closing == 'flush': self.close()
+
+
+    def close(self):
+        """ Releases the connection's channels and closes its socket."""
+        if self.socket is None: return
+        for ch in self._channels.values(): ch.release(True)
+        self._channels.clear()
+        self.broker._remove_connection(self)
+        try:
+            self.socket.close()
+        except socket.error:
+            pass
+        self.socket = None
+
+
+    def send_method(self, channel, class_id, method_id, args = ''):
+        payload = struct.pack('>HH', class_id, method_id) + args
+        self.out.append(struct.pack('>BHI', _FRAME_METHOD, channel,
+                                    len(payload)) + payload + _FRAME_END)
+
+
+    def send_message(self, channel, class_id, method_id, args, message):
+        """ Sends a method followed by the content of a message."""
+        self.send_method(channel, class_id, method_id, args)
+        self.out.append(struct.pack('>BHI', _FRAME_HEADER, channel,
+                                    len(message.header)) + message.header +
+                        _FRAME_END)
+        body = message.body
+        step = self._frame_max - 8
+        for i in xrange(0, len(body), step):
+            chunk = body[i:i + step]
+            self.out.append(struct.pack('>BHI', _FRAME_BODY, channel,
+                                        len(chunk)) + chunk + _FRAME_END)
+
+
+    # Protocol
+
+    def _send_start(self):
+        properties = _table({'product': 'dtest fakebroker',
+                             'version': '0.9.1',
+                             'capabilities': {
+                                 'publisher_confirms': True,
+                                 'basic.nack': True,
+                                 'consumer_cancel_notify': True,
+                                 'exchange_exchange_bindings': False}})
+        self.send_method(0, 10, 10, '\x00\x09' + properties +
+                         _longstr('PLAIN AMQPLAIN') + _longstr('en_US'))
+
+
+    def _frame(self, type_, channel_id, payload):
+        if type_ == _FRAME_HEARTBEAT: return
+        if self._closing and not (type_ == _FRAME_METHOD and
+                                  payload[:4] in ('\x00\x0a\x00\x32',
+                                                  '\x00\x0a\x00\x33')):
+            return # only Connection.Close(-Ok) after Connection.Close
+
+        if channel_id == 0:
+            if type_ == _FRAME_METHOD:
+                self._connection_method(_Reader(payload))
+            return
+
+        ch = self._channels.get(channel_id)
+        if type_ == _FRAME_METHOD:
+            r = _Reader(payload)
+            if ch is None:
+                class_id, method_id = r.method()
+                if (class_id, method_id) == (20, 10):
+                    self._channels[channel_id] = _Channel(self, channel_id)
+                    self.send_method(channel_id, 20, 11, _longstr(''))
+                elif (class_id, method_id) != (20, 41):
+                    self._close_connection(_CHANNEL_ERROR,
+                                           "channel %d is not open"
+                                           % channel_id, class_id, method_id)
+                return
+            self._channel_method(ch, r)
+        elif ch is None or ch.content is None:
+            self._close_connection(_COMMAND_INVALID,
+                                   "unexpected content frame", 0, 0)
+        elif type_ == _FRAME_HEADER:
+            ch.content[2] = payload
+            ch.content[3] = struct.unpack_from('>Q', payload, 4)[0]
+            self._content_received(ch)
+        elif type_ == _FRAME_BODY:
+            ch.content[4].append(payload)
+            ch.content[3] -= len(payload)
+            self._content_received(ch)
+
+
+    def _content_received(self, ch):
+        exchange, routing_key, header, remaining, body = ch.content
+        if remaining > 0: return
+        ch.content = None
+        self.broker._publish(self.vhost, exchange, routing_key, header,
+                             ''.join(body))
+        if ch.confirm:
+            ch.publish_tag += 1
+            self.send_method(ch.id, 60, 80, struct.pack('>QB', ch.publish_tag,
+                                                        0))
+
+
+    def _connection_method(self, r):
+        class_id, method_id = r.method()
+        if (class_id, method_id) == (10, 11): # Start-Ok
+            # Any client, mechanism and credentials are accepted.
+            self.send_method(0, 10, 30, struct.pack('>HIH', 2047, FRAME_MAX,
+                                                    0))
+        elif (class_id, method_id) == (10, 31): # Tune-Ok
+            r.short()
+            frame_max = r.long()
+            if frame_max: self._frame_max = min(frame_max, FRAME_MAX)
+        elif (class_id, method_id) == (10, 40): # Open
+            self.vhost = r.shortstr()
+            self.send_method(0, 10, 41, _shortstr(''))
+        elif (class_id, method_id) == (10, 50): # Close
+            self.send_method(0, 10, 51)
+            self._closing = 'flush'
+        elif (class_id, method_id) == (10, 51): # Close-Ok
+            self._closing = 'flush'
+            if not self.out: self.close()
+        else:
+            self._close_connection(_NOT_IMPLEMENTED, "method %d.%d is not "
+                                   "supported" % (class_id, method_id),
+                                   class_id, method_id)
+
+
+    def _close_connection(self, code, text, class_id, method_id):
+        logging.debug("fakebroker: closing connection- %d %s"
+                      % (code, text))
+        self.send_method(0, 10, 50, struct.pack('>H', code) +
+                         _shortstr(text) +
+                         struct.pack('>HH', class_id, method_id))
+        self._closing = True
+
+
+    def _close_channel(self, ch, code, text, class_id, method_id):
+        logging.debug("fakebroker: closing channel %d- %d %s"
+                      % (ch.id, code, text))
+        ch.release(True)
+        del self._channels[ch.id]
+        self.send_method(ch.id, 20, 40, struct.pack('>H', code) +
+                         _shortstr(text) +
+                         struct.pack('>HH', class_id, method_id))
+
+
+    def settle(self, ch, entries, requeue):
+        """ Acknowledges (requeue false) or requeues delivered messages.
+            entries: list of (_Message, _Queue) tuples"""
+        broker = self.broker
+        if not requeue:
+            for message, _ in entries: broker._record_ack(message)
+            return
+        by_queue = collections.OrderedDict()
+        for message, q in entries:
+            by_queue.setdefault(q, []).append(message)
+        for q, messages in by_queue.items():
+            broker._requeue(q, messages)
+
+
+    def consumer_removed(self, q):
+        """ Deletes an auto-delete queue once its last consumer is gone."""
+        if q.auto_delete and not q.consumers:
+            key = (self.vhost, q.name)
+            if self.broker._queues.get(key) is q:
+                self.broker._delete_queue(key)
+
+
+    def _channel_method(self, ch, r):
+        class_id, method_id = r.method()
+        method = (class_id, method_id)
+        broker = self.broker
+        channel_id = ch.id
+
+        if method == (60, 40): # Basic.Publish
+            r.short()
+            exchange = r.shortstr()
+            routing_key = r.shortstr()
+            if exchange and (self.vhost, exchange) not in broker._exchanges:
+                self._close_channel(ch, _NOT_FOUND, "no exchange '%s'"
+                                    % exchange, class_id, method_id)
+                return
+            ch.content = [exchange, routing_key, None, 0, []]
+
+        elif method == (60, 80): # Basic.Ack
+            tag = r.longlong()
+            entries = ch.take_unacked(tag, r.bits(1)[0])
+            if entries is None:
+                self._close_channel(ch, _PRECONDITION_FAILED,
+                                    "unknown delivery tag %d" % tag,
+                                    class_id, method_id)
+                return
+            self.settle(ch, entries, False)
+            self._dispatch_channel(ch)
+
+        elif method in ((60, 90), (60, 120)): # Basic.Reject, Basic.Nack
+            tag = r.longlong()
+            bits = r.bits(2)
+            multiple, requeue = ((False, bits[0]) if method == (60, 90)
+                                 else bits)
+            entries = ch.take_unacked(tag, multiple)
+            if entries is None:
+                self._close_channel(ch, _PRECONDITION_FAILED,
+                                    "unknown delivery tag %d" % tag,
+                                    class_id, method_id)
+                return
+            self.settle(ch, entries, requeue)
+            self._dispatch_channel(ch)
+
+        elif method == (60, 10): # Basic.Qos
+            r.long()
+            ch.prefetch = r.short()
+            self.send_method(channel_id, 60, 11)
+            self._dispatch_channel(ch)
+
+        elif method == (60, 20): # Basic.Consume
+            r.short()
+            queue = r.shortstr()
+            tag = r.shortstr()
+            no_local, no_ack, exclusive, no_wait = r.bits(4)
+            code, q = broker._get_queue(self, queue)
+            if q is None:
+                self._close_channel(ch, code, "no queue '%s'" % queue,
+                                    class_id, method_id)
+                return
+            if not tag: tag = 'ctag%d.%d' % (channel_id, len(ch.consumers))
+            if tag in ch.consumers:
+                self._close_connection(_COMMAND_INVALID, "consumer tag '%s' "
+                                       "in use" % tag, class_id, method_id)
+                return
+            c = ch.consumers[tag] = _Consumer(ch, tag, q, no_ack)
+            q.consumers.append(c)
+            if not no_wait:
+                self.send_method(channel_id, 60, 21, _shortstr(tag))
+            broker._dispatch(q)
+
+        elif method == (60, 30): # Basic.Cancel
+            tag = r.shortstr()
+            no_wait = r.bits(1)[0]
+            c = ch.consumers.pop(tag, None)
+            if c is not None:
+                c.queue.consumers.remove(c)
+                self.consumer_removed(c.queue)
+            if not no_wait:
+                self.send_method(channel_id, 60, 31, _shortstr(tag))
+
+        elif method == (60, 70): # Basic.Get
+            r.short()
+            queue = r.shortstr()
+            no_ack = r.bits(1)[0]
+            code, q = broker._get_queue(self, queue)
+            if q is None:
+                self._close_channel(ch, code, "no queue '%s'" % queue,
+                                    class_id, method_id)
+            elif not q.messages:
+                self.send_method(channel_id, 60, 72, _shortstr(''))
+            else:
+                message = q.messages.popleft()
+                tag = ch.next_tag
+                ch.next_tag += 1
+                self.send_message(
+                    channel_id, 60, 71,
+                    struct.pack('>QB', tag, message.redelivered) +
+                    _shortstr(message.exchange) +
+                    _shortstr(message.routing_key) +
+                    struct.pack('>I', len(q.messages)), message)
+                broker._record_delivery(message)
+                if no_ack:
+                    broker._record_ack(message)
+                else:
+                    ch.unacked[tag] = (message, q)
+
+        elif method in ((60, 100), (60, 110)): # Basic.Recover(-Async)
+            # Deliveries are always requeued, as RabbitMQ does.
+            entries = ch.unacked.values()
+            ch.unacked.clear()
+            self.settle(ch, entries, True) # redelivered either way
+            if method == (60, 110): self.send_method(channel_id, 60, 111)
+            self._dispatch_channel(ch)
+
+        elif method == (40, 10): # Exchange.Declare
+            r.short()
+            exchange = r.shortstr()
+            type_ = r.shortstr()
+            passive, _, _, _, no_wait = r.bits(5)
+            code = broker._declare_exchange(self.vhost, exchange, type_,
+                                            passive)
+            if code != _REPLY_SUCCESS:
+                self._close_channel(ch, code, "cannot declare exchange '%s' "
+                                    "of type '%s'" % (exchange, type_),
+                                    class_id, method_id)
+            elif not no_wait:
+                self.send_method(channel_id, 40, 11)
+
+        elif method == (40, 20): # Exchange.Delete
+            r.short()
+            exchange = r.shortstr()
+            if_unused, no_wait = r.bits(2)
+            broker._exchanges.pop((self.vhost, exchange), None)
+            if not no_wait: self.send_method(channel_id, 40, 21)
+
+        elif method == (50, 10): # Queue.Declare
+            r.short()
+            queue = r.shortstr()
+            passive, _, exclusive, auto_delete, no_wait = r.bits(5)
+            code, q = broker._declare_queue(self, queue, passive, exclusive,
+                                            auto_delete)
+            if q is None:
+                self._close_channel(ch, code, "cannot declare queue '%s'"
+                                    % queue, class_id, method_id)
+            elif not no_wait:
+                self.send_method(channel_id, 50, 11, _shortstr(q.name) +
+                                 struct.pack('>II', len(q.messages),
+                                             len(q.consumers)))
+
+        elif method in ((50, 20), (50, 50)): # Queue.Bind, Queue.Unbind
+            r.short()
+            queue = r.shortstr()
+            exchange = r.shortstr()
+            key = r.shortstr()
+            no_wait = r.bits(1)[0] if method == (50, 20) else False
+            code, q = broker._get_queue(self, queue)
+            e = broker._exchanges.get((self.vhost, exchange))
+            if q is None or e is None:
+                self._close_channel(ch, code if q is None else _NOT_FOUND,
+                                    "no queue '%s' or exchange '%s'"
+                                    % (queue, exchange), class_id, method_id)
+                return
+            if method == (50, 20):
+                e.bind(key, q)
+                if not no_wait: self.send_method(channel_id, 50, 21)
+            else:
+                e.unbind(key, q)
+                self.send_method(channel_id, 50, 51)
+
+        elif method == (50, 30): # Queue.Purge
+            r.short()
+            queue = r.shortstr()
+            no_wait = r.bits(1)[0]
+            code, q = broker._get_queue(self, queue)
+            if q is None:
+                self._close_channel(ch, code, "no queue '%s'" % queue,
+                                    class_id, method_id)
+                return
+            count = len(q.messages)
+            q.messages.clear()
+            if not no_wait:
+                self.send_method(channel_id, 50, 31, struct.pack('>I', count))
+
+        elif method == (50, 40): # Queue.Delete
+            r.short()
+            queue = r.shortstr()
+            if_unused, if_empty, no_wait = r.bits(3)
+            code, q = broker._get_queue(self, queue)
+            count = (broker._delete_queue((self.vhost, queue))
+                     if q is not None else 0)
+            if not no_wait:
+                self.send_method(channel_id, 50, 41, struct.pack('>I', count))
+
+        elif method == (85, 10): # Confirm.Select
+            no_wait = r.bits(1)[0]
+            ch.confirm = True
+            if not no_wait: self.send_method(channel_id, 85, 11)
+
+        elif method == (20, 20): # Channel.Flow
+            ch.flow = r.bits(1)[0]
+            self.send_method(channel_id, 20, 21, chr(ch.flow))
+            self._dispatch_channel(ch)
+
+        elif method == (20, 40): # Channel.Close
+            ch.release(True)
+            del self._channels[channel_id]
+            self.send_method(channel_id, 20, 41)
+
+        elif method == (20, 41): # Channel.Close-Ok
+            pass
+
+        else:
+            self._close_connection(_NOT_IMPLEMENTED, "method %d.%d is not "
+                                   "supported" % method, class_id, method_id)
+
+
+    def _dispatch_channel(self, ch):
+        """ Delivers to the channel's consumers after it gained capacity."""
+        for q in set(c.queue for c in ch.consumers.values()):
+            self.broker._dispatch(q)
+
+
+class _Reader(object):
+    """ Decodes the fields of a method frame payload in order."""
+
+    __slots__ = ('_data', '_offset')
+
+    def __init__(self, data):
+        self._data = data
+        self._offset = 0
+
+
+    def _unpack(self, fmt, size):
+        value = struct.unpack_from(fmt, self._data, self._offset)[0]
+        self._offset += size
+        return value
+
+
+    def method(self):
+        """ returns: tuple (class id, method id)"""
+        return self.short(), self.short()
+
+
+    def short(self):
+        return self._unpack('>H', 2)
+
+
+    def long(self):
+        return self._unpack('>I', 4)
+
+
+    def longlong(self):
+        return self._unpack('>Q', 8)
+
+
+    def shortstr(self):
+        size = ord(self._data[self._offset])
+        value = self._data[self._offset + 1:self._offset + 1 + size]
+        self._offset += size + 1
+        return value
+
+
+    def bits(self, count):
+        """ returns: list of count booleans packed in one octet"""
+        octet = ord(self._data[self._offset])
+        self._offset += 1
+        return [bool(octet & (1 << i)) for i in range(count)]
+
+
+def _shortstr(value):
+    return chr(len(value)) + value
+
+
+def _longstr(value):
+    return struct.pack('>I', len(value)) + value
+
+
+def _table(fields):
+    """ fields: dictionary of strings, booleans and dictionaries
+        returns: encoded field table"""
+    data = ''
+    for name, value in sorted(fields.items()):
+        if isinstance(value, bool):
+            data += _shortstr(name) + 't' + chr(value)
+        elif isinstance(value, dict):
+            data += _shortstr(name) + 'F' + _table(value)
+        else:
+            data += _shortstr(name) + 'S' + _longstr(value)
+    return _longstr(data)
+
+
+def main():
+    args = get_arg_parser().parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.debug
+                                else logging.INFO)
+
+    broker = FakeBroker(args.bind, args.port)
+    broker.start()
+    logging.info("Listening at %s" % broker.get_url())
+    try:
+        while True:
+            time.sleep(args.interval)
+            stats = broker.get_stats()
+            logging.info("published:%d delivered:%d acked:%d queued:%d "
+                         "unroutable:%d connections:%d"
+                         % (stats['published'], stats['delivered'],
+                            stats['acked'], stats['queued'],
+                            stats['unroutable'], stats['connections']))
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+def get_arg_parser():
+    """ returns: an ArgumentParser instance with CLI arguments and help
+            information"""
+    parser = ArgumentParser(
+        description = "Run an in-memory AMQP 0-9-1 broker for testing"
+    )
+
+    parser.add_argument(
+        '-b', '--bind', default = '127.0.0.1',
+        help = "address to listen on (default: 127.0.0.1)"
+    )
+
+    parser.add_argument(
+        '-p', '--port', type = int, default = 5672,
+        help = "TCP port to listen on (default: 5672)"
+    )
+
+    parser.add_argument(
+        '-i', '--interval', type = float, default = 10,
+        help = "seconds between statistics reports (default: 10)"
+    )
+
+    parser.add_argument(
+        '-d', '--debug', action = 'store_true', default = False,
+        help = "log protocol errors"
+    )
+
+    return parser
+
+
+if __name__ == '__main__':
+    main()